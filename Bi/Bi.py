@@ -17,6 +17,7 @@ class CBi:
         self.__is_sure = is_sure  # 是否是“确定笔”（非虚拟笔）
         self.__sure_end: List[CKLine] = []  # 若是虚拟笔，这里保存过渡过程中真实的结束K线
         self.__seg_idx: Optional[int] = None  # 所属的线段序号
+        self.__version = 0  # 终点每变化一次加一，下游可据此区分“同一笔终点变了”和“新的笔”
 
         from Seg.Seg import CSeg
         self.parent_seg: Optional[CSeg[CBi]] = None  # 所属的线段对象
@@ -75,9 +76,15 @@ class CBi:
     @property
     def seg_idx(self): return self.__seg_idx  # 所属线段的索引
 
+    @property
+    def version(self): return self.__version  # 终点版本号
+
     def set_seg_idx(self, idx):
         self.__seg_idx = idx  # 设置所属线段索引
 
+    def set_idx(self, idx):
+        self.__idx = idx  # 淘汰历史后重新编号
+
     def __str__(self):
         # 打印笔的方向、起止K线
         return f"{self.dir}|{self.begin_klc} ~ {self.end_klc}"
@@ -179,6 +186,16 @@ class CBi:
         self.update_new_end(sure_end)
         self.__sure_end = []
 
+    def renew_virtual_end(self, new_klc: CKLine):
+        # 虚笔删除后又以同一起点重新生成时复用本对象：清空下游挂载的信息，只刷新终点
+        self.__is_sure = False
+        self.__sure_end = []
+        self.__seg_idx = None
+        self.parent_seg = None
+        self.bsp = None
+        self.next = None
+        self.update_new_end(new_klc)
+
     def append_sure_end(self, klc: CKLine):
         # 保存确定结束K线
         self.__sure_end.append(klc)
@@ -186,6 +203,7 @@ class CBi:
     def update_new_end(self, new_klc: CKLine):
         # 更新笔的结束K线
         self.__end_klc = new_klc
+        self.__version += 1
         self.check()
         self.clean_cache()
 
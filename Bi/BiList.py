@@ -1,4 +1,4 @@
-from typing import List, Optional, Union, overload
+from typing import Iterator, List, Optional, Union, overload
 
 from Common.CEnum import FX_TYPE, KLINE_DIR
 from KLine.KLine import CKLine
@@ -15,6 +15,7 @@ class CBiList:
         self.config = bi_conf  # 生成笔的配置
 
         self.free_klc_lst = []  # 初始时用于临时缓存K线（主要用于第一笔未形成前）
+        self.deleted_virtual_bi: Optional[CBi] = None  # 刚被删除的虚笔，重新生成同起点的虚笔时复用
 
     def __str__(self):
         return "\n".join([str(bi) for bi in self.bi_list])
@@ -36,6 +37,27 @@ class CBiList:
         # 返回已构造的笔数量
         return len(self.bi_list)
 
+    def iter_range(self, begin: int, end: Optional[int] = None) -> Iterator[CBi]:
+        # 按下标区间 [begin, end) 遍历笔，不像切片那样复制出新列表
+        bi_list = self.bi_list
+        for idx in range(begin, len(bi_list) if end is None else min(end, len(bi_list))):
+            yield bi_list[idx]
+
+    def retire_head(self, cnt: int):
+        # 淘汰最前面 cnt 笔，剩余的笔从 0 开始重新编号，并断开与被淘汰笔的链接
+        if cnt <= 0:
+            return
+        for bi in self.bi_list[:cnt]:
+            bi.pre = None
+            bi.next = None
+        del self.bi_list[:cnt]
+        for idx, bi in enumerate(self.bi_list):
+            bi.set_idx(idx)
+        if self.bi_list:
+            self.bi_list[0].pre = None
+        self.deleted_virtual_bi = None
+        self.free_klc_lst = []  # 只在第一笔形成前使用，缓存的都是被淘汰的K线
+
     def try_create_first_bi(self, klc: CKLine) -> bool:
         # 尝试使用当前K线和之前缓存的K线，创建第一笔
         for exist_free_klc in self.free_klc_lst:
@@ -133,6 +155,7 @@ class CBiList:
                     self.add_new_bi(self.last_end, sure_end, is_sure=True)
                     self.last_end = self[-1].end_klc
             else:
+                self.deleted_virtual_bi = self.bi_list[-1]  # 留给紧接着重新生成的虚笔复用
                 del self.bi_list[-1]  # 没有真实确认的结束K线，则删除该虚笔
         self.last_end = self[-1].end_klc if len(self) > 0 else None
         if len(self) > 0:
@@ -166,7 +189,13 @@ class CBiList:
 
     def add_new_bi(self, pre_klc, cur_klc, is_sure=True):
         # 添加一笔新笔，同时连接前后笔
-        self.bi_list.append(CBi(pre_klc, cur_klc, idx=len(self.bi_list), is_sure=is_sure))
+        deleted_virtual_bi, self.deleted_virtual_bi = self.deleted_virtual_bi, None
+        if not is_sure and can_reuse_virtual_bi(deleted_virtual_bi, pre_klc, self.bi_list):
+            # 逐K线计算时虚笔几乎每根K线都被删除重建，起点不变时原地刷新终点，不新建对象
+            deleted_virtual_bi.renew_virtual_end(cur_klc)
+            self.bi_list.append(deleted_virtual_bi)
+        else:
+            self.bi_list.append(CBi(pre_klc, cur_klc, idx=len(self.bi_list), is_sure=is_sure))
         if len(self.bi_list) >= 2:
             self.bi_list[-2].next = self.bi_list[-1]
             self.bi_list[-1].pre = self.bi_list[-2]
@@ -261,3 +290,10 @@ def end_is_peak(last_end: CKLine, cur_end: CKLine) -> bool:
                 return False
             klc = klc.get_next()
     return True
+
+
+def can_reuse_virtual_bi(bi: Optional[CBi], pre_klc: CKLine, bi_list: List[CBi]) -> bool:
+    # 被删除的虚笔与将要生成的虚笔位置、起点、前一笔都相同
+    if bi is None or bi.idx != len(bi_list) or bi.begin_klc is not pre_klc:
+        return False
+    return bi.pre is (bi_list[-1] if len(bi_list) > 0 else None)
@@ -0,0 +1,57 @@
+from bisect import bisect_left, bisect_right
+from typing import Generic, List, Optional, TypeVar
+
+from Common.CTime import CTime
+
+from .BS_Point import CBS_Point
+
+BSP_TYPE_VAR = TypeVar('BSP_TYPE_VAR', bound=CBS_Point)
+
+
+class CBSPointIndex(Generic[BSP_TYPE_VAR]):
+    """按买卖点所在K线索引(klu.idx)排序的买卖点集合，增删和查询都用二分"""
+
+    def __init__(self):
+        self.klu_idx_lst: List[int] = []  # 与 bsp_lst 一一对应的 klu.idx，用于二分
+        self.bsp_lst: List[BSP_TYPE_VAR] = []  # 按 klu.idx 递增排列的买卖点
+
+    def __len__(self):
+        return len(self.bsp_lst)
+
+    def __iter__(self):
+        yield from self.bsp_lst
+
+    def add(self, bsp: BSP_TYPE_VAR):
+        # 新增的买卖点都在未确定的尾部，插入位置靠后，移动代价很小
+        pos = bisect_right(self.klu_idx_lst, bsp.klu.idx)
+        self.klu_idx_lst.insert(pos, bsp.klu.idx)
+        self.bsp_lst.insert(pos, bsp)
+
+    def remove(self, bsp: BSP_TYPE_VAR):
+        pos = bisect_left(self.klu_idx_lst, bsp.klu.idx)
+        while pos < len(self.bsp_lst) and self.klu_idx_lst[pos] == bsp.klu.idx:
+            if self.bsp_lst[pos] is bsp:
+                del self.klu_idx_lst[pos]
+                del self.bsp_lst[pos]
+                return
+            pos += 1
+
+    def retire_head(self, line_cnt: int, klu_cnt: int):
+        """删除所在笔/线段 idx 小于 line_cnt 的买卖点，剩余买卖点的 klu.idx 将整体减少 klu_cnt"""
+        keep_lst = [(klu_idx - klu_cnt, bsp) for klu_idx, bsp in zip(self.klu_idx_lst, self.bsp_lst) if bsp.bi.idx >= line_cnt]
+        self.klu_idx_lst = [klu_idx for klu_idx, _ in keep_lst]
+        self.bsp_lst = [bsp for _, bsp in keep_lst]
+
+    def last(self) -> Optional[BSP_TYPE_VAR]:
+        return self.bsp_lst[-1] if self.bsp_lst else None
+
+    def in_range(self, begin_klu_idx: int, end_klu_idx: int) -> List[BSP_TYPE_VAR]:
+        """klu.idx 在 [begin_klu_idx, end_klu_idx] 内的买卖点"""
+        begin = bisect_left(self.klu_idx_lst, begin_klu_idx)
+        end = bisect_right(self.klu_idx_lst, end_klu_idx)
+        return self.bsp_lst[begin:end]
+
+    def since(self, time: CTime) -> List[BSP_TYPE_VAR]:
+        """所在K线时间不早于 time 的买卖点，K线时间随 klu.idx 单调递增"""
+        begin = bisect_left(self.bsp_lst, time.ts, key=lambda bsp: bsp.klu.time.ts)
+        return self.bsp_lst[begin:]
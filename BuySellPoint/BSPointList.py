@@ -1,13 +1,15 @@
-from typing import Dict, Generic, Iterable, List, Optional, Tuple, TypeVar
+from typing import Callable, Dict, Generic, Iterable, List, Optional, Tuple, TypeVar, Union
 
 # 导入构成笔、线段、中枢的基础类
 from Bi.Bi import CBi
 # 导入笔列表类
 from Bi.BiList import CBiList
-# 导入买卖点类型枚举
-from Common.CEnum import BSP_TYPE
+# 导入买卖点类型枚举、事件类型枚举
+from Common.CEnum import BSP_TYPE, CHAN_EVENT
 # 导入辅助函数，例如判断区间是否有重叠
 from Common.func_util import has_overlap
+# 导入时间类
+from Common.CTime import CTime
 # 导入线段类
 from Seg.Seg import CSeg
 # 导入线段列表通用类
@@ -17,6 +19,8 @@ from ZS.ZS import CZS
 
 # 导入买卖点类
 from .BS_Point import CBS_Point
+# 导入按K线索引排序的买卖点索引
+from .BSPointIndex import CBSPointIndex
 # 导入买卖点配置类
 from .BSPointConfig import CBSPointConfig, CPointConfig
 
@@ -36,6 +40,11 @@ class CBSPointList(Generic[LINE_TYPE, LINE_LIST_TYPE]):
         self.bsp_store_dict: Dict[BSP_TYPE, Tuple[List[CBS_Point[LINE_TYPE]], List[CBS_Point[LINE_TYPE]]]] = {}
         # 存储所有买卖点的扁平化字典，键为构成买卖点的笔或线段的idx，值为买卖点对象
         self.bsp_store_flat_dict: Dict[int, CBS_Point[LINE_TYPE]] = {}
+        # 按 klu.idx 排序的全部买卖点索引，以及按方向、按(类型, 方向)的二级索引
+        # 与 bsp_store_dict 同步在 store_add_bsp / clear_store_end 中维护，查询不用再排序
+        self.bsp_index: CBSPointIndex[CBS_Point[LINE_TYPE]] = CBSPointIndex()
+        self.bsp_dir_index: Dict[bool, CBSPointIndex[CBS_Point[LINE_TYPE]]] = {True: CBSPointIndex(), False: CBSPointIndex()}
+        self.bsp_type_index: Dict[Tuple[BSP_TYPE, bool], CBSPointIndex[CBS_Point[LINE_TYPE]]] = {}
 
         # 专门存储第一类买卖点 (BSP_TYPE.T1 或 BSP_TYPE.T1P) 的列表
         self.bsp1_list: List[CBS_Point[LINE_TYPE]] = []
@@ -49,6 +58,22 @@ class CBSPointList(Generic[LINE_TYPE, LINE_LIST_TYPE]):
         # 上一个确定线段的索引
         self.last_sure_seg_idx = 0
 
+        # 事件回调，为 None 时不做任何事件相关的计算
+        self.event_listener: Optional[Callable[[CHAN_EVENT, Union[CBS_Point[LINE_TYPE], LINE_TYPE]], None]] = None
+        # 已经发出过 BSP_CONFIRMED 事件的最大K线索引
+        self.last_confirmed_pos = -1
+        # 已经发出过 BI_SURE/SEG_SURE 事件的最大笔/线段索引
+        self.last_sure_line_idx = -1
+
+        # 类二、三类B买卖点向后扫描的中间状态，(类型, 扫描起点笔idx) -> 状态
+        # 线段未确定时每根K线都会重新扫描，已扫描且未变化的前缀直接沿用，只从变化处继续
+        self.scan_state_dict: Dict[Tuple[BSP_TYPE, int], CBSPScanState] = {}
+        self.new_scan_state_dict: Dict[Tuple[BSP_TYPE, int], CBSPScanState] = {}
+        # 本次计算时未确定区域内各线段的起止笔，笔的 seg_idx 由它决定
+        self.seg_range_key: tuple = ()
+        # 开启 max_history 后累计淘汰的笔/线段数，外部持有的买卖点据此换算编号
+        self.retired_line_cnt = 0
+
     # 将买卖点添加到存储字典和扁平化字典中
     def store_add_bsp(self, bsp_type: BSP_TYPE, bsp: CBS_Point[LINE_TYPE]):
         # 如果该买卖点类型不在存储字典中，初始化对应的列表
@@ -62,6 +87,24 @@ class CBSPointList(Generic[LINE_TYPE, LINE_LIST_TYPE]):
         self.bsp_store_dict[bsp_type][bsp.is_buy].append(bsp)
         # 将买卖点添加到扁平化字典中
         self.bsp_store_flat_dict[bsp.bi.idx] = bsp
+        # 更新排序索引
+        self.bsp_index.add(bsp)
+        self.bsp_dir_index[bsp.is_buy].add(bsp)
+        for _type in bsp.type:
+            self.type_index_add(_type, bsp)
+
+    # 将买卖点加入 (类型, 方向) 索引
+    def type_index_add(self, bsp_type: BSP_TYPE, bsp: CBS_Point[LINE_TYPE]):
+        if (bsp_type, bsp.is_buy) not in self.bsp_type_index:
+            self.bsp_type_index[(bsp_type, bsp.is_buy)] = CBSPointIndex()
+        self.bsp_type_index[(bsp_type, bsp.is_buy)].add(bsp)
+
+    # 将买卖点从所有排序索引中删除
+    def index_remove(self, bsp: CBS_Point[LINE_TYPE]):
+        self.bsp_index.remove(bsp)
+        self.bsp_dir_index[bsp.is_buy].remove(bsp)
+        for _type in set(bsp.type):
+            self.bsp_type_index[(_type, bsp.is_buy)].remove(bsp)
 
     # 添加第一类买卖点到专门的列表和字典中
     def add_bsp1(self, bsp: CBS_Point[LINE_TYPE]):
@@ -73,8 +116,9 @@ class CBSPointList(Generic[LINE_TYPE, LINE_LIST_TYPE]):
         # 添加到字典中
         self.bsp1_dict[bsp.bi.idx] = bsp
 
-    # 清理存储字典中位于 last_sure_pos 之后的买卖点 (未确认部分)
-    def clear_store_end(self):
+    # 清理存储字典中位于 last_sure_pos 之后的买卖点 (未确认部分)，返回被清理的买卖点
+    def clear_store_end(self) -> List[CBS_Point[LINE_TYPE]]:
+        removed_bsp_lst: List[CBS_Point[LINE_TYPE]] = []
         # 遍历所有买卖点类型
         for bsp_list in self.bsp_store_dict.values():
             # 遍历买点和卖点方向
@@ -86,8 +130,11 @@ class CBSPointList(Generic[LINE_TYPE, LINE_LIST_TYPE]):
                         break
                     # 从扁平化字典中删除
                     del self.bsp_store_flat_dict[bsp_list[is_buy][-1].bi.idx]
+                    # 从排序索引中删除
+                    self.index_remove(bsp_list[is_buy][-1])
                     # 从列表中删除
-                    bsp_list[is_buy].pop()
+                    removed_bsp_lst.append(bsp_list[is_buy].pop())
+        return removed_bsp_lst
 
     # 清理第一类买卖点列表中位于 last_sure_pos 之后的买卖点 (未确认部分)
     def clear_bsp1_end(self):
@@ -101,6 +148,37 @@ class CBSPointList(Generic[LINE_TYPE, LINE_LIST_TYPE]):
             # 从列表中删除
             self.bsp1_list.pop()
 
+    # 淘汰所在笔/线段 idx 小于 line_cnt 的买卖点，需在笔/线段/K线重新编号之前调用
+    # 以 idx 为键的字典按编号后的 idx 重建，记录的位置随之平移
+    def retire_head(self, line_cnt: int, seg_cnt: int, klu_cnt: int):
+        for bsp_list in self.bsp_store_dict.values():
+            for is_buy in [True, False]:
+                # 同类型同方向的买卖点按 bi.idx 递增
+                retire_cnt = 0
+                while retire_cnt < len(bsp_list[is_buy]) and bsp_list[is_buy][retire_cnt].bi.idx < line_cnt:
+                    retire_cnt += 1
+                del bsp_list[is_buy][:retire_cnt]
+        self.bsp_store_flat_dict = {bsp.bi.idx - line_cnt: bsp for bsp in self.bsp_iter()}
+        self.bsp_index.retire_head(line_cnt, klu_cnt)
+        for index in self.bsp_dir_index.values():
+            index.retire_head(line_cnt, klu_cnt)
+        for index in self.bsp_type_index.values():
+            index.retire_head(line_cnt, klu_cnt)
+
+        self.bsp1_list = [bsp for bsp in self.bsp1_list if bsp.bi.idx >= line_cnt]
+        self.bsp1_dict = {bsp.bi.idx - line_cnt: bsp for bsp in self.bsp1_list}
+
+        if self.last_sure_pos >= 0:
+            self.last_sure_pos -= klu_cnt
+        self.last_sure_seg_idx = max(self.last_sure_seg_idx - seg_cnt, 0)
+        self.last_confirmed_pos = max(self.last_confirmed_pos - klu_cnt, -1)
+        self.last_sure_line_idx = max(self.last_sure_line_idx - line_cnt, -1)
+        # 扫描状态里记录的是笔索引，全部作废
+        self.scan_state_dict = {}
+        self.new_scan_state_dict = {}
+        self.seg_range_key = ()
+        self.retired_line_cnt += line_cnt
+
     # 迭代器，用于遍历所有存储的买卖点
     def bsp_iter(self) -> Iterable[CBS_Point[LINE_TYPE]]:
         # 遍历所有买卖点类型
@@ -129,19 +207,75 @@ class CBSPointList(Generic[LINE_TYPE, LINE_LIST_TYPE]):
         """
         # 因为每过来一根K线，都有当下的情况，因此未被确认的买点要重新计算，故在被最后的确认买点后面的全部买卖点都要被清理掉
         # 清理未确定部分的存储买卖点
-        self.clear_store_end()
+        removed_bsp_lst = self.clear_store_end()
+        last_sure_pos = self.last_sure_pos
         # 清理未确定部分的第一类买卖点
         self.clear_bsp1_end()
+        # 本次计算没有用到的扫描状态随之丢弃
+        self.new_scan_state_dict = {}
+        self.seg_range_key = (self.last_sure_seg_idx, len(seg_list)) + tuple((seg.start_bi.idx, seg.end_bi.idx) for seg in seg_list[self.last_sure_seg_idx:])
         # 计算线段上的第一类买卖点
         self.cal_seg_bs1point(seg_list, bi_list)
         # 计算线段上的第二类买卖点
         self.cal_seg_bs2point(seg_list, bi_list)
         # 计算线段上的第三类买卖点
         self.cal_seg_bs3point(seg_list, bi_list)
+        self.scan_state_dict = self.new_scan_state_dict
 
         # 更新最后一个确定位置的K线索引和线段索引
         self.update_last_pos(seg_list)
 
+        # 有订阅者时，对比重算前后的未确定买卖点，发出事件
+        if self.event_listener is not None:
+            self.emit_bsp_event(removed_bsp_lst, last_sure_pos)
+            self.emit_line_sure_event(bi_list)
+
+    # 获取所基于的笔/线段结束K线索引大于 pos 的买卖点，按 bi.idx 排序
+    def get_bsp_after(self, pos) -> List[CBS_Point[LINE_TYPE]]:
+        res: List[CBS_Point[LINE_TYPE]] = []
+        for bsp_list in self.bsp_store_dict.values():
+            for is_buy in [True, False]:
+                # 同类型同方向的买卖点按 bi.idx 递增，从尾部往前找即可
+                for bsp in reversed(bsp_list[is_buy]):
+                    if bsp.bi.get_end_klu().idx <= pos:
+                        break
+                    res.append(bsp)
+        return sorted(res, key=lambda bsp: bsp.bi.idx)
+
+    # 对比重算前被清理的买卖点与重算后的买卖点，发出新增/失效/确定事件
+    def emit_bsp_event(self, removed_bsp_lst: List[CBS_Point[LINE_TYPE]], last_sure_pos):
+        # 同一根笔/线段、同方向、同类型的买卖点视为同一个，只是被重算出了新对象
+        removed_bsp_dict = {bsp_event_key(bsp): bsp for bsp in removed_bsp_lst}
+        new_bsp_lst = self.get_bsp_after(last_sure_pos)
+        new_bsp_key_set = {bsp_event_key(bsp) for bsp in new_bsp_lst}
+        for key, bsp in sorted(removed_bsp_dict.items(), key=lambda item: item[1].bi.idx):
+            if key not in new_bsp_key_set:
+                self.event_listener(CHAN_EVENT.BSP_INVALIDATED, bsp)
+        for bsp in new_bsp_lst:
+            removed_bsp = removed_bsp_dict.get(bsp_event_key(bsp))
+            if removed_bsp is None:
+                self.event_listener(CHAN_EVENT.BSP_CREATED, bsp)
+            elif removed_bsp is not bsp:
+                # 订阅者持有的旧对象换成新对象，特征等以新对象为准
+                self.event_listener(CHAN_EVENT.BSP_UPDATED, bsp)
+        # 落入最新确定位置之前的买卖点不会再被清理
+        for bsp in new_bsp_lst:
+            end_klu_idx = bsp.bi.get_end_klu().idx
+            if self.last_confirmed_pos < end_klu_idx <= self.last_sure_pos:
+                self.event_listener(CHAN_EVENT.BSP_CONFIRMED, bsp)
+        self.last_confirmed_pos = max(self.last_confirmed_pos, self.last_sure_pos)
+
+    # 发出笔/线段确定事件
+    def emit_line_sure_event(self, bi_list: LINE_LIST_TYPE):
+        # 最后一个确定的笔/线段及其前一个仍可能被修改（延伸尾部、被删除重算），不算确定
+        line_idx = len(bi_list) - 1
+        while line_idx >= 0 and not bi_list[line_idx].is_sure:
+            line_idx -= 1
+        for idx in range(self.last_sure_line_idx + 1, line_idx - 1):
+            line = bi_list[idx]
+            self.event_listener(CHAN_EVENT.SEG_SURE if isinstance(line, CSeg) else CHAN_EVENT.BI_SURE, line)
+        self.last_sure_line_idx = max(self.last_sure_line_idx, line_idx - 2)
+
     # 更新最后一个确定位置的K线索引和线段索引
     def update_last_pos(self, seg_list: CSegListComm):
         # 初始化为 -1 和 0
@@ -181,7 +315,11 @@ class CBSPointList(Generic[LINE_TYPE, LINE_LIST_TYPE]):
             # 如果存在，断言方向一致
             assert exist_bsp.is_buy == is_buy
             # 为已存在的买卖点添加新的买卖点属性 (例如，一个点可能是 T1 也是 T1P)
+            is_new_type = bs_type not in exist_bsp.type
             exist_bsp.add_another_bsp_prop(bs_type, relate_bsp1)
+            # 新增的类型也要能按类型查到
+            if is_new_type:
+                self.type_index_add(bs_type, exist_bsp)
             return # 已经处理，直接返回
         # 如果当前买卖点类型不在配置的目标类型中，标记为非目标买卖点
         if bs_type not in self.config.GetBSConfig(is_buy).target_types:
@@ -370,10 +508,23 @@ class CBSPointList(Generic[LINE_TYPE, LINE_LIST_TYPE]):
         bias = 2 # 从 bsp2_bi 后面的第二笔开始检查
         _low, _high = None, None # 初始化重叠区间
 
+        bsp2s_idx_lst: List[int] = []  # 已找到的类二所在笔的 idx
+
+        # 扫描结果还依赖配置、线段数及 bsp2_bi 所在线段是否确定；都没变时从上次停下的位置继续
+        scan_key = (BSP_TYPE.T2S, bsp2_bi.idx)
+        cond_key = (id(BSP_CONF), self.seg_range_key, bsp2_bi.seg_idx < len(seg_list) and seg_list[bsp2_bi.seg_idx].is_sure)
+        if (state := self.scan_state_dict.get(scan_key)) is not None and state.can_resume(cond_key, bi_list):
+            bias, _low, _high = state.next_idx - bsp2_bi.idx, state.low, state.high
+            bsp2s_idx_lst = list(state.hit_idx_lst)
+            for bi_idx in bsp2s_idx_lst:
+                self.add_bs(bs_type=BSP_TYPE.T2S, bi=bi_list[bi_idx], relate_bsp1=real_bsp1)  # type: ignore
+
+        resume_state = None  # 最后一次检查前的状态，下次从这里继续
         # 循环检查后续的笔，间隔为2 (构成新的笔)
         while bsp2_bi.idx + bias < len(bi_list):  # 计算类二
             # 类二买卖点所在的笔
             bsp2s_bi = bi_list[bsp2_bi.idx + bias]
+            resume_state = (bsp2s_bi, _low, _high, len(bsp2s_idx_lst))
             # 断言 bsp2s_bi 和 bsp2_bi 的线段索引不为空
             assert bsp2s_bi.seg_idx is not None and bsp2_bi.seg_idx is not None
             # 如果配置限制了最大的类二级别 (bias/2 对应级别)，超过限制则中断
@@ -406,8 +557,12 @@ class CBSPointList(Generic[LINE_TYPE, LINE_LIST_TYPE]):
 
             # 满足条件，添加类型为 T2S 的买卖点
             self.add_bs(bs_type=BSP_TYPE.T2S, bi=bsp2s_bi, relate_bsp1=real_bsp1)  # type: ignore
+            bsp2s_idx_lst.append(bsp2s_bi.idx)
             # 检查下一组笔， bias 增加2
             bias += 2
+        if resume_state is not None:
+            next_bi, _low, _high, hit_cnt = resume_state
+            self.new_scan_state_dict[scan_key] = CBSPScanState(cond_key, next_bi, _low, _high, tuple(bsp2s_idx_lst[:hit_cnt]))
 
     # 计算线段上的第三类买卖点
     def cal_seg_bs3point(self, seg_list: CSegListComm[LINE_TYPE], bi_list: LINE_LIST_TYPE):
@@ -530,7 +685,15 @@ class CBSPointList(Generic[LINE_TYPE, LINE_LIST_TYPE]):
         # 计算第三类 B 买卖点检查的结束笔索引
         end_bi_idx = cal_bsp3_bi_end_idx(next_seg)
         # 从 bsp1_bi 后面的第二笔开始，间隔为2遍历后续的笔
-        for bsp3_bi in bi_list[bsp1_bi.idx+2::2]:
+        begin_idx = bsp1_bi.idx+2
+        # 已扫描的前缀都回抽进了中枢，没有产生买卖点；中枢区间和线段都没变时从上次停下的位置继续
+        scan_key = (BSP_TYPE.T3B, bsp1_bi.idx)
+        cond_key = (self.seg_range_key, next_seg_idx, cmp_zs.low, cmp_zs.high)
+        if (state := self.scan_state_dict.get(scan_key)) is not None and state.can_resume(cond_key, bi_list):
+            begin_idx = state.next_idx
+        bsp3_bi = None
+        for bi_idx in range(begin_idx, len(bi_list), 2):
+            bsp3_bi = bi_list[bi_idx]
             # 如果当前笔的索引超过了检查结束索引，中断
             if bsp3_bi.idx > end_bi_idx:
                 break
@@ -546,15 +709,69 @@ class CBSPointList(Generic[LINE_TYPE, LINE_LIST_TYPE]):
             self.add_bs(bs_type=BSP_TYPE.T3B, bi=bsp3_bi, relate_bsp1=real_bsp1)  # type: ignore
             # 找到一个就停止 (第三类 B 通常只取第一个回抽不破中枢的笔)
             break
+        # 最后检查的那一笔之前都是回抽进中枢的笔，下次从它继续
+        if bsp3_bi is not None:
+            self.new_scan_state_dict[scan_key] = CBSPScanState(cond_key, bsp3_bi)
 
     # 获取所有存储的买卖点，并按基于的笔/线段索引排序
     def getSortedBspList(self) -> List[CBS_Point[LINE_TYPE]]:
-        # 使用 bsp_iter 获取所有买卖点，然后按 bi.idx 排序
-        return sorted(self.bsp_iter(), key=lambda bsp: bsp.bi.idx)
+        # 排序索引已按 klu.idx (与 bi.idx 同序) 排好，直接拷贝
+        return list(self.bsp_index)
+
+    # 获取所在K线时间不早于 time 的买卖点，按时间排序
+    def bsps_since(self, time: CTime) -> List[CBS_Point[LINE_TYPE]]:
+        return self.bsp_index.since(time)
+
+    # 获取所在K线索引在 [begin_klu_idx, end_klu_idx] 内的买卖点，按时间排序
+    def bsps_in_range(self, begin_klu_idx: int, end_klu_idx: int) -> List[CBS_Point[LINE_TYPE]]:
+        return self.bsp_index.in_range(begin_klu_idx, end_klu_idx)
+
+    # 获取最后一个买卖点，可以限定类型 (满足其中任一类型即可) 和方向
+    def last_bsp(self, types: Optional[Iterable[BSP_TYPE]] = None, is_buy: Optional[bool] = None) -> Optional[CBS_Point[LINE_TYPE]]:
+        if types is None:
+            return self.bsp_index.last() if is_buy is None else self.bsp_dir_index[is_buy].last()
+        res = None
+        for bsp_type in types:
+            for _is_buy in ([True, False] if is_buy is None else [is_buy]):
+                if (bsp_type, _is_buy) not in self.bsp_type_index:
+                    continue
+                bsp = self.bsp_type_index[(bsp_type, _is_buy)].last()
+                if bsp is not None and (res is None or bsp.klu.idx > res.klu.idx):
+                    res = bsp
+        return res
+
+
+class CBSPScanState:
+    """
+    向后逐笔扫描的中间状态：记录下一根待检查的笔及此前累积的结果
+    笔只有最后两根会被修改，只要待检查的笔仍是同一个对象、且没有被原地改过终点（版本号不变），它之前的笔都没有变化
+    """
+
+    def __init__(self, cond_key: tuple, next_bi, low=None, high=None, hit_idx_lst: Tuple[int, ...] = ()):
+        self.cond_key = cond_key  # 扫描中除逐笔数据以外依赖的条件
+        self.next_bi = next_bi  # 下一根待检查的笔
+        self.next_idx: int = next_bi.idx
+        self.version = line_version(next_bi)  # 记录时的终点版本号，虚笔可能被原地重新启用
+        self.low = low  # 类二扫描累积的重叠区间
+        self.high = high
+        self.hit_idx_lst = hit_idx_lst  # 前缀中找到的买卖点所在笔的 idx
+
+    def can_resume(self, cond_key: tuple, bi_list) -> bool:
+        return self.cond_key == cond_key and self.next_idx < len(bi_list) and bi_list[self.next_idx] is self.next_bi and line_version(self.next_bi) == self.version
 
 
 # -------------------- 辅助函数 --------------------
 
+# 笔的终点每变化一次版本号加一，线段没有版本号
+def line_version(line: LINE_TYPE) -> int:
+    return line.version if isinstance(line, CBi) else 0
+
+
+# 买卖点事件比较时使用的标识：所基于的笔/线段索引、所在K线、方向、类型
+def bsp_event_key(bsp: CBS_Point) -> Tuple[int, int, bool, str]:
+    return bsp.bi.idx, bsp.klu.idx, bsp.is_buy, bsp.type2str()
+
+
 # 判断类二买卖点候选笔是否突破了第一类买卖点形成时的突破笔
 # 对于买点 (bsp2s_bi 是下笔)，如果其 low 小于 break_bi 的 low，表示创新低，突破了
 # 对于卖点 (bsp2s_bi 是上笔)，如果其 high 大于 break_bi 的 high，表示创新高，突破了
@@ -0,0 +1,118 @@
+from bisect import insort
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from ChanEvent import CChanEvent
+from Common.CEnum import CHAN_EVENT, FX_TYPE, KL_TYPE
+
+from .BS_Point import CBS_Point
+from .BSPointList import bsp_event_key
+
+
+class CBSPointSignal:
+    """
+    基于买卖点事件的信号检测：订阅 CChan 的事件，增量维护各级别当前的笔买卖点，
+    每步只检查“最后一个买卖点所在的合并K线刚形成对应分型”，不用每步排序整个买卖点列表
+    """
+
+    def __init__(self, chan):
+        self.chan = chan
+        self.bsp_lst_dict: Dict[KL_TYPE, List[CBS_Point]] = defaultdict(list)  # 各级别当前买卖点，按 bi.idx 排序
+        self.last_signal_dict: Dict[int, CBS_Point] = {}  # 级别序号 -> 最近一次触发信号的买卖点
+        self.retired_line_cnt_dict: Dict[KL_TYPE, int] = defaultdict(int)  # 各级别已同步过的淘汰笔数，见 max_history
+        chan.add_event_listener(self.on_event)
+
+    def on_event(self, event: CChanEvent):
+        # 与 get_bsp 一致，只关心笔买卖点
+        if event.is_seg or event.bsp is None:
+            return
+        bsp_lst = self.sync_retired(event.kl_type)
+        if event.type == CHAN_EVENT.BSP_CREATED:
+            insort(bsp_lst, event.bsp, key=lambda bsp: bsp.bi.idx)
+        elif event.type in (CHAN_EVENT.BSP_INVALIDATED, CHAN_EVENT.BSP_UPDATED):
+            # 失效、重算的买卖点都在尾部，从后往前找
+            key = bsp_event_key(event.bsp)
+            for idx in range(len(bsp_lst) - 1, -1, -1):
+                if bsp_event_key(bsp_lst[idx]) == key:
+                    if event.type == CHAN_EVENT.BSP_INVALIDATED:
+                        del bsp_lst[idx]
+                    else:
+                        bsp_lst[idx] = event.bsp
+                    break
+            if event.type == CHAN_EVENT.BSP_UPDATED:
+                lv_idx = self.chan.lv_list.index(event.kl_type)
+                if lv_idx in self.last_signal_dict and bsp_event_key(self.last_signal_dict[lv_idx]) == key:
+                    self.last_signal_dict[lv_idx] = event.bsp
+
+    def sync_retired(self, kl_type: KL_TYPE) -> List[CBS_Point]:
+        """
+        开启 max_history 淘汰历史后同步本级别的买卖点：所在笔已淘汰的丢掉，其余已随笔列表重新编号
+        持有的对象所在笔不在笔列表中时（如未收到 BSP_UPDATED），换成同一根K线上同方向、同类型的当前买卖点，不改动旧对象
+        """
+        bs_point_lst = self.chan[kl_type].bs_point_lst
+        if bs_point_lst.retired_line_cnt == self.retired_line_cnt_dict[kl_type]:
+            return self.bsp_lst_dict[kl_type]
+        bi_list = self.chan[kl_type].bi_list
+        cur_bsp_dict: Optional[Dict[int, CBS_Point]] = None
+        new_bsp_lst = []
+        for bsp in self.bsp_lst_dict[kl_type]:
+            if bsp.bi.idx < len(bi_list) and bi_list[bsp.bi.idx] is bsp.bi:
+                new_bsp_lst.append(bsp)
+                continue
+            if cur_bsp_dict is None:
+                cur_bsp_dict = {id(cur_bsp.klu): cur_bsp for cur_bsp in bs_point_lst.bsp_store_flat_dict.values()}
+            cur_bsp = cur_bsp_dict.get(id(bsp.klu))
+            if cur_bsp is not None and cur_bsp.is_buy == bsp.is_buy and cur_bsp.type2str() == bsp.type2str():
+                new_bsp_lst.append(cur_bsp)
+        self.bsp_lst_dict[kl_type] = new_bsp_lst
+        self.retired_line_cnt_dict[kl_type] = bs_point_lst.retired_line_cnt
+        return new_bsp_lst
+
+    def last_bsp(self, lv_idx: int) -> Optional[CBS_Point]:
+        bsp_lst = self.sync_retired(self.chan.lv_list[lv_idx])
+        return bsp_lst[-1] if bsp_lst else None
+
+    def check(self) -> List[Tuple[int, CBS_Point]]:
+        """每步调用一次，返回本步触发信号的 (级别序号, 买卖点)"""
+        res = []
+        for lv_idx in range(len(self.chan.lv_list)):
+            last_bsp = self.last_bsp(lv_idx)
+            if last_bsp is not None and bsp_fx_formed(last_bsp, self.chan[lv_idx]):
+                self.last_signal_dict[lv_idx] = last_bsp
+                res.append((lv_idx, last_bsp))
+        return res
+
+    def last_signal(self, lv_idx: int) -> Optional[CBS_Point]:
+        return self.last_signal_dict.get(lv_idx)
+
+
+def bsp_fx_formed(bsp: CBS_Point, kl_list) -> bool:
+    # 买卖点所在合并K线是倒数第二根，且已形成对应方向的分型（买点底分型、卖点顶分型）
+    if len(kl_list) < 2 or bsp.klu.klc.idx != kl_list[-2].idx:
+        return False
+    return (kl_list[-2].fx == FX_TYPE.BOTTOM and bsp.is_buy) or (kl_list[-2].fx == FX_TYPE.TOP and not bsp.is_buy)
+
+
+def latest_signal(chan) -> List[Tuple[int, CBS_Point]]:
+    """不回放、只算最新状态（如 CChan.latest_state）时用：最新一根K线上触发信号的 (级别序号, 买卖点)，与回放到最后一步时 check() 的返回相同"""
+    res = []
+    for lv_idx in range(len(chan.lv_list)):
+        bsp_lst = chan.get_bsp(lv_idx)
+        if bsp_lst and bsp_fx_formed(bsp_lst[-1], chan[lv_idx]):
+            res.append((lv_idx, bsp_lst[-1]))
+    return res
+
+
+def last_formed_bsp(chan, lv_idx: int) -> Optional[CBS_Point]:
+    """
+    最新状态下最后一个已形成对应分型（所在合并K线之后已有新的合并K线）的买卖点，不回放时代替 last_signal
+    与回放记录的不同：回放中途触发过信号、之后又失效的买卖点不在其中，晚于分型才算出来的买卖点（如二买）会在其中
+    """
+    kl_list = chan[lv_idx]
+    if len(kl_list) < 2:
+        return None
+    for bsp in reversed(chan.get_bsp(lv_idx)):
+        klc = bsp.klu.klc
+        if klc.idx < kl_list[-1].idx and ((klc.fx == FX_TYPE.BOTTOM and bsp.is_buy) or (klc.fx == FX_TYPE.TOP and not bsp.is_buy)):
+            return bsp
+    return None
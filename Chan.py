@@ -1,12 +1,22 @@
 import copy
 import datetime
+import io
+import pickle
+from bisect import bisect_right
 from collections import defaultdict
-from typing import Dict, Iterable, List, Optional, Union
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Union
 
 # 导入买卖点类
 from BuySellPoint.BS_Point import CBS_Point
 # 导入缠论配置类
 from ChanConfig import CChanConfig
+# 导入计算事件
+from ChanEvent import CChanEvent
+# 导入多级别并行计算的子进程入口
+from ChanParallel import build_kl_list, cal_kl_list, load_kl_list, raw_kl_dict, unpickle_without_gc
+# 导入逐步回放的只读快照
+from ChanSnapshot import CChanSnapshot, CChanSnapshotBuilder
 # 导入缠论枚举类型：复权类型、数据源、K线类型
 from Common.CEnum import AUTYPE, DATA_SRC, KL_TYPE
 # 导入缠论异常类和错误码
@@ -19,6 +29,8 @@ from Common.func_util import check_kltype_order, kltype_lte_day
 from DataAPI.CommonStockAPI import CCommonStockApi
 # 导入K线列表类
 from KLine.KLine_List import CKLine_List
+# 导入多级别K线对齐
+from KLine.KLine_Align import CKLineAligner, CKLineAlignReport
 # 导入K线单位类
 from KLine.KLine_Unit import CKLine_Unit
 from Common.file_util import FileOperator
@@ -36,6 +48,7 @@ class CChan:
         lv_list=None, # 需要分析的K线级别列表，从高到低排列
         config=None, # 缠论配置对象
         autype: AUTYPE = AUTYPE.QFQ, # 复权类型
+        autoload=True, # 非回放模式下是否在构造时加载数据，False 时由调用方加载（如 CChanBatch，或之后调用 latest_state）
     ):
         # 如果没有指定级别列表，默认使用日线和60分钟线
         if lv_list is None:
@@ -56,22 +69,27 @@ class CChan:
             config = CChanConfig()
         self.conf = config # 缠论配置
 
-        # 用于记录K线时间未对齐的数量
-        self.kl_misalign_cnt = 0
-        # 用于记录K线数据不一致的详细信息 (key 为父级别时间，value 为子级别时间列表)
-        self.kl_inconsistent_detail = defaultdict(list)
+        # 多级别K线对齐的诊断信息：找不到次级别K线、父子级别K线日期不一致
+        self.align_report = CKLineAlignReport()
 
         # 用于存储各级别K线数据的迭代器列表
         self.g_kl_iter = defaultdict(list)
 
+        # 买卖点/笔/线段事件的订阅者
+        self.event_listeners: List[Callable[[CChanEvent], None]] = []
+
         # 执行初始化操作
         self.do_init()
 
         # 如果配置没有设置 trigger_step (非回放模式)
-        if not config.trigger_step:
-            # 调用 load 方法一次性加载所有数据并计算所有结构
-            for _ in self.load():
-                ... # 遍历迭代器，执行计算过程
+        if not config.trigger_step and autoload:
+            if config.parallel_lv and len(self.lv_list) > 1:
+                # 各级别在独立进程中并行计算
+                self.parallel_load()
+            else:
+                # 调用 load 方法一次性加载所有数据并计算所有结构
+                for _ in self.load():
+                    ... # 遍历迭代器，执行计算过程
 
     # 实现对象的深拷贝
     def __deepcopy__(self, memo):
@@ -90,8 +108,7 @@ class CChan:
         # 深拷贝列表和配置对象
         obj.lv_list = copy.deepcopy(self.lv_list, memo)
         obj.conf = copy.deepcopy(self.conf, memo)
-        obj.kl_misalign_cnt = self.kl_misalign_cnt
-        obj.kl_inconsistent_detail = copy.deepcopy(self.kl_inconsistent_detail, memo)
+        obj.align_report = copy.deepcopy(self.align_report, memo)
         obj.g_kl_iter = copy.deepcopy(self.g_kl_iter, memo)
         # 如果存在 klu_cache 和 klu_last_t，进行深拷贝
         if hasattr(self, 'klu_cache'):
@@ -102,6 +119,9 @@ class CChan:
         obj.kl_datas = {}
         for kl_type, ckline in self.kl_datas.items():
             obj.kl_datas[kl_type] = copy.deepcopy(ckline, memo)
+        # 订阅者不随拷贝传递
+        obj.event_listeners = []
+        obj.bind_event_listener()
         # 修正深拷贝后 KLine_Unit 之间的父子关系引用
         for kl_type, ckline in self.kl_datas.items():
             for klc in ckline:
@@ -123,6 +143,37 @@ class CChan:
         # 为每个指定级别创建一个 CKLine_List 对象，并关联配置
         for idx in range(len(self.lv_list)):
             self.kl_datas[self.lv_list[idx]] = CKLine_List(self.lv_list[idx], conf=self.conf)
+        self.link_klu_index()
+        self.bind_event_listener()
+
+    # 关联相邻级别的跨级别索引，级别变化（跳过非法子级别、并行计算替换K线列表）后需重新关联
+    def link_klu_index(self):
+        for lv_idx, lv in enumerate(self.lv_list):
+            klu_index = self.kl_datas[lv].klu_index
+            klu_index.sup = self[lv_idx-1].klu_index if lv_idx > 0 else None
+            klu_index.sub = self[lv_idx+1].klu_index if lv_idx+1 < len(self.lv_list) else None
+
+    # 订阅买卖点新增/确定/失效、笔/线段确定事件，回调参数为 CChanEvent
+    # 事件在计算过程中同步触发，需在 step_load/trigger_load 之前订阅
+    def add_event_listener(self, listener: Callable[[CChanEvent], None]):
+        self.event_listeners.append(listener)
+        self.bind_event_listener()
+
+    # 取消订阅
+    def remove_event_listener(self, listener: Callable[[CChanEvent], None]):
+        self.event_listeners.remove(listener)
+        self.bind_event_listener()
+
+    # 将事件分发函数挂到各级别上，没有订阅者时不挂，避免额外计算
+    def bind_event_listener(self):
+        listener = self.dispatch_event if self.event_listeners else None
+        for kl_list in self.kl_datas.values():
+            kl_list.set_event_listener(listener)
+
+    # 分发事件给所有订阅者
+    def dispatch_event(self, event: CChanEvent):
+        for listener in self.event_listeners:
+            listener(event)
 
     # 从股票数据API加载数据并生成 K 线单位迭代器
     def load_stock_data(self, stockapi_instance: CCommonStockApi, lv) -> Iterable[CKLine_Unit]:
@@ -151,44 +202,48 @@ class CChan:
             # 如果 lv_idx 是 K 线类型，直接使用
             self.g_kl_iter[lv_idx].append(iter)
 
-    # 获取指定级别的下一个 K 线单位
-    def get_next_lv_klu(self, lv_idx):
-        # 如果 lv_idx 是整数，通过级别列表获取对应的 K 线类型
-        if isinstance(lv_idx, int):
-            lv_idx = self.lv_list[lv_idx]
-        # 如果该级别没有可用的迭代器，抛出 StopIteration
-        if len(self.g_kl_iter[lv_idx]) == 0:
-            raise StopIteration
-        try:
-            # 从当前迭代器中获取下一个 K 线单位
-            return self.g_kl_iter[lv_idx][0].__next__()
-        except StopIteration:
-            # 如果当前迭代器耗尽，移除该迭代器
-            self.g_kl_iter[lv_idx] = self.g_kl_iter[lv_idx][1:]
-            # 如果还有其他迭代器，继续获取下一个 K 线单位
-            if len(self.g_kl_iter[lv_idx]) != 0:
-                return self.get_next_lv_klu(lv_idx)
-            else:
-                # 如果所有迭代器都耗尽，抛出 StopIteration
-                raise
+    # 取出指定级别待加入的全部 K 线单位：先是上次留在缓存中的一根，然后是各迭代器中的
+    def pop_lv_klu_lst(self, lv_idx: int) -> List[CKLine_Unit]:
+        lv = self.lv_list[lv_idx]
+        klu_lst = [self.klu_cache[lv_idx]] if self.klu_cache[lv_idx] else []
+        self.klu_cache[lv_idx] = None
+        for klu_iter in self.g_kl_iter[lv]:
+            klu_lst.extend(klu_iter)
+        self.g_kl_iter[lv] = []
+        return klu_lst
+
+    # 丢弃各级别已读取但还没加入计算的 K 线单位（klu_cache 和迭代器中的），之后从最后加入计算的 K 线继续 trigger_load
+    # 用于重新取数据后补算：没用到的那些 K 线以新数据为准
+    def drop_unused_klu(self):
+        for lv_idx in range(len(self.lv_list)):
+            self.pop_lv_klu_lst(lv_idx)
+            kl_list = self[lv_idx]
+            self.klu_last_t[lv_idx] = kl_list[-1][-1].time if len(kl_list) > 0 else CTime(1980, 1, 1, 0, 0)
 
     # 回放模式下的逐步加载和计算
-    def step_load(self):
+    # view=True 时每步返回 CChanSnapshot 只读快照（共享已确定前缀，只拷贝未确定尾部），可以放心长期持有
+    # view=False 时保持原行为，返回的是会被后续计算修改的 self
+    def step_load(self, view=False) -> Iterable[Union['CChan', CChanSnapshot]]:
         # 断言：必须在回放模式下调用此方法 (conf.trigger_step 为 True)
         assert self.conf.trigger_step
         self.do_init()  # 清空数据，防止再次重跑没有数据
+        yield from self.step_iter(self.load(self.conf.trigger_step), view)
+
+    # 按 skip_step 和 view 处理 load_iterator(step=True) 每一步的结果
+    def step_iter(self, load_iter: Iterable['CChan'], view=False) -> Iterable[Union['CChan', CChanSnapshot]]:
+        snapshot_builder = CChanSnapshotBuilder(self) if view else None
         yielded = False  # 标记是否曾经返回过结果
         # 遍历 load 方法生成的快照迭代器，每次计算 trigger_step 个 K 线单位
-        for idx, snapshot in enumerate(self.load(self.conf.trigger_step)):
+        for idx, snapshot in enumerate(load_iter):
             # 跳过指定的起始步数
             if idx < self.conf.skip_step:
                 continue
             # 返回当前计算状态的快照
-            yield snapshot
+            yield snapshot_builder.make_snapshot() if snapshot_builder else snapshot
             yielded = True
         # 如果没有返回过结果 (例如数据不足)，则返回当前对象 (空对象或只有少量数据)
         if not yielded:
-            yield self
+            yield snapshot_builder.make_snapshot() if snapshot_builder else self
 
     # 触发式加载和计算 (例如实时数据推送)
     def trigger_load(self, inp):
@@ -211,13 +266,192 @@ class CChan:
             assert isinstance(inp[lv], list)
             self.add_lv_iter(lv, iter(inp[lv])) # 添加迭代器
         # 调用 load_iterator 从最高级别开始计算，非回放模式
-        for _ in self.load_iterator(lv_idx=0, parent_klu=None, step=False):
+        for _ in self.load_iterator(step=False):
             ... # 遍历迭代器，执行计算过程
         # 如果不是回放模式，在所有数据计算完之后一次性计算所有级别中枢和线段
         if not self.conf.trigger_step:
             for lv in self.lv_list:
                 self.kl_datas[lv].cal_seg_and_zs()
 
+    # 只关心最新状态（例如全市场扫描每个级别最后的买卖点）时使用：不从 begin_time 开始完整计算，
+    # 先只算最后 window 根最高级别K线（次级别取对应时间段），之后窗口每次翻倍重算，
+    # 直到相邻两次从倒数第 seg_cnt 个确定线段开始的笔、线段、买卖点都一致，或窗口已覆盖全部数据
+    # 返回计算完的 self，用 get_bsp、self[lv] 等获取结果；计算过程中不分发事件
+    # 注意：MACD 等递推指标从窗口起点开始计算，数值与完整计算有微小差别
+    # 非回放模式下构造时要传 autoload=False，否则构造时已经完整计算了一遍
+    # lv_klu_lst 为 read_lv_klu_lst 已读取的各级别 K 线（CChanBatch 用），None 时从数据源读取
+    def latest_state(self, window=500, seg_cnt=3, lv_klu_lst: Optional[List[List[CKLine_Unit]]] = None) -> 'CChan':
+        if window <= 0 or seg_cnt <= 0:
+            raise CChanException(f"latest_state window={window}, seg_cnt={seg_cnt} should be positive", ErrCode.PARA_ERROR)
+        # 数据只取一次，每轮重算用的是拷贝出来的新 K 线单位
+        if lv_klu_lst is None:
+            lv_klu_lst = self.load_lv_klu_lst()
+        pre_signature = None
+        while True:
+            begin_idx = max(len(lv_klu_lst[0]) - window, 0)
+            self.load_tail(lv_klu_lst, begin_idx)
+            if begin_idx == 0:
+                break
+            signature = self.latest_signature(seg_cnt)
+            if signature is not None and signature == pre_signature:
+                break
+            pre_signature = signature
+            window *= 2
+            # 窗口超过一半数据时再试算省不了多少，直接完整计算
+            if window * 2 > len(lv_klu_lst[0]):
+                window = len(lv_klu_lst[0])
+        self.bind_event_listener()
+        if len(self[0]) == 0:
+            raise CChanException("最高级别没有获得任何数据", ErrCode.NO_DATA)
+        return self
+
+    # 从数据源读取各级别全部 K 线单位
+    def load_lv_klu_lst(self) -> List[List[CKLine_Unit]]:
+        stockapi_cls = self.GetStockAPI()
+        try:
+            stockapi_cls.do_init()
+            return self.read_lv_klu_lst(stockapi_cls)
+        finally:
+            stockapi_cls.do_close()
+
+    # 用已打开的数据API读取各级别全部 K 线单位（CChanBatch 多只股票共用一次数据API的打开和关闭）
+    def read_lv_klu_lst(self, stockapi_cls) -> List[List[CKLine_Unit]]:
+        self.do_init()  # init_lv_klu_iter 跳过非法子级别时会删除 kl_datas 中的级别
+        return [list(klu_iter) for klu_iter in self.init_lv_klu_iter(stockapi_cls)]
+
+    # 从最高级别第 begin_idx 根 K 线开始重新计算，次级别取时间晚于前一根最高级别 K 线的部分
+    def load_tail(self, lv_klu_lst: List[List[CKLine_Unit]], begin_idx: int):
+        self.do_init()
+        # 试算的中间结果不分发事件
+        for kl_list in self.kl_datas.values():
+            kl_list.set_event_listener(None)
+        self.align_report = CKLineAlignReport()
+        self.g_kl_iter = defaultdict(list)
+        self.klu_cache = [None for _ in self.lv_list]
+        self.klu_last_t = [CTime(1980, 1, 1, 0, 0) for _ in self.lv_list]
+        cut_time = lv_klu_lst[0][begin_idx-1].time if begin_idx > 0 else None
+        for lv_idx, klu_lst in enumerate(lv_klu_lst):
+            lv_begin_idx = begin_idx if lv_idx == 0 else 0
+            if lv_idx != 0 and cut_time is not None:
+                lv_begin_idx = bisect_right(klu_lst, cut_time, key=lambda klu: klu.time)
+            self.add_lv_iter(lv_idx, iter([copy_raw_klu(klu, self.lv_list[lv_idx]) for klu in klu_lst[lv_begin_idx:]]))
+        for _ in self.load_iterator(step=False):
+            ...  # 遍历迭代器，执行计算过程
+        if not self.conf.trigger_step:
+            for lv in self.lv_list:
+                self.kl_datas[lv].cal_seg_and_zs()
+
+    # 各级别从倒数第 seg_cnt 个确定线段开始的笔、线段、买卖点，用时间表示以便比较不同窗口的结果
+    # 确定线段不足 seg_cnt 个时返回 None（窗口还不够长）
+    def latest_signature(self, seg_cnt):
+        signature = []
+        for lv_idx in range(len(self.lv_list)):
+            kl_list = self[lv_idx]
+            sure_seg_lst = [seg for seg in kl_list.seg_list if seg.is_sure]
+            if len(sure_seg_lst) < seg_cnt:
+                return None
+            begin_seg = sure_seg_lst[-seg_cnt]
+            signature.append((
+                [line_signature(bi) for bi in kl_list.bi_list[begin_seg.start_bi.idx:]],
+                [line_signature(seg) for seg in kl_list.seg_list[begin_seg.idx:]],
+                [(str(bsp.klu.time), bsp.is_buy, bsp.type2str()) for bsp in kl_list.bs_point_lst.getSortedBspList() if bsp.bi.idx >= begin_seg.start_bi.idx],
+            ))
+        return signature
+
+    # 多级别并行加载（配置 parallel_lv）：先按时间对齐各级别K线，再把各级别分到独立进程中计算，
+    # 最后在主进程恢复链表、挂上父子K线关系；各级别的笔、线段、中枢、买卖点只依赖本级别K线，结果与 load 一致
+    # 计算在子进程中进行，加载过程中不分发事件
+    # lv_klu_lst 为 read_lv_klu_lst 已读取的各级别 K 线，None 时从数据源读取
+    def parallel_load(self, lv_klu_lst: Optional[List[List[CKLine_Unit]]] = None):
+        if lv_klu_lst is None:
+            lv_klu_lst = self.load_lv_klu_lst()
+        lv_klu_lst = self.align_lv_klu(lv_klu_lst)
+        if len(lv_klu_lst[0]) == 0:
+            raise CChanException("最高级别没有获得任何数据", ErrCode.NO_DATA)
+        kl_dict_lst = [[raw_kl_dict(klu) for klu in klu_lst] for klu_lst in lv_klu_lst]
+        # K线最多的级别留在主进程计算，省掉它的序列化，其余级别各开一个进程
+        local_idx = max(range(len(self.lv_list)), key=lambda idx: len(kl_dict_lst[idx]))
+        with ProcessPoolExecutor(max_workers=len(self.lv_list)-1) as executor:
+            future_dict = {
+                idx: executor.submit(cal_kl_list, lv, self.conf, kl_dict_lst[idx])
+                for idx, lv in enumerate(self.lv_list)
+                if idx != local_idx
+            }
+            self.kl_datas[self.lv_list[local_idx]] = build_kl_list(self.lv_list[local_idx], self.conf, kl_dict_lst[local_idx])
+            for idx, future in future_dict.items():
+                self.kl_datas[self.lv_list[idx]] = load_kl_list(future.result(), self.conf)
+        self.link_klu_index()
+        self.bind_event_listener()
+        # 按对齐结果挂上父子关系，被 max_history 淘汰的K线不再关联
+        for lv_idx in range(1, len(self.lv_list)):
+            parent_klu_lst, parent_offset = list(self[lv_idx-1].klu_iter()), self[lv_idx-1].retired_klu_cnt
+            sub_klu_lst, sub_offset = list(self[lv_idx].klu_iter()), self[lv_idx].retired_klu_cnt
+            for raw_parent_klu in lv_klu_lst[lv_idx-1]:
+                if raw_parent_klu.idx < parent_offset:
+                    continue
+                parent_klu = parent_klu_lst[raw_parent_klu.idx - parent_offset]
+                for raw_sub_klu in raw_parent_klu.sub_kl_list:
+                    if raw_sub_klu.idx >= sub_offset:
+                        sub_klu = sub_klu_lst[raw_sub_klu.idx - sub_offset]
+                        self.set_klu_parent_relation(parent_klu, sub_klu)
+                        self[lv_idx-1].klu_index.add_sub_klu(parent_klu.idx, sub_klu.idx)
+
+    # 检查点：把算好的各级别K线列表连同配置、跨级别父子关系序列化，其他进程用 from_checkpoint 还原后可直接绘图、查询，不必重新计算
+    # 序列化期间临时断开链表和事件订阅，结束后恢复，本对象可以继续使用；尚未加入计算的K线（klu_cache、迭代器中的）不保存
+    def dump_checkpoint(self) -> bytes:
+        kl_list_lst = [self[lv_idx] for lv_idx in range(len(self.lv_list))]
+        for kl_list in kl_list_lst:
+            kl_list.set_event_listener(None)
+            kl_list.detach_links()
+        try:
+            return pickle.dumps(
+                (self.code, self.begin_time, self.end_time, self.data_src, self.autype, self.lv_list, self.conf, kl_list_lst),
+                pickle.HIGHEST_PROTOCOL,
+            )
+        finally:
+            for kl_list in kl_list_lst:
+                kl_list.restore_links()
+            self.bind_event_listener()
+
+    @classmethod
+    def from_checkpoint(cls, data: bytes) -> 'CChan':
+        code, begin_time, end_time, data_src, autype, lv_list, conf, kl_list_lst = unpickle_without_gc(pickle.Unpickler(io.BytesIO(data)))
+        chan = cls(code=code, begin_time=begin_time, end_time=end_time, data_src=data_src, lv_list=lv_list, config=conf, autype=autype, autoload=False)
+        for lv, kl_list in zip(lv_list, kl_list_lst):
+            kl_list.restore_links()
+            chan.kl_datas[lv] = kl_list
+        chan.link_klu_index()
+        chan.bind_event_listener()
+        return chan
+
+    # 按 load_iterator 的规则对齐各级别K线（CKLineAligner），只挂父子关系、不加入K线列表，
+    # 父级别K线用完后，剩下的次级别K线与 load 一样留在 klu_cache 和迭代器中；返回各级别参与计算的K线
+    def align_lv_klu(self, lv_klu_lst: List[List[CKLine_Unit]]) -> List[List[CKLine_Unit]]:
+        self.g_kl_iter = defaultdict(list)
+        self.klu_cache = [None for _ in self.lv_list]
+        self.klu_last_t = [CTime(1980, 1, 1, 0, 0) for _ in self.lv_list]
+        for lv_idx, klu_lst in enumerate(lv_klu_lst):
+            self.add_lv_iter(lv_idx, iter(klu_lst))
+        aligner = self.make_aligner()
+        if aligner.bad_idx[0] < len(aligner.klu_lst[0]):
+            self.raise_unsorted(aligner, 0)
+        used_cnt_lst = [aligner.bad_idx[0]]
+        for kline_unit in aligner.klu_lst[0]:
+            self.try_set_klu_idx(0, kline_unit)
+        for lv_idx in range(1, len(self.lv_list)):
+            for parent_idx, parent_klu in enumerate(aligner.klu_lst[lv_idx-1][:used_cnt_lst[-1] or 0]):
+                begin, end = aligner.get_range(lv_idx, parent_idx)
+                for klu_idx in range(begin, end):
+                    kline_unit = aligner.klu_lst[lv_idx][klu_idx]
+                    self.try_set_klu_idx(lv_idx, kline_unit)
+                    self.set_aligned_parent(aligner, lv_idx, klu_idx, parent_klu, parent_idx)
+                if aligner.reach_unsorted(lv_idx, begin, end):
+                    self.raise_unsorted(aligner, lv_idx)
+                self.check_kl_align(parent_klu, lv_idx-1)
+            used_cnt_lst.append(aligner.get_used_cnt(lv_idx, used_cnt_lst[-1] or 0))
+        self.keep_unused_klu(aligner, used_cnt_lst)
+        return [klu_lst[:used_cnt or 0] for klu_lst, used_cnt in zip(aligner.klu_lst, used_cnt_lst)]
+
     # 初始化各级别 K 线单位迭代器
     def init_lv_klu_iter(self, stockapi_cls):
         # 用于存储各级别 K 线单位迭代器
@@ -244,6 +478,7 @@ class CChan:
                 raise e
         # 更新类中的级别列表为有效级别列表
         self.lv_list = valid_lv_list
+        self.link_klu_index()
         # 返回各级别 K 线单位迭代器列表
         return lv_klu_iter
 
@@ -286,51 +521,55 @@ class CChan:
         try:
             # 初始化数据API
             stockapi_cls.do_init()
-            # 初始化各级别 K 线单位迭代器并添加到 g_kl_iter
-            for lv_idx, klu_iter in enumerate(self.init_lv_klu_iter(stockapi_cls)):
-                self.add_lv_iter(lv_idx, klu_iter)
-            # 初始化 K 线单位缓存和上次时间
-            # klu_cache：
-            #   - 用途 ：在递归加载多级别K线时，用于临时存储当前处理层级的K线单元
-            #   - 存储数据 ：每个层级的最后一个未完成处理的CKLine_Unit对象
-            #   - 作用场景 ：当处理父级别K线时，如果子级别K线的时间超过父级K线时间，会将当前子级K线暂存，待父级处理完成后再继续处理
-            self.klu_cache: List[Optional[CKLine_Unit]] = [None for _ in self.lv_list]
-            # - 用途 ：跟踪记录每个K线层级最后处理的时间戳
-            # - 存储数据 ：每个层级最后处理的K线时间（CTime对象）
-            # - 核心作用 ：
-            #   - 确保K线时间的单调递增性（通过 kline_unit.time > self.klu_last_t[lv_idx] 校验）
-            #   - 防止K线时间倒流导致的分析错误
-            #   - 跨级别时间对齐检查的基础参照
-            self.klu_last_t = [CTime(1980, 1, 1, 0, 0) for _ in self.lv_list]
-
-            # 调用 load_iterator 从最高级别开始计算，返回迭代器
-            yield from self.load_iterator(lv_idx=0, parent_klu=None, step=step)  # 计算入口
-            # 如果不是回放模式，在所有数据计算完之后一次性计算所有级别中枢和线段
-            if not step:
-                for lv in self.lv_list:
-                    self.kl_datas[lv].cal_seg_and_zs()
-        except Exception:
-            # 发生异常时关闭数据API并重新抛出异常
-            stockapi_cls.do_close()
-            raise
+            # 初始化各级别 K 线单位迭代器，从最高级别开始计算
+            yield from self.load_lv_klu_iter(self.init_lv_klu_iter(stockapi_cls), step)
         finally:
             # 无论是否发生异常，最终都会关闭数据API
             stockapi_cls.do_close()
+
+    # 用各级别 K 线单位迭代器（或已读取的列表）计算，不负责数据API的打开和关闭
+    def load_lv_klu_iter(self, lv_klu_iter: Iterable[Iterable[CKLine_Unit]], step=False):
+        # 各级别 K 线单位迭代器添加到 g_kl_iter
+        for lv_idx, klu_iter in enumerate(lv_klu_iter):
+            self.add_lv_iter(lv_idx, iter(klu_iter))
+        # 初始化 K 线单位缓存和上次时间
+        # klu_cache：
+        #   - 用途 ：对齐多级别K线后，用于临时存储各层级已读取但还没用到的K线单元
+        #   - 存储数据 ：每个层级的最后一个未完成处理的CKLine_Unit对象
+        #   - 作用场景 ：子级别K线的时间超过父级别最后一根K线时间时暂存，等下次 trigger_load 有新的父级别K线再继续处理
+        self.klu_cache: List[Optional[CKLine_Unit]] = [None for _ in self.lv_list]
+        # - 用途 ：跟踪记录每个K线层级最后处理的时间戳
+        # - 存储数据 ：每个层级最后处理的K线时间（CTime对象）
+        # - 核心作用 ：
+        #   - 确保K线时间的单调递增性（通过 kline_unit.time > self.klu_last_t[lv_idx] 校验）
+        #   - 防止K线时间倒流导致的分析错误
+        #   - 跨级别时间对齐检查的基础参照
+        self.klu_last_t = [CTime(1980, 1, 1, 0, 0) for _ in self.lv_list]
+
+        # 调用 load_iterator 从最高级别开始计算，返回迭代器
+        yield from self.load_iterator(step=step)  # 计算入口
+        # 如果不是回放模式，在所有数据计算完之后一次性计算所有级别中枢和线段
+        if not step:
+            for lv in self.lv_list:
+                self.kl_datas[lv].cal_seg_and_zs()
         # 如果最高级别没有获得任何数据，抛出异常
         if len(self[0]) == 0:
             raise CChanException("最高级别没有获得任何数据", ErrCode.NO_DATA)
 
     # 设置 K 线单位的父子关系
-    def set_klu_parent_relation(self, parent_klu, kline_unit, cur_lv, lv_idx):
-        # 如果开启 K 线数据检查，且当前级别和父级别都小于等于日线级别
-        if self.conf.kl_data_check and kltype_lte_day(cur_lv) and kltype_lte_day(self.lv_list[lv_idx-1]):
-            # 检查父子级别 K 线时间是否一致
-            self.check_kl_consitent(parent_klu, kline_unit)
+    def set_klu_parent_relation(self, parent_klu, kline_unit):
         # 将当前 K 线单位添加到父 K 线单位的子节点列表
         parent_klu.add_children(kline_unit)
         # 设置当前 K 线单位的父节点
         kline_unit.set_parent(parent_klu)
 
+    # 按对齐结果设置父子关系，日期不一致的（只在开启 K 线数据检查且父子级别都不超过日线时检查）记入对齐报告
+    def set_aligned_parent(self, aligner: CKLineAligner, lv_idx, klu_idx, parent_klu, parent_idx):
+        kline_unit = aligner.klu_lst[lv_idx][klu_idx]
+        if aligner.is_inconsistent(lv_idx, parent_idx, klu_idx):
+            self.add_kl_inconsistent(parent_klu, kline_unit)
+        self.set_klu_parent_relation(parent_klu, kline_unit)
+
     # 向当前级别的 K 线列表添加新的 K 线单位
     def add_new_kl(self, cur_lv: KL_TYPE, kline_unit):
         try:
@@ -342,111 +581,145 @@ class CChan:
                 print(f"[ERROR-{self.code}]在计算{kline_unit.time}K线时发生错误!")
             raise
 
+    # 处理各级别暂存的 K 线单位（load_iterator 非回放模式）
+    def flush_klu_batch(self):
+        for lv in self.lv_list:
+            try:
+                self.kl_datas[lv].flush_klu_batch()
+            except Exception:
+                # 批量处理时不知道具体是哪一根，打印已合并到的位置
+                if self.conf.print_err_time:
+                    last_klc = self.kl_datas[lv].lst[-1] if len(self.kl_datas[lv]) > 0 else None
+                    print(f"[ERROR-{self.code}]在计算{lv}级别{last_klc[-1].time if last_klc else ''}附近的K线时发生错误!")
+                raise
+
     # 尝试设置 K 线单位的索引
     def try_set_klu_idx(self, lv_idx: int, kline_unit: CKLine_Unit):
-        # 如果 K 线单位索引已经设置，直接返回
+        # 如果 K 线单位索引已经设置（数据源按序号设置），扣除该级别已淘汰的 K 线数后返回
         if kline_unit.idx >= 0:
+            if self[lv_idx].retired_klu_cnt:
+                kline_unit.set_idx(kline_unit.idx - self[lv_idx].retired_klu_cnt)
             return
-        # 如果当前级别还没有 K 线单位，设置索引为 0
-        if len(self[lv_idx]) == 0:
-            kline_unit.set_idx(0)
+        # 否则按当前级别已加入的 K 线单位数设置（跨级别索引每根一行，批量合并时 K 线列表还没更新，索引已经更新）
+        kline_unit.set_idx(len(self[lv_idx].klu_index))
+
+    # 取出各级别待加入的全部 K 线单位，按时间戳一次算出每根父级别 K 线对应的次级别区间
+    def make_aligner(self) -> CKLineAligner:
+        cached_lst = [0 if klu is None else 1 for klu in self.klu_cache]
+        # 父子级别都不超过日线时才检查日期是否一致
+        check_day_lst = [
+            lv_idx > 0 and self.conf.kl_data_check and kltype_lte_day(lv) and kltype_lte_day(self.lv_list[lv_idx-1])
+            for lv_idx, lv in enumerate(self.lv_list)
+        ]
+        return CKLineAligner(
+            [self.pop_lv_klu_lst(lv_idx) for lv_idx in range(len(self.lv_list))],
+            [t.ts for t in self.klu_last_t],
+            cached_lst,
+            check_day_lst,
+        )
+
+    # 加载和计算 K 线单位的迭代器方法
+    # K线时间天级别以下描述的是结束时间，如60M线，每天第一根是10点30的；天以上是当天日期
+    # 对齐区间由 make_aligner 一次算好，加入顺序与逐根到达一致：父级别 K 线在前，随后是归属于它的次级别 K 线（逐级展开）
+    # 对齐诊断信息记入 self.align_report，结束时汇总打印
+    def load_iterator(self, step):
+        aligner = self.make_aligner()
+        # 非回放模式不需要中间结果，各级别的 K 线合并、分型、笔留到最后一次处理（CKLine_List.begin_klu_batch）
+        if not step:
+            for lv in self.lv_list:
+                self.kl_datas[lv].begin_klu_batch()
+        try:
+            for klu_idx in range(aligner.bad_idx[0]):
+                self.add_aligned_klu(aligner, 0, klu_idx, None, -1)
+                # 如果是回放模式，每加入一根最高级别 K 线计算一次中枢和线段，并返回当前对象
+                if step:
+                    self.kl_datas[self.lv_list[0]].cal_seg_and_zs()
+                    yield self
+            if aligner.bad_idx[0] < len(aligner.klu_lst[0]):
+                self.raise_unsorted(aligner, 0)
+            used_cnt_lst = [aligner.bad_idx[0]]
+            for lv_idx in range(1, len(self.lv_list)):
+                used_cnt_lst.append(aligner.get_used_cnt(lv_idx, used_cnt_lst[-1] or 0))
+            self.keep_unused_klu(aligner, used_cnt_lst)
+        finally:
+            self.flush_klu_batch()
+            if self.conf.print_warning:
+                for warning in self.align_report.pop_warning_lst(self.code):
+                    print(warning)
+
+    # 加入第 lv_idx 级别第 klu_idx 根 K 线，再依次加入归属于它的次级别 K 线
+    def add_aligned_klu(self, aligner: CKLineAligner, lv_idx, klu_idx, parent_klu, parent_idx):
+        kline_unit = aligner.klu_lst[lv_idx][klu_idx]
+        self.try_set_klu_idx(lv_idx, kline_unit)
+        if klu_idx > 0:
+            pre_klu = aligner.klu_lst[lv_idx][klu_idx-1]
         else:
-            # 否则，设置索引为当前级别最后一个 K 线单位的索引 + 1
-            self.kl_datas[self.lv_list[lv_idx]][-1][-1].idx # This line seems redundant, access last klu
-            kline_unit.set_idx(self[lv_idx][-1][-1].idx + 1) # Corrected line
-
-    # 加载和计算 K 线单位的迭代器方法 (递归调用处理多级别)
-    def load_iterator(self, lv_idx, parent_klu, step):
-        # K线时间天级别以下描述的是结束时间，如60M线，每天第一根是10点30的
-        # 天以上是当天日期
-        # 获取当前处理的 K 线级别
-        cur_lv = self.lv_list[lv_idx]
-        # 获取当前级别上一个 K 线单位 (如果存在)
-        # 这实际是三次__getitem__方法的链式调用：
-        # - 第一次： self[lv_idx] → 返回CKLine_List对象
-        # - 第二次： CKLine_List[-1] → 返回最后一个K线容器（CKLine_Container）
-        # - 第三次： CKLine_Container[-1] → 返回容器中的最后一个K线单元（CKLine_Unit）
-        pre_klu = self[lv_idx][-1][-1] if len(self[lv_idx]) > 0 and len(self[lv_idx][-1]) > 0 else None
-
-        # 循环处理当前级别的 K 线单位
-        while True:
-            # 如果 K 线单位缓存中存在当前级别的 K 线单位，使用缓存中的
-            if self.klu_cache[lv_idx]:
-                kline_unit = self.klu_cache[lv_idx]
-                assert kline_unit is not None
-                self.klu_cache[lv_idx] = None # 清空缓存
-            else:
-                try:
-                    # 从当前级别的数据迭代器中获取下一个 K 线单位
-                    kline_unit = self.get_next_lv_klu(lv_idx)
-                    # 尝试设置 K 线单位的索引
-                    self.try_set_klu_idx(lv_idx, kline_unit)
-                    # 检查 K 线单位时间是否单调递增
-                    if not kline_unit.time > self.klu_last_t[lv_idx]:
-                        raise CChanException(f"kline time err, cur={kline_unit.time}, last={self.klu_last_t[lv_idx]}, or refer to quick_guide.md, try set auto=False in the CTime returned by your data source class", ErrCode.KL_NOT_MONOTONOUS)
-                    # 更新当前级别的上次时间
-                    self.klu_last_t[lv_idx] = kline_unit.time
-                except StopIteration:
-                    # 如果当前级别的 K 线单位耗尽，跳出循环
-                    break
-
-            # 如果存在父 K 线单位，且当前 K 线单位时间晚于父 K 线单位时间
-            if parent_klu and kline_unit.time > parent_klu.time:
-                # 将当前 K 线单位放入缓存，并在父 K 线单位处理完成后再处理
+            pre_klu = self[lv_idx][-1][-1] if len(self[lv_idx]) > 0 and len(self[lv_idx][-1]) > 0 else None
+        kline_unit.set_pre_klu(pre_klu)
+        self.add_new_kl(self.lv_list[lv_idx], kline_unit)
+        if parent_klu:
+            self.set_aligned_parent(aligner, lv_idx, klu_idx, parent_klu, parent_idx)
+            self[lv_idx-1].klu_index.add_sub_klu(parent_klu.idx, kline_unit.idx)
+        if lv_idx != len(self.lv_list)-1:
+            begin, end = aligner.get_range(lv_idx+1, klu_idx)
+            for sub_idx in range(begin, end):
+                self.add_aligned_klu(aligner, lv_idx+1, sub_idx, kline_unit, klu_idx)
+            if aligner.reach_unsorted(lv_idx+1, begin, end):
+                self.raise_unsorted(aligner, lv_idx+1)
+            # 检查父子级别 K 线单位数量是否对齐
+            self.check_kl_align(kline_unit, lv_idx)
+
+    # 对齐后没用到的 K 线：与逐根加载一样，已读取的第一根放入 klu_cache，其余放回迭代器，留给下次 trigger_load
+    # used_cnt_lst 为各级别用掉的 K 线数，None 表示父级别一根都没用到、本级别还没读取过
+    def keep_unused_klu(self, aligner: CKLineAligner, used_cnt_lst: List[Optional[int]]):
+        for lv_idx, (klu_lst, used_cnt) in enumerate(zip(aligner.klu_lst, used_cnt_lst)):
+            cached = aligner.cached_lst[lv_idx]
+            if used_cnt is None:
+                self.klu_cache[lv_idx] = klu_lst[0] if cached else None
+                if len(klu_lst) > cached:
+                    self.add_lv_iter(lv_idx, iter(klu_lst[cached:]))
+                continue
+            if used_cnt < len(klu_lst):
+                # 缓存的 K 线到真正加入时才设置索引，期间本级别可能淘汰历史（max_history），提前设置的序号会错位
+                kline_unit = klu_lst[used_cnt]
                 self.klu_cache[lv_idx] = kline_unit
-                break # 跳出循环，等待父 K 线单位处理完成
-
-            # 设置当前 K 线单位的上一个 K 线单位
-            kline_unit.set_pre_klu(pre_klu)
-            # 更新 pre_klu 为当前 K 线单位
-            pre_klu = kline_unit
-            # 将新的 K 线单位添加到当前级别的 K 线列表
-            self.add_new_kl(cur_lv, kline_unit)
-            # 如果存在父 K 线单位，设置父子关系
-            if parent_klu:
-                self.set_klu_parent_relation(parent_klu, kline_unit, cur_lv, lv_idx)
-            # 如果当前级别不是最低级别
-            if lv_idx != len(self.lv_list)-1:
-                # 递归调用 load_iterator 处理下一个级别，父 K 线单位为当前 K 线单位
-                for _ in self.load_iterator(lv_idx+1, kline_unit, step):
-                    ... # 遍历迭代器，执行计算过程
-                # 检查父子级别 K 线单位数量是否对齐
-                self.check_kl_align(kline_unit, lv_idx)
-            # 如果是最高级别且在回放模式下
-            if lv_idx == 0 and step:
-                # 计算当前 K 线单位所在 K 线列表的中枢和线段 (回放模式下每步计算)
-                self.kl_datas[cur_lv].cal_seg_and_zs()
-                # 返回当前对象的快照
-                yield self
-
-    # 检查父子级别 K 线时间一致性
-    def check_kl_consitent(self, parent_klu, sub_klu):
-        # 如果父级别 K 线单位和子级别 K 线单位的年、月、日不一致
-        if parent_klu.time.year != sub_klu.time.year or \
-           parent_klu.time.month != sub_klu.time.month or \
-           parent_klu.time.day != sub_klu.time.day:
-            # 记录不一致的详细信息
-            self.kl_inconsistent_detail[str(parent_klu.time)].append(sub_klu.time)
-            # 如果配置开启警告打印，打印警告信息
-            if self.conf.print_warning:
-                print(f"[WARNING-{self.code}]父级别时间是{parent_klu.time}，次级别时间却是{sub_klu.time}")
-            # 如果不一致条数超过最大限制，抛出异常
-            if len(self.kl_inconsistent_detail) >= self.conf.max_kl_inconsistent_cnt:
-                raise CChanException(f"父&子级别K线时间不一致条数超过{self.conf.max_kl_inconsistent_cnt}！！", ErrCode.KL_TIME_INCONSISTENT)
+                if used_cnt+1 < len(klu_lst):
+                    self.add_lv_iter(lv_idx, iter(klu_lst[used_cnt+1:]))
+                self.klu_last_t[lv_idx] = kline_unit.time
+            elif used_cnt > 0:
+                self.klu_last_t[lv_idx] = klu_lst[used_cnt-1].time
+
+    # 读到时间不单调递增的 K 线时报错
+    def raise_unsorted(self, aligner: CKLineAligner, lv_idx):
+        klu_lst, bad_idx = aligner.klu_lst[lv_idx], aligner.bad_idx[lv_idx]
+        last_t = klu_lst[bad_idx-1].time if bad_idx > 0 else self.klu_last_t[lv_idx]
+        raise CChanException(f"kline time err, cur={klu_lst[bad_idx].time}, last={last_t}, or refer to quick_guide.md, try set auto=False in the CTime returned by your data source class", ErrCode.KL_NOT_MONOTONOUS)
+
+    # 记录父子级别 K 线日期不一致
+    def add_kl_inconsistent(self, parent_klu, sub_klu):
+        self.align_report.add_inconsistent(parent_klu, sub_klu)
+        # 如果不一致条数超过最大限制，抛出异常
+        if len(self.align_report.inconsistent_detail) >= self.conf.max_kl_inconsistent_cnt:
+            raise CChanException(f"父&子级别K线时间不一致条数超过{self.conf.max_kl_inconsistent_cnt}！！", ErrCode.KL_TIME_INCONSISTENT)
 
     # 检查父子级别 K 线数量对齐
     def check_kl_align(self, kline_unit, lv_idx):
         # 如果开启 K 线数据检查，且当前 K 线单位没有子 K 线单位
         if self.conf.kl_data_check and len(kline_unit.sub_kl_list) == 0:
-            # K 线未对齐计数加一
-            self.kl_misalign_cnt += 1
-            # 如果配置开启警告打印，打印警告信息
-            if self.conf.print_warning:
-                print(f"[WARNING-{self.code}]当前{kline_unit.time}没在次级别{self.lv_list[lv_idx+1]}找到K线！！")
+            self.align_report.add_misalign(kline_unit, self.lv_list[lv_idx+1])
             # 如果未对齐条数超过最大限制，抛出异常
-            if self.kl_misalign_cnt >= self.conf.max_kl_misalgin_cnt:
+            if self.align_report.misalign_cnt >= self.conf.max_kl_misalgin_cnt:
                 raise CChanException(f"在次级别找不到K线条数超过{self.conf.max_kl_misalgin_cnt}！！", ErrCode.KL_DATA_NOT_ALIGN)
 
+    # 兼容旧的属性名
+    @property
+    def kl_misalign_cnt(self):
+        return self.align_report.misalign_cnt
+
+    @property
+    def kl_inconsistent_detail(self):
+        return self.align_report.inconsistent_detail
+
     # 实现按索引或级别类型访问 K 线列表
     def __getitem__(self, n) -> CKLine_List:
         # 如果 n 是 K 线类型，直接返回对应的 K 线列表
@@ -474,4 +747,16 @@ class CChan:
         """根据股票代码获取股票名称"""
         file_operator = FileOperator()
         name = file_operator.get_name_by_code(self.code)
-        return name
\ No newline at end of file
+        return name
+
+
+# 用原始数据构造新的 K 线单位，序号在加入时重新分配
+def copy_raw_klu(klu: CKLine_Unit, kl_type: KL_TYPE) -> CKLine_Unit:
+    new_klu = CKLine_Unit(raw_kl_dict(klu))
+    new_klu.kl_type = kl_type
+    return new_klu
+
+
+# 笔/线段的起止时间、方向和是否确定
+def line_signature(line):
+    return str(line.get_begin_klu().time), str(line.get_end_klu().time), line.dir, line.is_sure
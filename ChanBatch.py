@@ -0,0 +1,199 @@
+import heapq
+import time
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+from Chan import CChan
+from ChanConfig import CChanConfig
+from ChanSnapshot import CChanSnapshot
+from Common.CEnum import AUTYPE, DATA_SRC, KL_TYPE
+from KLine.KLine_Combine import cal_combine_columns
+from KLine.KLine_Unit import CKLine_Unit
+from Math.MetricColumns import CMetricColumns, is_float_column, restore_models
+
+ChunkType = List[Tuple[str, List[List[CKLine_Unit]]]]
+
+
+class CChanBatch:
+    """
+    同一份配置、同一组级别下批量计算多只股票：数据API只打开、关闭一次，每只股票仍是独立的 CChan
+    单只股票出错（数据缺失、K线异常等）不影响其他股票，错误记在 err_dict 中，该股票不再出现在结果里
+    非回放模式构造时即计算全部股票（autoload=False 时不计算）；回放模式用 step_load 按时间顺序交替推进各股票；
+    只关心最新状态时用 latest_state 逐只只算尾部窗口
+    每读完 batch_size 只股票，同一级别的K线按 (股票, K线) 排成二维数组，一起算 MACD、均线、布林线等指标和K线合并（非回放模式），
+    结果预置到各股票的 CKLine_List 中，之后各股票照常逐只加载，笔、线段、中枢、买卖点仍由各自的 CChan 计算
+    """
+
+    def __init__(
+        self,
+        codes: Iterable[str],
+        begin_time=None,
+        end_time=None,
+        data_src: Union[DATA_SRC, str] = DATA_SRC.BAO_STOCK,
+        lv_list: Optional[List[KL_TYPE]] = None,
+        config: Optional[CChanConfig] = None,
+        autype: AUTYPE = AUTYPE.QFQ,
+        batch_size: int = 100,
+        read_interval: float = 0,
+        autoload: bool = True,
+    ):
+        if config is None:
+            config = CChanConfig()
+        self.conf = config
+        self.batch_size = batch_size  # 按列计算的股票数，越大 numpy 的每步开销分摊得越开，二维数组占用的内存也越大
+        self.read_interval = read_interval  # 每读取一只股票后等待的秒数，用于数据源限频
+        self.chan_dict: Dict[str, CChan] = {
+            code: CChan(
+                code=code,
+                begin_time=begin_time,
+                end_time=end_time,
+                data_src=data_src,
+                lv_list=None if lv_list is None else list(lv_list),  # init_lv_klu_iter 会改写级别列表，各股票不能共用
+                config=config,
+                autype=autype,
+                autoload=False,
+            )
+            for code in codes
+        }
+        self.err_dict: Dict[str, Exception] = {}  # 出错的股票及异常
+
+        if not config.trigger_step and autoload:
+            self.load()
+
+    def __getitem__(self, code) -> CChan:
+        return self.chan_dict[code]
+
+    def __iter__(self):
+        yield from self.chan_dict.items()
+
+    def __len__(self):
+        return len(self.chan_dict)
+
+    def load(self):
+        """非回放模式：每读完一批股票，按列算好指标和K线合并，再逐只计算"""
+        assert not self.conf.trigger_step
+        for chunk in self.read_chunk():
+            self.preset_columns(chunk)
+            for code, lv_klu_lst in chunk:
+                try:
+                    self.load_chan(self.chan_dict[code], lv_klu_lst)
+                except Exception as e:
+                    self.set_err(code, e)
+                    continue
+                self.restore_metric_models(code)
+
+    def load_chan(self, chan: CChan, lv_klu_lst: List[List[CKLine_Unit]]):
+        if self.conf.parallel_lv and len(chan.lv_list) > 1:
+            chan.parallel_load(lv_klu_lst)
+        else:
+            for _ in chan.load_lv_klu_iter(lv_klu_lst, step=False):
+                ...
+
+    def step_load(self, view=False) -> Iterable[Tuple[str, Union[CChan, CChanSnapshot]]]:
+        """
+        回放模式：先读取全部股票的数据，再按最高级别K线时间交替推进，每步返回 (code, 该股票的 CChan 或快照)
+        各股票自身的返回与 CChan.step_load 一致（含 skip_step）；时间相同时按 codes 的顺序
+        view=False 时返回的 CChan 会被该股票的下一步修改，需要保留时用 view=True
+        """
+        assert self.conf.trigger_step
+        step_iter_lst = []
+        for chunk in self.read_chunk():
+            self.preset_columns(chunk)  # 回放逐根合并K线，只预置指标
+            step_iter_lst.extend(self.step_iter(code, lv_klu_lst, view) for code, lv_klu_lst in chunk)
+        for _, code, snapshot in heapq.merge(*step_iter_lst, key=lambda item: item[0]):
+            yield code, snapshot
+
+    def step_iter(self, code, lv_klu_lst: List[List[CKLine_Unit]], view):
+        # 单只股票的回放，返回 (最高级别最后一根K线的时间戳, code, 快照)，出错时记录并结束这只股票
+        chan = self.chan_dict[code]
+        try:
+            for snapshot in chan.step_iter(chan.load_lv_klu_iter(lv_klu_lst, step=True), view):
+                yield last_klu_ts(snapshot), code, snapshot
+        except Exception as e:
+            self.set_err(code, e)
+            return
+        self.restore_metric_models(code)
+
+    def latest_state(self, window=500, seg_cnt=3) -> Iterable[Tuple[str, CChan]]:
+        """
+        逐只调用 CChan.latest_state，只算尾部窗口，算完一只返回一只 (code, CChan)；非回放模式构造时要传 autoload=False
+        窗口每轮从新拷贝的K线开始计算，与批量预置的序列对不上，所以不按列计算指标、K线合并
+        """
+        for chunk in self.read_chunk():
+            for code, lv_klu_lst in chunk:
+                try:
+                    chan = self.chan_dict[code].latest_state(window, seg_cnt, lv_klu_lst)
+                except Exception as e:
+                    self.set_err(code, e)
+                    continue
+                yield code, chan
+
+    def read_chunk(self) -> Iterable[ChunkType]:
+        """共用一次数据API打开、关闭，逐只读取各级别K线，每 batch_size 只返回一批"""
+        if len(self.chan_dict) == 0:
+            return
+        stockapi_cls = next(iter(self.chan_dict.values())).GetStockAPI()
+        chunk: ChunkType = []
+        try:
+            stockapi_cls.do_init()
+            for code, chan in list(self.chan_dict.items()):
+                try:
+                    chunk.append((code, chan.read_lv_klu_lst(stockapi_cls)))
+                except Exception as e:
+                    self.set_err(code, e)
+                if self.read_interval > 0:
+                    time.sleep(self.read_interval)
+                if len(chunk) >= self.batch_size:
+                    yield chunk
+                    chunk = []
+        finally:
+            stockapi_cls.do_close()
+        if chunk:
+            yield chunk
+
+    def preset_columns(self, chunk: ChunkType):
+        """
+        同一批股票按级别分组（跳过非法子级别后各股票的级别可能不同），每个级别一起计算后预置到各股票的 CKLine_List：
+        指标只对收盘价都是 float 的股票按列计算，非回放模式再预置K线合并结果；parallel_lv 在子进程中重建 CKLine_List，不预置
+        """
+        if self.conf.parallel_lv:
+            return
+        lv_klu_dict: Dict[KL_TYPE, List[Tuple[str, List[CKLine_Unit]]]] = defaultdict(list)
+        for code, lv_klu_lst in chunk:
+            for lv, klu_lst in zip(self.chan_dict[code].lv_list, lv_klu_lst):
+                lv_klu_dict[lv].append((code, klu_lst))
+        for lv, code_klu_lst in lv_klu_dict.items():
+            close_lst_lst = [[klu.close for klu in klu_lst] for _, klu_lst in code_klu_lst]
+            metric_idx_lst = [idx for idx, close_lst in enumerate(close_lst_lst) if is_float_column(close_lst)]
+            kl_list_lst = [self.chan_dict[code][lv] for code, _ in code_klu_lst]
+            metric_columns = CMetricColumns([close_lst_lst[idx] for idx in metric_idx_lst])
+            model_lst_lst = metric_columns.preset_models([kl_list_lst[idx].metric_model_lst for idx in metric_idx_lst])
+            for idx, model_lst in zip(metric_idx_lst, model_lst_lst):
+                kl_list_lst[idx].metric_model_lst = model_lst
+            if self.conf.trigger_step:
+                continue
+            combine_res_lst = cal_combine_columns(
+                [[klu.high for klu in klu_lst] for _, klu_lst in code_klu_lst],
+                [[klu.low for klu in klu_lst] for _, klu_lst in code_klu_lst],
+            )
+            for kl_list, (_, klu_lst), combine_res in zip(kl_list_lst, code_klu_lst, combine_res_lst):
+                if combine_res is not None and klu_lst:
+                    kl_list.combine_preset = (klu_lst, combine_res)
+
+    def restore_metric_models(self, code):
+        # 算完后换回普通的指标模型，释放预置的序列
+        chan = self.chan_dict[code]
+        for lv in chan.lv_list:
+            chan.kl_datas[lv].metric_model_lst = restore_models(chan.kl_datas[lv].metric_model_lst)
+
+    def set_err(self, code, e: Exception):
+        if self.conf.print_err_time:
+            print(f"[ERROR-{code}]{type(e).__name__}: {e}")
+        self.err_dict[code] = e
+        del self.chan_dict[code]
+
+
+def last_klu_ts(chan: Union[CChan, CChanSnapshot]) -> float:
+    if len(chan[0]) == 0:
+        return float("-inf")
+    return chan[0][-1][-1].time.ts
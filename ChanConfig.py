@@ -51,6 +51,13 @@ class CChanConfig:
         # 系统运行配置
         self.trigger_step = conf.get("trigger_step", False)  # 是否逐步触发模式
         self.skip_step = conf.get("skip_step", 0)  # 跳过的初始步数
+        self.max_history = conf.get("max_history", 0)  # 只保留最近多少个确定线段及其之后的结构，0表示不淘汰历史
+        if 0 < self.max_history < 3:
+            # 买卖点计算会回看最后确定线段的前一个线段和前两笔，窗口太小结果会变
+            raise CChanException(f"max_history={self.max_history} should be 0 or >= 3", ErrCode.PARA_ERROR)
+        self.parallel_lv = conf.get("parallel_lv", False)  # 多级别时每个级别在独立进程中计算，只支持非逐步模式
+        if self.parallel_lv and self.trigger_step:
+            raise CChanException("parallel_lv is not supported when trigger_step=True", ErrCode.PARA_ERROR)
 
         # 数据校验配置
         self.kl_data_check = conf.get("kl_data_check", True)  # 是否检查K线数据
@@ -0,0 +1,22 @@
+from typing import Optional
+
+from BuySellPoint.BS_Point import CBS_Point
+from Common.CEnum import CHAN_EVENT, KL_TYPE
+
+
+class CChanEvent:
+    """CChan 计算过程中产生的结构化事件，通过 CChan.add_event_listener 订阅"""
+
+    def __init__(self, event_type: CHAN_EVENT, kl_type: KL_TYPE, obj, is_seg: bool):
+        self.type = event_type  # 事件类型
+        self.kl_type = kl_type  # 所在级别
+        self.is_seg = is_seg  # 是否来自线段买卖点列表
+        if isinstance(obj, CBS_Point):
+            self.bsp: Optional[CBS_Point] = obj  # 买卖点事件对应的买卖点
+            self.line = obj.bi  # 买卖点所基于的笔/线段
+        else:
+            self.bsp = None
+            self.line = obj  # 笔/线段确定事件对应的笔/线段
+
+    def __str__(self):
+        return f"{self.type.name} {self.kl_type.name} line={self.line.idx} bsp={self.bsp.type2str() if self.bsp else None}"
@@ -0,0 +1,115 @@
+import copyreg
+import gc
+import io
+import pickle
+from typing import Dict, List
+
+from ChanConfig import CChanConfig
+from Common.CEnum import DATA_FIELD, KL_TYPE
+from Common.ChanException import CChanException, ErrCode
+from KLine.KLine_List import CKLine_List
+from KLine.KLine_Unit import CKLine_Unit
+
+
+class CConfPickler(pickle.Pickler):
+    """序列化 CKLine_List 时配置对象只记名字，接收方换成自己的配置，各级别仍共享同一份配置"""
+
+    def __init__(self, file, conf: CChanConfig):
+        super(CConfPickler, self).__init__(file, pickle.HIGHEST_PROTOCOL)
+        conf_name_dict = get_conf_name_dict(conf)
+
+        def reduce_conf(obj):
+            if id(obj) in conf_name_dict:
+                return load_conf_attr, (conf_name_dict[id(obj)],)
+            return obj.__reduce_ex__(pickle.HIGHEST_PROTOCOL)
+
+        # 按类型分派只对配置类生效，比逐个对象回调 persistent_id 快得多
+        self.dispatch_table = copyreg.dispatch_table.copy()
+        for name in conf_name_dict.values():
+            self.dispatch_table[type(getattr(conf, name) if name else conf)] = reduce_conf
+
+
+class CConfUnpickler(pickle.Unpickler):
+    def __init__(self, file, conf: CChanConfig):
+        super(CConfUnpickler, self).__init__(file)
+        self.conf = conf
+
+    def find_class(self, module, name):
+        if module == load_conf_attr.__module__ and name == load_conf_attr.__name__:
+            return self.load_conf_attr
+        return super(CConfUnpickler, self).find_class(module, name)
+
+    def load_conf_attr(self, name: str):
+        return getattr(self.conf, name) if name else self.conf
+
+
+def load_conf_attr(name: str):
+    raise CChanException(f"conf attr {name} should be loaded by CConfUnpickler", ErrCode.COMMON_ERROR)
+
+
+def get_conf_name_dict(conf: CChanConfig) -> Dict[int, str]:
+    # 配置本身记为空串，子配置（笔、线段、中枢、买卖点配置）记为属性名；数值、字符串、列表、字典只在配置内部使用，不处理
+    res = {id(conf): ""}
+    for name, value in conf.__dict__.items():
+        if type(value).__module__ != "builtins":
+            res[id(value)] = name
+    return res
+
+
+def raw_kl_dict(klu: CKLine_Unit) -> dict:
+    """K线单元的原始数据，可以用来构造新的 CKLine_Unit"""
+    kl_dict = {
+        DATA_FIELD.FIELD_TIME: klu.time,
+        DATA_FIELD.FIELD_OPEN: klu.open,
+        DATA_FIELD.FIELD_HIGH: klu.high,
+        DATA_FIELD.FIELD_LOW: klu.low,
+        DATA_FIELD.FIELD_CLOSE: klu.close,
+    }
+    kl_dict.update(klu.trade_info.metric)
+    return kl_dict
+
+
+def build_kl_list(kl_type: KL_TYPE, conf: CChanConfig, kl_dict_lst: List[dict]) -> CKLine_List:
+    """与 CChan.load 非回放模式一样逐根加入K线，最后计算线段、中枢、买卖点"""
+    kl_list = CKLine_List(kl_type, conf)
+    kl_list.begin_klu_batch()
+    pre_klu = None
+    for idx, kl_dict in enumerate(kl_dict_lst):
+        klu = CKLine_Unit(kl_dict)
+        klu.set_idx(idx)
+        klu.kl_type = kl_type
+        klu.set_pre_klu(pre_klu)
+        pre_klu = klu
+        kl_list.add_single_klu(klu)
+    kl_list.flush_klu_batch()
+    kl_list.cal_seg_and_zs()
+    return kl_list
+
+
+def cal_kl_list(kl_type: KL_TYPE, conf: CChanConfig, kl_dict_lst: List[dict]) -> bytes:
+    """
+    子进程中计算单个级别，返回断开链表后序列化的 CKLine_List，用 load_kl_list 还原
+    """
+    kl_list = build_kl_list(kl_type, conf, kl_dict_lst)
+    kl_list.detach_links()
+    buf = io.BytesIO()
+    CConfPickler(buf, conf).dump(kl_list)
+    return buf.getvalue()
+
+
+def load_kl_list(data: bytes, conf: CChanConfig) -> CKLine_List:
+    """还原 cal_kl_list 的结果，配置换成 conf 并恢复链表"""
+    kl_list: CKLine_List = unpickle_without_gc(CConfUnpickler(io.BytesIO(data), conf))
+    kl_list.restore_links()
+    return kl_list
+
+
+def unpickle_without_gc(unpickler: pickle.Unpickler):
+    # 反序列化一次性创建大量对象，期间暂停分代垃圾回收，否则会被反复触发
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return unpickler.load()
+    finally:
+        if gc_enabled:
+            gc.enable()
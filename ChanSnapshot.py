@@ -0,0 +1,317 @@
+import copy
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Tuple, Union
+
+from Bi.Bi import CBi
+from BuySellPoint.BS_Point import CBS_Point
+from BuySellPoint.BSPointList import CBSPointList
+from ChanModel.Features import CFeatures
+from Common.CEnum import KL_TYPE
+from Common.ChanException import CChanException, ErrCode
+from KLine.KLine_Index import CKLineIndex, to_cur_range
+from KLine.KLine_List import CKLine_List
+from Seg.Seg import CSeg
+from Seg.SegListComm import CSegListComm
+
+
+class CFrozenSeq:
+    """只读序列：共享已确定的前缀，只持有未确定尾部的拷贝"""
+    __slots__ = ("_store", "_sure_len", "_tail")
+
+    def __init__(self, store: list, sure_len: int, tail: Tuple):
+        self._store = store  # 多个快照共享的只追加存储，只读取前 sure_len 个元素
+        self._sure_len = sure_len  # 已确定前缀长度
+        self._tail = tail  # 未确定尾部元素的拷贝
+
+    def __len__(self):
+        return self._sure_len + len(self._tail)
+
+    def __iter__(self):
+        for idx in range(self._sure_len):
+            yield self._store[idx]
+        yield from self._tail
+
+    def __getitem__(self, index: Union[slice, int]):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError("CFrozenSeq index out of range")
+        if index < self._sure_len:
+            return self._store[index]
+        return self._tail[index - self._sure_len]
+
+    @property
+    def sure_len(self):
+        return self._sure_len
+
+
+class CBSPointList_Snapshot:
+    """买卖点列表快照，接口与 CBSPointList 的查询部分保持一致"""
+
+    def __init__(self, bsp_seq: CFrozenSeq):
+        self.bsp_seq = bsp_seq  # 按 bi.idx 排序的买卖点
+
+    def __len__(self):
+        return len(self.bsp_seq)
+
+    def bsp_iter(self) -> Iterable[CBS_Point]:
+        yield from self.bsp_seq
+
+    def getSortedBspList(self) -> List[CBS_Point]:
+        return list(self.bsp_seq)
+
+
+class CKLineIndex_Snapshot(CKLineIndex):
+    """跨级别索引的只读快照：与原索引共享只追加的数组，只记下当时的K线数和最后一根K线还会变化的子K线区间"""
+
+    def __init__(self, klu_index: CKLineIndex):
+        super(CKLineIndex_Snapshot, self).__init__()
+        self.ts = klu_index.ts
+        self.sup_idx = klu_index.sup_idx
+        self.sub_begin = klu_index.sub_begin
+        self.sub_end = klu_index.sub_end
+        self.retired_cnt = klu_index.retired_cnt
+        self.klu_cnt = len(klu_index)
+        self.last_sub_range = (self.sub_begin[-1], self.sub_end[-1]) if self.klu_cnt else (-1, -1)
+
+    def __len__(self):
+        return self.klu_cnt
+
+    def add_klu(self, ts: float):
+        raise CChanException("snapshot is read only", ErrCode.COMMON_ERROR)
+
+    def add_sub_klu(self, klu_idx: int, sub_klu_idx: int):
+        raise CChanException("snapshot is read only", ErrCode.COMMON_ERROR)
+
+    def retire_head(self, klu_cnt: int):
+        raise CChanException("snapshot is read only", ErrCode.COMMON_ERROR)
+
+    def get_sub_range(self, klu_idx: int) -> Tuple[int, int]:
+        if klu_idx < 0:
+            klu_idx += self.klu_cnt
+        if klu_idx != self.klu_cnt - 1:
+            return super(CKLineIndex_Snapshot, self).get_sub_range(klu_idx)
+        assert self.sub is not None
+        return to_cur_range(*self.last_sub_range, self.sub.retired_cnt)
+
+    def get_sup_idx(self, klu_idx: int) -> int:
+        if klu_idx < 0:
+            klu_idx += self.klu_cnt
+        return super(CKLineIndex_Snapshot, self).get_sup_idx(klu_idx)
+
+
+class CKLine_List_Snapshot:
+    """单个级别的只读快照，字段名与 CKLine_List 一致，便于绘图和策略代码直接使用"""
+
+    def __init__(self, kl_list: CKLine_List, seq_dict: Dict[str, CFrozenSeq]):
+        self.kl_type = kl_list.kl_type
+        self.config = kl_list.config
+        self.lst = seq_dict["lst"]  # 合并K线
+        self.bi_list = seq_dict["bi_list"]  # 笔
+        self.seg_list = seq_dict["seg_list"]  # 线段
+        self.segseg_list = seq_dict["segseg_list"]  # 线段的线段
+        self.zs_list = seq_dict["zs_list"]  # 笔中枢
+        self.segzs_list = seq_dict["segzs_list"]  # 线段中枢
+        self.bs_point_lst = CBSPointList_Snapshot(seq_dict["bs_point_lst"])  # 笔买卖点
+        self.seg_bs_point_lst = CBSPointList_Snapshot(seq_dict["seg_bs_point_lst"])  # 线段买卖点
+        self.klu_index = CKLineIndex_Snapshot(kl_list.klu_index)  # 跨级别索引
+
+    def __getitem__(self, index):
+        return self.lst[index]
+
+    def __len__(self):
+        return len(self.lst)
+
+    def __iter__(self):
+        yield from self.lst
+
+    def klu_iter(self, klc_begin_idx=0):
+        for klc in self.lst[klc_begin_idx:]:
+            yield from klc.lst
+
+
+class CChanSnapshot:
+    """CChan 在某一步的只读快照，由 step_load(view=True) 返回"""
+
+    def __init__(self, chan, kl_datas: Dict[KL_TYPE, CKLine_List_Snapshot]):
+        self.code = chan.code
+        self.begin_time = chan.begin_time
+        self.end_time = chan.end_time
+        self.autype = chan.autype
+        self.data_src = chan.data_src
+        self.lv_list: List[KL_TYPE] = list(chan.lv_list)
+        self.conf = chan.conf
+        self.kl_datas = kl_datas
+
+    def __getitem__(self, n) -> CKLine_List_Snapshot:
+        if isinstance(n, KL_TYPE):
+            return self.kl_datas[n]
+        elif isinstance(n, int):
+            return self.kl_datas[self.lv_list[n]]
+        else:
+            raise CChanException("unspoourt query type", ErrCode.COMMON_ERROR)
+
+    def get_bsp(self, idx=None) -> List[CBS_Point]:
+        if idx is not None:
+            return self[idx].bs_point_lst.getSortedBspList()
+        assert len(self.lv_list) == 1
+        return self[0].bs_point_lst.getSortedBspList()
+
+
+class CChanSnapshotBuilder:
+    """
+    为逐步回放生成快照
+    每个结构维护一个只追加的已确定前缀存储，所有快照共享它；
+    每步只追加新确定的元素，并拷贝仍可能被修改的尾部，代价与变化量成正比
+    """
+
+    def __init__(self, chan):
+        self.chan = chan
+        self.store_dict: Dict[Tuple[KL_TYPE, str], list] = {}  # (级别, 结构名) -> 已确定前缀
+        self.version_dict: Dict[Tuple[KL_TYPE, str], list] = {}  # (级别, 结构名) -> 存入前缀时各元素的版本号
+        self.bsp_bound_dict: Dict[Tuple[KL_TYPE, str], int] = {}  # (级别, 买卖点列表名) -> 前缀覆盖到的 bi.idx 上界
+        self.retired_klu_cnt_dict: Dict[KL_TYPE, int] = {}  # 级别 -> 生成上一个快照时已淘汰的K线数
+
+    def make_snapshot(self) -> CChanSnapshot:
+        kl_datas = {}
+        for lv in self.chan.lv_list:
+            kl_datas[lv] = self.make_kl_list_snapshot(lv, self.chan[lv])
+        lv_list = self.chan.lv_list
+        for lv_idx, lv in enumerate(lv_list):
+            klu_index = kl_datas[lv].klu_index
+            klu_index.sup = kl_datas[lv_list[lv_idx-1]].klu_index if lv_idx > 0 else None
+            klu_index.sub = kl_datas[lv_list[lv_idx+1]].klu_index if lv_idx+1 < len(lv_list) else None
+        return CChanSnapshot(self.chan, kl_datas)
+
+    def make_kl_list_snapshot(self, lv: KL_TYPE, kl_list: CKLine_List) -> CKLine_List_Snapshot:
+        # 淘汰历史后剩余部分重新编号，已存前缀对不上了，换新的存储重新开始，旧快照仍持有原来的存储
+        if kl_list.retired_klu_cnt != self.retired_klu_cnt_dict.get(lv, 0):
+            self.retired_klu_cnt_dict[lv] = kl_list.retired_klu_cnt
+            for key in [key for key in self.store_dict if key[0] == lv]:
+                del self.store_dict[key]
+                self.version_dict.pop(key, None)
+                self.bsp_bound_dict.pop(key, None)
+        # 线段：倒数第二个确定线段之前的线段不会再被重算
+        sure_seg_cnt = cal_sure_seg_cnt(kl_list.seg_list)
+        sure_bi_cnt = kl_list.seg_list[sure_seg_cnt].start_bi.idx if sure_seg_cnt > 0 else 0
+        # 线段的 seg_idx/parent_seg/bsp 还会被线段的线段修改，需同时受 segseg 约束
+        sure_segseg_cnt = cal_sure_seg_cnt(kl_list.segseg_list)
+        if sure_segseg_cnt > 0:
+            sure_seg_cnt = min(sure_seg_cnt, kl_list.segseg_list[sure_segseg_cnt].start_bi.idx)
+        else:
+            sure_seg_cnt = 0
+        memo: Dict[int, object] = {}  # id(原对象) -> 本快照中的尾部拷贝
+        seq_dict = {
+            # 合并K线只有最后两根会被修改（合并、分型）
+            "lst": self.freeze(lv, "lst", kl_list.lst, max(len(kl_list.lst) - 2, 0), memo),
+            "bi_list": self.freeze(lv, "bi_list", kl_list.bi_list.bi_list, sure_bi_cnt, memo),
+            "seg_list": self.freeze(lv, "seg_list", kl_list.seg_list.lst, sure_seg_cnt, memo),
+            "segseg_list": self.freeze(lv, "segseg_list", kl_list.segseg_list.lst, sure_segseg_cnt, memo),
+            # 中枢合并可能修改确定区域内最后一个中枢，多留一个
+            "zs_list": self.freeze(lv, "zs_list", kl_list.zs_list.zs_lst, cal_sure_zs_cnt(kl_list.zs_list.zs_lst, sure_bi_cnt), memo),
+            "segzs_list": self.freeze(lv, "segzs_list", kl_list.segzs_list.zs_lst, cal_sure_zs_cnt(kl_list.segzs_list.zs_lst, sure_seg_cnt), memo),
+            "bs_point_lst": self.freeze_bsp(lv, "bs_point_lst", kl_list.bs_point_lst, sure_bi_cnt, memo),
+            "seg_bs_point_lst": self.freeze_bsp(lv, "seg_bs_point_lst", kl_list.seg_bs_point_lst, sure_seg_cnt, memo),
+        }
+        # 尾部拷贝之间互相引用（笔的端点合并K线、线段的起止笔、中枢和买卖点所在的笔等），
+        # 把这些引用都换成本快照中的拷贝，后续计算修改原对象时快照不受影响
+        relink_tail_items(memo)
+        return CKLine_List_Snapshot(kl_list, seq_dict)
+
+    def freeze(self, lv: KL_TYPE, name: str, live_lst: list, sure_cnt: int, memo: Dict[int, object]) -> CFrozenSeq:
+        store = self.get_store(lv, name)
+        version_lst = self.version_dict.setdefault((lv, name), [])
+        # 检查已存前缀与当前列表是否一致，不一致时从分叉处复制出新存储，旧快照不受影响
+        # 虚笔删除后可能被原地复用（CBiList.add_new_bi），同一对象终点变了版本号也会变，不能只比较对象
+        keep_cnt = min(len(store), sure_cnt)
+        while keep_cnt > 0 and (store[keep_cnt - 1] is not live_lst[keep_cnt - 1] or version_lst[keep_cnt - 1] != item_version(live_lst[keep_cnt - 1])):
+            keep_cnt -= 1
+        if keep_cnt < len(store):
+            store = store[:keep_cnt]
+            self.store_dict[(lv, name)] = store
+            del version_lst[keep_cnt:]
+        version_lst.extend(item_version(item) for item in live_lst[len(store):sure_cnt])
+        store.extend(live_lst[len(store):sure_cnt])
+        return CFrozenSeq(store, sure_cnt, tuple(copy_tail_item(item, memo) for item in live_lst[sure_cnt:]))
+
+    def freeze_bsp(self, lv: KL_TYPE, name: str, bsp_lst: CBSPointList, sure_bi_cnt: int, memo: Dict[int, object]) -> CFrozenSeq:
+        store = self.get_store(lv, name)
+        last_bound = self.bsp_bound_dict.get((lv, name), 0)
+        if sure_bi_cnt < last_bound:
+            store = [bsp for bsp in store if bsp.bi.idx < sure_bi_cnt]
+            self.store_dict[(lv, name)] = store
+        elif sure_bi_cnt > last_bound:
+            store.extend(bsp for bsp in collect_bsp_since(bsp_lst, last_bound) if bsp.bi.idx < sure_bi_cnt)
+        self.bsp_bound_dict[(lv, name)] = sure_bi_cnt
+        tail = tuple(copy_tail_item(bsp, memo) for bsp in collect_bsp_since(bsp_lst, sure_bi_cnt))
+        return CFrozenSeq(store, len(store), tail)
+
+    def get_store(self, lv: KL_TYPE, name: str) -> list:
+        if (lv, name) not in self.store_dict:
+            self.store_dict[(lv, name)] = []
+        return self.store_dict[(lv, name)]
+
+
+def cal_sure_seg_cnt(seg_list: CSegListComm) -> int:
+    # 最后一个确定线段可能在下次更新时被删除重算，再往前留一个线段作为余量
+    seg_idx = len(seg_list) - 1
+    while seg_idx >= 0 and not seg_list[seg_idx].is_sure:
+        seg_idx -= 1
+    return max(seg_idx - 1, 0)
+
+
+def cal_sure_zs_cnt(zs_lst: list, sure_bi_cnt: int) -> int:
+    # 中枢按结束位置递增，二分找到完全落在确定区域内的中枢个数
+    return max(bisect_left(zs_lst, sure_bi_cnt, key=lambda zs: zs.end_bi.idx) - 1, 0)
+
+
+def collect_bsp_since(bsp_lst: CBSPointList, begin_bi_idx: int) -> List[CBS_Point]:
+    # 每个类型/方向的列表都按 bi.idx 递增，从尾部往前收集即可，不用遍历全部买卖点
+    bi_idx_set = set()
+    for bsp_list in bsp_lst.bsp_store_dict.values():
+        for is_buy in [True, False]:
+            for bsp in reversed(bsp_list[is_buy]):
+                if bsp.bi.idx < begin_bi_idx:
+                    break
+                bi_idx_set.add(bsp.bi.idx)
+    return [bsp_lst.bsp_store_flat_dict[bi_idx] for bi_idx in sorted(bi_idx_set)]
+
+
+def item_version(item) -> int:
+    # 笔的终点每变化一次版本号加一，其他结构没有版本号
+    return item.version if isinstance(item, CBi) else 0
+
+
+def copy_tail_item(item, memo: Dict[int, object]):
+    # 浅拷贝尾部元素，并拷贝其自身持有的列表/字典/特征，使后续计算对原对象的修改不影响快照
+    # 同一对象出现在多个尾部时（如中枢同时在线段的 zs_lst 中）只拷贝一次
+    if id(item) in memo:
+        return memo[id(item)]
+    new_item = copy.copy(item)
+    memo[id(item)] = new_item
+    for k, v in item.__dict__.items():
+        if isinstance(v, (list, dict)):
+            setattr(new_item, k, copy.copy(v))
+        elif isinstance(v, CFeatures):
+            setattr(new_item, k, copy_tail_item(v, memo))
+    return new_item
+
+
+def relink_tail_items(memo: Dict[int, object]):
+    # 线段 zs_lst 中的中枢会随线段一起重算，也要拷贝
+    for item in list(memo.values()):
+        if isinstance(item, CSeg):
+            for zs in item.zs_lst:
+                copy_tail_item(zs, memo)
+    for item in memo.values():
+        for k, v in item.__dict__.items():
+            if id(v) in memo:
+                setattr(item, k, memo[id(v)])
+            elif isinstance(v, list):
+                if any(id(x) in memo for x in v):
+                    setattr(item, k, [memo.get(id(x), x) for x in v])
+            elif isinstance(v, dict):
+                if any(id(x) in memo for x in v.values()):
+                    setattr(item, k, {key: memo.get(id(x), x) for key, x in v.items()})
@@ -1,3 +1,4 @@
+import copy
 from typing import Generic, Iterable, List, Optional, Self, TypeVar, Union, overload
 
 from Common.cache import make_cache
@@ -123,6 +124,34 @@ class CKLine_Combiner(Generic[T]):
         """设置分型类型（仅用于深拷贝恢复状态）"""
         self.__fx = fx
 
+    def add_combined(self, unit_lst: List[T], high, low):
+        """批量合并时直接加入其余K线单元并设置合并结果（高低点已由 KLine_Combine.cal_combine 算好）"""
+        if not unit_lst:
+            return
+        self.__lst.extend(unit_lst)
+        for unit_kl in unit_lst:
+            if isinstance(unit_kl, CKLine_Unit):
+                unit_kl.set_klc(self)
+        self.__high = high
+        self.__low = low
+        self.__time_end = CCombine_Item(unit_lst[-1]).time_end
+        self.clean_cache()
+
+    def link_fx(self, _pre: Self, _next: Self, fx: FX_TYPE):
+        """建立与 update_fx 相同的前后链接，分型已算好时使用"""
+        self.set_next(_next)
+        self.set_pre(_pre)
+        _next.set_pre(self)
+        self.__fx = fx
+        self.clean_cache()
+
+    def clone(self) -> Self:
+        """复制合并状态（包含的单元列表独立），之后两者各自合并互不影响"""
+        obj = copy.copy(self)
+        obj.__lst = list(self.__lst)
+        obj.clean_cache()
+        return obj
+
     def try_add(self, unit_kl: T, exclude_included=False, allow_top_equal=None):
         """尝试合并新K线单元
         Args:
@@ -104,6 +104,15 @@ class SEG_TYPE(Enum):
     SEG = auto()
 
 
+class CHAN_EVENT(Enum):
+    BSP_CREATED = auto()  # 出现新的买卖点
+    BSP_UPDATED = auto()  # 未确定的买卖点重算后仍在，换成了新对象
+    BSP_CONFIRMED = auto()  # 买卖点所在位置已确定，不会再被重算
+    BSP_INVALIDATED = auto()  # 未确定的买卖点在重算后消失
+    BI_SURE = auto()  # 笔确定
+    SEG_SURE = auto()  # 线段确定
+
+
 class MACD_ALGO(Enum):
     AREA = auto()
     PEAK = auto()
@@ -6,4 +6,6 @@ REDIS_KEY_ETF_TO_NAME_100 = "etf_code_to_name_100"
 REDIS_KEY_SCHEDULE_CONFIG = "schedule_config"
 REDIS_KEY_ETF_BSP_RECORDS = "etf_bsp_records"
 REDIS_KEY_STOCK_BSP_RECORDS = "stock_bsp_records"
+REDIS_KEY_RENDER_QUEUE = "render_job_queue"
+REDIS_KEY_RENDER_JOB_PREFIX = "render_job:"
 
@@ -76,4 +76,4 @@ class FileOperator:
 
 if __name__ == '__main__':
     fp = FileOperator()
-    print(f"{fp.get_name_by_code("sz000799")}")
+    print(f"{fp.get_name_by_code('sz000799')}")
@@ -0,0 +1,80 @@
+# 添加项目根目录到Python路径
+import sys
+import os
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+sys.path.append(parent_dir)
+
+import argparse
+import datetime
+import random
+import time
+
+from Chan import CChan
+from ChanConfig import CChanConfig
+from Common.CEnum import DATA_FIELD, KL_TYPE
+from Common.CTime import CTime
+from KLine.KLine_Unit import CKLine_Unit
+
+
+def gen_5m_klu(bar_cnt, seed):
+    """生成随机游走的5分钟K线，每天48根（09:35-11:30, 13:05-15:00）"""
+    rnd = random.Random(seed)
+    bar_time_lst = [datetime.timedelta(hours=9, minutes=35) + datetime.timedelta(minutes=5 * i) for i in range(24)] + \
+                   [datetime.timedelta(hours=13, minutes=5) + datetime.timedelta(minutes=5 * i) for i in range(24)]
+    day = datetime.datetime(2010, 1, 4)
+    price = 10.0
+    res = []
+    while len(res) < bar_cnt:
+        if day.weekday() < 5:
+            for delta in bar_time_lst:
+                if len(res) >= bar_cnt:
+                    break
+                t = day + delta
+                _open = price
+                _close = max(0.5, price * (1 + rnd.gauss(0, 0.004)))
+                _high = max(_open, _close) * (1 + abs(rnd.gauss(0, 0.002)))
+                _low = min(_open, _close) * (1 - abs(rnd.gauss(0, 0.002)))
+                res.append(CKLine_Unit({
+                    DATA_FIELD.FIELD_TIME: CTime(t.year, t.month, t.day, t.hour, t.minute),
+                    DATA_FIELD.FIELD_OPEN: _open,
+                    DATA_FIELD.FIELD_HIGH: _high,
+                    DATA_FIELD.FIELD_LOW: _low,
+                    DATA_FIELD.FIELD_CLOSE: _close,
+                }))
+                price = _close
+        day += datetime.timedelta(days=1)
+    return res
+
+
+if __name__ == "__main__":
+    """
+    逐K线计算（trigger_step）的性能基准：每批K线统计一次耗时
+    如果耗时随历史长度增长，说明每根K线的计算量与历史长度相关
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bars", type=int, default=100000, help="K线数量")
+    parser.add_argument("--batch", type=int, default=10000, help="每批K线数量")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max_history", type=int, default=0, help="只保留最近多少个确定线段，0表示不淘汰")
+    args = parser.parse_args()
+
+    config = CChanConfig({
+        "trigger_step": True,
+        "bi_strict": True,
+        "bs_type": "1,2,3a,1p,2s,3b",
+        "print_warning": False,
+        "max_history": args.max_history,
+    })
+    chan = CChan(code="benchmark", lv_list=[KL_TYPE.K_5M], config=config)
+
+    klu_lst = gen_5m_klu(args.bars, args.seed)
+    total_begin = time.time()
+    for begin in range(0, len(klu_lst), args.batch):
+        batch_begin = time.time()
+        chan.trigger_load({KL_TYPE.K_5M: klu_lst[begin:begin + args.batch]})
+        cost = time.time() - batch_begin
+        kl_list = chan[0]
+        print(f"bars {begin + args.batch:>7}: {cost:7.2f}s  {cost / args.batch * 1e6:8.1f}us/bar  "
+              f"klc={len(kl_list)} bi={len(kl_list.bi_list)} seg={len(kl_list.seg_list)} zs={len(kl_list.zs_list)} bsp={len(kl_list.bs_point_lst)}")
+    print(f"total: {time.time() - total_begin:.2f}s")
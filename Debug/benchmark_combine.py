@@ -0,0 +1,59 @@
+# 添加项目根目录到Python路径
+import sys
+import os
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+sys.path.append(parent_dir)
+
+import argparse
+import time
+
+from benchmark_5m import gen_5m_klu
+from Combiner.KLine_Combiner import CKLine_Combiner
+from Common.CEnum import KLINE_DIR
+from KLine.KLine_Combine import cal_combine, combine_kernel_jit
+
+
+def combine_by_object(klu_lst):
+    """逐根 try_add/update_fx 的对象路径，作为对照"""
+    klc_lst = [CKLine_Combiner(klu_lst[0], _dir=KLINE_DIR.UP)]
+    for klu in klu_lst[1:]:
+        _dir = klc_lst[-1].try_add(klu)
+        if _dir == KLINE_DIR.COMBINE:
+            continue
+        klc_lst.append(CKLine_Combiner(klu, _dir=_dir))
+        if len(klc_lst) >= 3:
+            klc_lst[-2].update_fx(klc_lst[-3], klc_lst[-1])
+    return klc_lst
+
+
+if __name__ == "__main__":
+    """
+    K线合并、分型：逐根构造对象 vs KLine_Combine.cal_combine（numpy，安装了 numba 时内核编译执行）
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bars", type=int, default=100000, help="K线数量")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--round", type=int, default=3, help="取最快的一轮")
+    args = parser.parse_args()
+
+    klu_lst = gen_5m_klu(args.bars, args.seed)
+    high_lst = [klu.high for klu in klu_lst]
+    low_lst = [klu.low for klu in klu_lst]
+    cal_combine(high_lst[:100], low_lst[:100])  # numba 首次调用需要编译
+
+    def best_of(func):
+        cost = float("inf")
+        for _ in range(args.round):
+            begin = time.time()
+            res = func()
+            cost = min(cost, time.time() - begin)
+        return cost, res
+
+    object_cost, klc_lst = best_of(lambda: combine_by_object(klu_lst))
+    kernel_cost, res = best_of(lambda: cal_combine(high_lst, low_lst))
+    assert len(res) == len(klc_lst)
+    assert all(klc.high == high and klc.low == low and klc.fx == fx for klc, high, low, fx in zip(klc_lst, res.high, res.low, res.fx))
+    print(f"bars={args.bars} klc={len(res)} numba={'on' if combine_kernel_jit is not None else 'off'}")
+    print(f"object: {object_cost:.3f}s  {object_cost / args.bars * 1e6:.2f}us/bar")
+    print(f"kernel: {kernel_cost:.3f}s  {kernel_cost / args.bars * 1e6:.2f}us/bar  x{object_cost / kernel_cost:.1f}")
@@ -24,12 +24,17 @@ class CKLine(CKLine_Combiner[CKLine_Unit]):
     def GetSubKLC(self):
         # 可能会出现相邻的两个KLC的子KLC会有重复
         # 因为子KLU合并时正好跨过了父KLC的结束时间边界
-        last_klc = None
-        for klu in self.lst:
-            for sub_klu in klu.get_children():
-                if sub_klu.klc != last_klc:
-                    last_klc = sub_klu.klc
-                    yield sub_klu.klc
+        # 子KLU在次级别中是连续的一段，只需找到首尾子KLU，中间的KLC沿相邻KLU依次取，不用遍历每根子KLU
+        first_sub_klu = next((klu.sub_kl_list[0] for klu in self.lst if klu.sub_kl_list), None)
+        if first_sub_klu is None:
+            return
+        last_sub_klc = next(klu.sub_kl_list[-1] for klu in reversed(self.lst) if klu.sub_kl_list).klc
+        sub_klc = first_sub_klu.klc
+        while True:
+            yield sub_klc
+            if sub_klc is last_sub_klc:
+                break
+            sub_klc = sub_klc.lst[-1].next.klc
 
     def get_klu_max_high(self) -> float:
         return max(x.high for x in self.lst)
@@ -0,0 +1,128 @@
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from Common.CEnum import KL_TYPE
+from Common.CTime import CTime
+
+from .KLine_Unit import CKLine_Unit
+
+
+class CKLineAlignReport:
+    """
+    多级别K线对齐的诊断信息，计算过程中只记录，不逐条打印
+    misalign: 父级别K线在次级别找不到K线；inconsistent: 父子级别K线日期不一致
+    """
+
+    def __init__(self):
+        self.misalign_cnt = 0
+        self.misalign_detail: Dict[Tuple[KL_TYPE, KL_TYPE], List[CTime]] = defaultdict(list)  # key 为 (父级别, 次级别)，value 为找不到次级别K线的父级别时间
+        self.inconsistent_detail: Dict[str, List[CTime]] = defaultdict(list)  # key 为父级别时间，value 为日期不一致的次级别时间列表
+        self.pending_misalign_cnt = 0  # 还没输出过的条数
+        self.pending_inconsistent_cnt = 0
+
+    def add_misalign(self, parent_klu: CKLine_Unit, sub_lv: KL_TYPE):
+        self.misalign_cnt += 1
+        self.pending_misalign_cnt += 1
+        self.misalign_detail[(parent_klu.kl_type, sub_lv)].append(parent_klu.time)
+
+    def add_inconsistent(self, parent_klu: CKLine_Unit, sub_klu: CKLine_Unit):
+        self.inconsistent_detail[str(parent_klu.time)].append(sub_klu.time)
+        self.pending_inconsistent_cnt += 1
+
+    def pop_warning_lst(self, code, show_cnt=5) -> List[str]:
+        """汇总上次输出之后新增的诊断信息，每类只列出最近 show_cnt 条"""
+        res = []
+        if self.pending_misalign_cnt:
+            recent_lst = [f"{parent_lv}->{sub_lv}:{t}" for (parent_lv, sub_lv), t_lst in self.misalign_detail.items() for t in t_lst][-min(show_cnt, self.pending_misalign_cnt):]
+            res.append(f"[WARNING-{code}]新增{self.pending_misalign_cnt}根K线没在次级别找到K线（累计{self.misalign_cnt}），最近：{', '.join(recent_lst)}")
+        if self.pending_inconsistent_cnt:
+            recent_lst = [f"{parent_t}->{t}" for parent_t, t_lst in self.inconsistent_detail.items() for t in t_lst][-min(show_cnt, self.pending_inconsistent_cnt):]
+            res.append(f"[WARNING-{code}]新增{self.pending_inconsistent_cnt}根次级别K线与父级别日期不一致（累计{len(self.inconsistent_detail)}根父级别K线），最近：{', '.join(recent_lst)}")
+        self.pending_misalign_cnt = 0
+        self.pending_inconsistent_cnt = 0
+        return res
+
+
+class CKLineAligner:
+    """
+    按时间戳一次性对齐各级别待加入的K线，规则与逐根加载一致：次级别K线归属于第一根时间不早于它的父级别K线
+    每级别都先找出时间不再单调递增的位置 bad_idx，只对之前的部分求区间，超出部分由调用方在读到时报错
+    时间戳放在 numpy 数组中，区间用 searchsorted 一次求出
+    """
+
+    def __init__(
+        self,
+        lv_klu_lst: List[List[CKLine_Unit]],
+        last_ts_lst: List[float],
+        cached_lst: List[int],
+        check_day_lst: List[bool],
+    ):
+        self.klu_lst = lv_klu_lst
+        self.cached_lst = cached_lst  # 各级别开头有几根是上次留下的缓存（已检查过时间），0 或 1
+        ts_lst = [np.fromiter((klu.time.ts for klu in klu_lst), dtype=np.float64, count=len(klu_lst)) for klu_lst in lv_klu_lst]
+        self.bad_idx = [cal_unsorted_idx(ts, last_ts, cached) for ts, last_ts, cached in zip(ts_lst, last_ts_lst, cached_lst)]
+        # end_lst[lv_idx][i]: 第 lv_idx-1 级别第 i 根K线的次级别区间为 [end_lst[lv_idx][i-1], end_lst[lv_idx][i])
+        # incons_end_lst[lv_idx][i]: 区间内在此之前的次级别K线日期早于父级别K线（日期不一致），不检查时为 None
+        self.end_lst: List[Optional[List[int]]] = [None]
+        self.incons_end_lst: List[Optional[List[int]]] = [None]
+        for lv_idx in range(1, len(lv_klu_lst)):
+            parent_ts = ts_lst[lv_idx-1][:self.bad_idx[lv_idx-1]]
+            end_lst = cal_child_end(parent_ts, ts_lst[lv_idx], self.bad_idx[lv_idx])
+            self.end_lst.append(end_lst)
+            self.incons_end_lst.append(cal_inconsistent_end(
+                lv_klu_lst[lv_idx-1], lv_klu_lst[lv_idx], end_lst
+            ) if check_day_lst[lv_idx] else None)
+
+    def get_range(self, lv_idx, parent_idx) -> Tuple[int, int]:
+        """第 lv_idx-1 级别第 parent_idx 根K线对应的第 lv_idx 级别K线区间"""
+        end_lst = self.end_lst[lv_idx]
+        return (end_lst[parent_idx-1] if parent_idx > 0 else 0), end_lst[parent_idx]
+
+    def is_inconsistent(self, lv_idx, parent_idx, klu_idx) -> bool:
+        incons_end_lst = self.incons_end_lst[lv_idx]
+        return incons_end_lst is not None and klu_idx < incons_end_lst[parent_idx]
+
+    def reach_unsorted(self, lv_idx, begin, end) -> bool:
+        """
+        处理完一根父级别K线的次级别区间 [begin, end) 后，逐根加载会读取第 end 根K线，
+        若它正是时间不单调的那根就该报错；第一根父级别K线即使区间为空也会读取
+        """
+        return end == self.bad_idx[lv_idx] < len(self.klu_lst[lv_idx]) and (begin < end or end == 0)
+
+    def get_used_cnt(self, lv_idx, parent_used_cnt) -> Optional[int]:
+        """父级别用了 parent_used_cnt 根K线时本级别用掉的K线数，父级别一根都没用时本级别一根也没读取，返回 None"""
+        if parent_used_cnt == 0:
+            return None
+        return self.end_lst[lv_idx][parent_used_cnt-1]
+
+
+def cal_unsorted_idx(ts_arr: np.ndarray, last_ts: float, begin: int) -> int:
+    """从 begin 开始第一根时间不晚于前一根的K线位置，全部单调递增时返回长度"""
+    pre_ts = ts_arr[begin-1] if begin > 0 else last_ts
+    bad_pos = np.flatnonzero(np.diff(ts_arr[begin:], prepend=pre_ts) <= 0)
+    return begin + int(bad_pos[0]) if len(bad_pos) else len(ts_arr)
+
+
+def cal_child_end(parent_ts: np.ndarray, child_ts: np.ndarray, child_cnt: int) -> List[int]:
+    """时间戳归并：每根父级别K线对应的次级别区间终点，即前 child_cnt 根中时间不晚于父级别K线的个数"""
+    return np.searchsorted(child_ts[:child_cnt], parent_ts, side='right').tolist()
+
+
+def cal_inconsistent_end(parent_klu_lst: List[CKLine_Unit], child_klu_lst: List[CKLine_Unit], end_lst: List[int]) -> List[int]:
+    """
+    次级别K线时间不晚于父级别K线，日期也随时间单调，所以区间内日期早于父级别K线的正好是区间开头一段
+    整段日期有序，先对全部父级别K线一次 searchsorted，再截到各自区间内
+    """
+    if not end_lst:
+        return []
+    child_day = np.fromiter((day_key(klu.time) for klu in child_klu_lst[:end_lst[-1]]), dtype=np.int64, count=end_lst[-1])
+    parent_day = np.fromiter((day_key(klu.time) for klu in parent_klu_lst[:len(end_lst)]), dtype=np.int64, count=len(end_lst))
+    end_arr = np.asarray(end_lst, dtype=np.int64)
+    begin_arr = np.concatenate(([0], end_arr[:-1]))
+    return np.clip(np.searchsorted(child_day, parent_day, side='left'), begin_arr, end_arr).tolist()
+
+
+def day_key(t: CTime) -> int:
+    return t.year * 10000 + t.month * 100 + t.day
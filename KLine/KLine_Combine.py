@@ -0,0 +1,217 @@
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from Common.CEnum import FX_TYPE, KLINE_DIR
+from Common.ChanException import CChanException, ErrCode
+
+try:
+    import numba  # 可选依赖，安装了就用它编译合并内核
+except ImportError:
+    numba = None
+
+
+class CKLineCombineResult:
+    """
+    一组K线单元从头合并的结果，按合并K线存放：起始K线单元序号、合并后的高低点、方向、分型
+    分型与逐根合并时一样：用前一根合并K线、本合并K线的最终高低点，以及后一根合并K线第一根K线单元的高低点判断
+    """
+
+    def __init__(self, klu_cnt: int):
+        self.klu_cnt = klu_cnt
+        self.begin: List[int] = []
+        self.high: List[float] = []  # 取自原始序列，保持原始数值类型，与逐根合并完全一致
+        self.low: List[float] = []
+        self.dir: List[KLINE_DIR] = []
+        self.fx: List[FX_TYPE] = []
+
+    def __len__(self):
+        return len(self.begin)
+
+    def klu_range(self) -> Iterable[Tuple[int, int]]:
+        """各合并K线包含的K线单元区间 [begin, end)"""
+        for klc_idx, begin in enumerate(self.begin):
+            yield begin, self.begin[klc_idx+1] if klc_idx+1 < len(self.begin) else self.klu_cnt
+
+
+def combine_kernel(high, low, klu_cnt, begin, high_idx, low_idx, is_up) -> int:
+    """
+    合并内核：只处理下标和比较，结果写入预先分配好的 begin/high_idx/low_idx/is_up（长度不小于 klu_cnt）
+    high_idx/low_idx 是合并后高低点所在的K线单元下标；返回合并K线数，遇到无法判断方向的K线（如 NaN）返回 -(下标+1)
+    包含关系按当前方向取高高/低低，一字涨跌停（高低点相等且等于当前极值）不更新高低点
+    同一份代码既可以直接在列表上运行，也可以交给 numba 编译
+    """
+    if klu_cnt == 0:
+        return 0
+    cur_high, cur_low, cur_high_idx, cur_low_idx, cur_up = high[0], low[0], 0, 0, True
+    klc_cnt = 1
+    begin[0] = 0
+    is_up[0] = True
+    for idx in range(1, klu_cnt):
+        _high, _low = high[idx], low[idx]
+        if (cur_high >= _high and cur_low <= _low) or (cur_high <= _high and cur_low >= _low):
+            if cur_up:
+                if _high != _low or _high != cur_high:
+                    if _high > cur_high:
+                        cur_high, cur_high_idx = _high, idx
+                    if _low > cur_low:
+                        cur_low, cur_low_idx = _low, idx
+            elif _high != _low or _low != cur_low:
+                if _high < cur_high:
+                    cur_high, cur_high_idx = _high, idx
+                if _low < cur_low:
+                    cur_low, cur_low_idx = _low, idx
+            continue
+        if cur_high > _high and cur_low > _low:
+            cur_up = False
+        elif cur_high < _high and cur_low < _low:
+            cur_up = True
+        else:
+            return -(idx+1)
+        high_idx[klc_cnt-1] = cur_high_idx
+        low_idx[klc_cnt-1] = cur_low_idx
+        begin[klc_cnt] = idx
+        is_up[klc_cnt] = cur_up
+        klc_cnt += 1
+        cur_high, cur_low, cur_high_idx, cur_low_idx = _high, _low, idx, idx
+    high_idx[klc_cnt-1] = cur_high_idx
+    low_idx[klc_cnt-1] = cur_low_idx
+    return klc_cnt
+
+
+combine_kernel_jit = numba.njit(cache=True, nogil=True)(combine_kernel) if numba is not None else None
+
+
+def combine_rows_kernel(high, low, klu_cnt, begin, high_idx, low_idx, is_up, klc_cnt):
+    """(组, K线) 二维数组逐组运行合并内核，只在 numba 下使用"""
+    for row in range(high.shape[0]):
+        klc_cnt[row] = combine_kernel_jit(high[row], low[row], klu_cnt[row], begin[row], high_idx[row], low_idx[row], is_up[row])
+
+
+combine_rows_jit = numba.njit(cache=True, nogil=True)(combine_rows_kernel) if numba is not None else None
+
+
+def combine_columns_kernel(high, low, klu_cnt, begin, high_idx, low_idx, is_up, klc_cnt):
+    """
+    combine_kernel 的列式版本：high/low 为 (K线, 组) 二维数组，按K线下标同步推进所有组，每步只做长度为组数的数组运算
+    begin/high_idx/low_idx/is_up 为 (组, K线) 二维数组，klc_cnt 写入各组的合并K线数或错误码，含义与 combine_kernel 相同
+    """
+    rows = np.arange(high.shape[1])
+    klc_cnt[:] = np.where(klu_cnt > 0, 1, 0)
+    if high.shape[0] == 0:
+        return
+    cur_high, cur_low = high[0].copy(), low[0].copy()
+    cur_high_idx, cur_low_idx = np.zeros(len(rows), dtype=np.int64), np.zeros(len(rows), dtype=np.int64)
+    cur_up = np.ones(len(rows), dtype=np.bool_)
+    begin[:, 0] = 0
+    is_up[:, 0] = True
+    for idx in range(1, high.shape[0]):
+        _high, _low = high[idx], low[idx]
+        active = (klu_cnt > idx) & (klc_cnt > 0)
+        include = active & (((cur_high >= _high) & (cur_low <= _low)) | ((cur_high <= _high) & (cur_low >= _low)))
+        # 包含关系：向上取高高、向下取低低，一字涨跌停不更新
+        inc_up = include & cur_up & ((_high != _low) | (_high != cur_high))
+        inc_down = include & ~cur_up & ((_high != _low) | (_low != cur_low))
+        upd_high = (inc_up & (_high > cur_high)) | (inc_down & (_high < cur_high))
+        upd_low = (inc_up & (_low > cur_low)) | (inc_down & (_low < cur_low))
+        # 非包含关系：新建合并K线或报错
+        go_down = (cur_high > _high) & (cur_low > _low)
+        go_up = (cur_high < _high) & (cur_low < _low)
+        new = active & ~include & (go_down | go_up)
+        err = active & ~include & ~(go_down | go_up)
+        if err.any():
+            klc_cnt[err] = -(idx+1)
+        if new.any():
+            new_rows = rows[new]
+            klc_idx = klc_cnt[new_rows]
+            high_idx[new_rows, klc_idx-1] = cur_high_idx[new_rows]
+            low_idx[new_rows, klc_idx-1] = cur_low_idx[new_rows]
+            begin[new_rows, klc_idx] = idx
+            is_up[new_rows, klc_idx] = go_up[new_rows]
+            klc_cnt[new_rows] += 1
+            cur_up[new_rows] = go_up[new_rows]
+            upd_high |= new
+            upd_low |= new
+        cur_high = np.where(upd_high, _high, cur_high)
+        cur_high_idx[upd_high] = idx
+        cur_low = np.where(upd_low, _low, cur_low)
+        cur_low_idx[upd_low] = idx
+    done_rows = rows[klc_cnt > 0]
+    high_idx[done_rows, klc_cnt[done_rows]-1] = cur_high_idx[done_rows]
+    low_idx[done_rows, klc_cnt[done_rows]-1] = cur_low_idx[done_rows]
+
+
+def run_combine_kernel(high_lst: Sequence[float], low_lst: Sequence[float], high_arr: np.ndarray, low_arr: np.ndarray):
+    """返回 (合并K线数或错误码, begin, high_idx, low_idx, is_up)；有 numba 时在数组上运行，否则在列表上运行（Python 循环读列表比读数组快）"""
+    klu_cnt = len(high_lst)
+    if combine_kernel_jit is not None:
+        begin, high_idx, low_idx = np.empty(klu_cnt, dtype=np.int64), np.empty(klu_cnt, dtype=np.int64), np.empty(klu_cnt, dtype=np.int64)
+        is_up = np.empty(klu_cnt, dtype=np.bool_)
+        klc_cnt = combine_kernel_jit(high_arr, low_arr, klu_cnt, begin, high_idx, low_idx, is_up)
+    else:
+        begin, high_idx, low_idx, is_up = [0] * klu_cnt, [0] * klu_cnt, [0] * klu_cnt, [True] * klu_cnt
+        klc_cnt = combine_kernel(high_lst, low_lst, klu_cnt, begin, high_idx, low_idx, is_up)
+    return klc_cnt, begin, high_idx, low_idx, is_up
+
+
+def make_combine_result(high_lst: Sequence[float], low_lst: Sequence[float], high_arr: np.ndarray, low_arr: np.ndarray, klc_cnt, begin, high_idx, low_idx, is_up) -> CKLineCombineResult:
+    """由内核输出生成合并结果，分型对全部合并K线一次向量化判断"""
+    if klc_cnt < 0:
+        raise CChanException("combine type unknown", ErrCode.COMBINER_ERR)
+    res = CKLineCombineResult(len(high_lst))
+    begin_arr = np.asarray(begin[:klc_cnt], dtype=np.int64)
+    high_idx_arr = np.asarray(high_idx[:klc_cnt], dtype=np.int64)
+    low_idx_arr = np.asarray(low_idx[:klc_cnt], dtype=np.int64)
+    res.begin = begin_arr.tolist()
+    res.high = [high_lst[idx] for idx in high_idx_arr.tolist()]
+    res.low = [low_lst[idx] for idx in low_idx_arr.tolist()]
+    res.dir = [KLINE_DIR.UP if up else KLINE_DIR.DOWN for up in is_up[:klc_cnt]]
+    fx_code = np.zeros(klc_cnt, dtype=np.int8)  # 0 无分型，1 顶分型，-1 底分型；首尾两根合并K线没有分型
+    if klc_cnt >= 3:
+        klc_high, klc_low = high_arr[high_idx_arr], low_arr[low_idx_arr]
+        pre_high, pre_low = klc_high[:-2], klc_low[:-2]
+        cur_high, cur_low = klc_high[1:-1], klc_low[1:-1]
+        next_high, next_low = high_arr[begin_arr[2:]], low_arr[begin_arr[2:]]
+        top = (pre_high < cur_high) & (next_high < cur_high) & (pre_low < cur_low) & (next_low < cur_low)
+        bottom = (pre_high > cur_high) & (next_high > cur_high) & (pre_low > cur_low) & (next_low > cur_low)
+        fx_code[1:-1] = np.where(top, 1, np.where(bottom, -1, 0))
+    fx_map = {0: FX_TYPE.UNKNOWN, 1: FX_TYPE.TOP, -1: FX_TYPE.BOTTOM}
+    res.fx = [fx_map[code] for code in fx_code.tolist()]
+    return res
+
+
+def cal_combine(high_lst: Sequence[float], low_lst: Sequence[float]) -> CKLineCombineResult:
+    """与 CKLine_Combiner.try_add、update_fx（默认参数）逐根处理的结果一致，只是不为每根K线单元构造对象"""
+    high_arr = np.asarray(high_lst, dtype=np.float64)
+    low_arr = np.asarray(low_lst, dtype=np.float64)
+    return make_combine_result(high_lst, low_lst, high_arr, low_arr, *run_combine_kernel(high_lst, low_lst, high_arr, low_arr))
+
+
+def cal_combine_columns(high_lst_lst: Sequence[Sequence[float]], low_lst_lst: Sequence[Sequence[float]]) -> List[Optional[CKLineCombineResult]]:
+    """
+    多组K线单元（如多只股票的同一级别）一起合并，结果与逐组 cal_combine 一致，数据异常的组对应 None
+    高低点排成 (组, K线) 二维数组：有 numba 时逐组运行编译的内核，否则按K线同步推进所有组，Python 循环的次数只取决于最长一组的K线数
+    """
+    klu_cnt = np.array([len(high_lst) for high_lst in high_lst_lst], dtype=np.int64)
+    shape = (len(high_lst_lst), int(klu_cnt.max(initial=0)))
+    high, low = np.zeros(shape), np.zeros(shape)
+    for row, (high_lst, low_lst) in enumerate(zip(high_lst_lst, low_lst_lst)):
+        high[row, :len(high_lst)] = high_lst
+        low[row, :len(low_lst)] = low_lst
+    begin, high_idx, low_idx = np.zeros(shape, dtype=np.int64), np.zeros(shape, dtype=np.int64), np.zeros(shape, dtype=np.int64)
+    is_up = np.ones(shape, dtype=np.bool_)
+    klc_cnt = np.zeros(shape[0], dtype=np.int64)
+    if combine_rows_jit is not None:
+        combine_rows_jit(high, low, klu_cnt, begin, high_idx, low_idx, is_up, klc_cnt)
+    else:
+        combine_columns_kernel(np.ascontiguousarray(high.T), np.ascontiguousarray(low.T), klu_cnt, begin, high_idx, low_idx, is_up, klc_cnt)
+    res: List[Optional[CKLineCombineResult]] = []
+    for row, cnt in enumerate(klu_cnt.tolist()):
+        if klc_cnt[row] < 0:
+            res.append(None)
+            continue
+        res.append(make_combine_result(
+            high_lst_lst[row], low_lst_lst[row], high[row, :cnt], low[row, :cnt],
+            int(klc_cnt[row]), begin[row], high_idx[row], low_idx[row], is_up[row].tolist(),
+        ))
+    return res
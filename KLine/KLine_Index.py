@@ -0,0 +1,86 @@
+from array import array
+from bisect import bisect_left
+from typing import Optional, Tuple
+
+from Common.CTime import CTime
+
+
+class CKLineIndex:
+    """
+    单个级别K线的跨级别索引，按本级别K线序号存放：时间戳、所属父级别K线、子K线区间 [sub_begin, sub_end)
+    父子序号记的是对方级别的累计序号（含已淘汰的），对方淘汰历史后不用改写，查询时再减去对方的淘汰数
+    """
+
+    def __init__(self):
+        self.ts = array('d')  # K线时间戳，按时间二分查找K线序号
+        self.sup_idx = array('q')  # 所属父级别K线，-1 表示没有
+        self.sub_begin = array('q')  # 子K线区间，没有子K线时为 -1
+        self.sub_end = array('q')
+        self.retired_cnt = 0  # 本级别已淘汰的K线数
+        self.sup: Optional[CKLineIndex] = None  # 父级别、次级别的索引，由 CChan 关联
+        self.sub: Optional[CKLineIndex] = None
+
+    def __len__(self):
+        return len(self.ts)
+
+    def add_klu(self, ts: float):
+        self.ts.append(ts)
+        self.sup_idx.append(-1)
+        self.sub_begin.append(-1)
+        self.sub_end.append(-1)
+
+    def add_sub_klu(self, klu_idx: int, sub_klu_idx: int):
+        """本级别第 klu_idx 根K线添加子K线（次级别第 sub_klu_idx 根），子K线在次级别中是连续的，按顺序添加"""
+        assert self.sub is not None
+        sub_idx = sub_klu_idx + self.sub.retired_cnt
+        if self.sub_begin[klu_idx] < 0:
+            self.sub_begin[klu_idx] = sub_idx
+        self.sub_end[klu_idx] = sub_idx + 1
+        self.sub.sup_idx[sub_klu_idx] = klu_idx + self.retired_cnt
+
+    def retire_head(self, klu_cnt: int):
+        # 换成新数组而不是原地删除，快照持有的旧数组不受影响
+        self.ts = self.ts[klu_cnt:]
+        self.sup_idx = self.sup_idx[klu_cnt:]
+        self.sub_begin = self.sub_begin[klu_cnt:]
+        self.sub_end = self.sub_end[klu_cnt:]
+        self.retired_cnt += klu_cnt
+
+    def get_sub_range(self, klu_idx: int) -> Tuple[int, int]:
+        """第 klu_idx 根K线的子K线在次级别中的序号区间 [begin, end)，已淘汰的不算，没有子K线时返回 (-1, -1)"""
+        assert self.sub is not None
+        return to_cur_range(self.sub_begin[klu_idx], self.sub_end[klu_idx], self.sub.retired_cnt)
+
+    def get_sup_idx(self, klu_idx: int) -> int:
+        """第 klu_idx 根K线所属父级别K线的序号，没有或已淘汰时返回 -1"""
+        sup_idx = self.sup_idx[klu_idx]
+        if sup_idx < 0 or self.sup is None or sup_idx < self.sup.retired_cnt:
+            return -1
+        return sup_idx - self.sup.retired_cnt
+
+    def find(self, t: CTime) -> int:
+        """时间为 t 的K线序号，没有时返回 -1"""
+        klu_cnt = len(self)
+        idx = bisect_left(self.ts, t.ts, 0, klu_cnt)
+        return idx if idx < klu_cnt and self.ts[idx] == t.ts else -1
+
+    def find_sup(self, t: CTime, sup_index: 'CKLineIndex') -> int:
+        """
+        在本级别及各次级别中找时间为 t 的K线，返回它在 sup_index（本级别或更高级别）中所属的K线序号，找不到时返回 -1
+        """
+        index: Optional[CKLineIndex] = self
+        while index is not None:
+            idx = index.find(t)
+            if idx >= 0:
+                while index is not sup_index and idx >= 0:
+                    idx = index.get_sup_idx(idx)
+                    index = index.sup
+                return idx
+            index = index.sub
+        return -1
+
+
+def to_cur_range(begin: int, end: int, retired_cnt: int) -> Tuple[int, int]:
+    if begin < 0 or end <= retired_cnt:
+        return -1, -1
+    return max(begin - retired_cnt, 0), end - retired_cnt
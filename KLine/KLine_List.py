@@ -1,13 +1,19 @@
 import copy
-from typing import List, Union, overload
+from bisect import bisect_right
+from itertools import chain
+from typing import Callable, List, Optional, Tuple, Union, overload
 
 # 导入基础模块
 from Bi.Bi import CBi
 from Bi.BiList import CBiList
 from BuySellPoint.BSPointList import CBSPointList
 from ChanConfig import CChanConfig
+from ChanEvent import CChanEvent
 from Common.CEnum import KLINE_DIR, SEG_TYPE  # K线方向和线段类型枚举
 from Common.ChanException import CChanException, ErrCode
+from Math.Demark import CDemarkEngine
+from Math.MACD import CMACD
+from Math.RSI import RSI
 from Seg.Seg import CSeg
 from Seg.SegConfig import CSegConfig
 from Seg.SegListComm import CSegListComm  # 线段列表基类
@@ -15,6 +21,8 @@ from ZS.ZSList import CZSList  # 中枢列表
 
 # 导入当前包模块
 from .KLine import CKLine
+from .KLine_Combine import CKLineCombineResult, cal_combine
+from .KLine_Index import CKLineIndex
 from .KLine_Unit import CKLine_Unit
 
 
@@ -77,6 +85,17 @@ class CKLine_List:
         self.last_sure_seg_start_bi_idx = -1  # 最后确认线段的起始笔索引
         self.last_sure_segseg_start_bi_idx = -1  # 最后确认线段线段的起始索引
 
+        # 已淘汰的K线单元数，数据源按序号给出的K线索引要减去它（见 CChan.try_set_klu_idx）
+        self.retired_klu_cnt = 0
+
+        # 跨级别索引：时间→K线序号、父子级别K线序号，由 CChan 关联父子级别并在对齐时填写
+        self.klu_index = CKLineIndex()
+
+        # 非逐步计算时暂存待合并的K线单元，flush_klu_batch 时一次合并（见 begin_klu_batch）
+        self.pending_klu: Optional[List[CKLine_Unit]] = None
+        # CChanBatch 按列算好的 (K线单元列表, 合并结果)，flush_klu_batch 合并的正是这些K线单元时直接使用
+        self.combine_preset: Optional[Tuple[List[CKLine_Unit], CKLineCombineResult]] = None
+
     def __deepcopy__(self, memo):
         """深拷贝实现，用于回测系统状态保存"""
         new_obj = CKLine_List(self.kl_type, self.config)
@@ -118,6 +137,8 @@ class CKLine_List:
         new_obj.metric_model_lst = copy.deepcopy(self.metric_model_lst, memo)
         new_obj.step_calculation = copy.deepcopy(self.step_calculation, memo)
         new_obj.seg_bs_point_lst = copy.deepcopy(self.seg_bs_point_lst, memo)
+        new_obj.retired_klu_cnt = self.retired_klu_cnt
+        new_obj.klu_index = copy.deepcopy(self.klu_index, memo)
         return new_obj
 
     @overload
@@ -157,6 +178,96 @@ class CKLine_List:
         self.seg_bs_point_lst.cal(self.seg_list, self.segseg_list)  # 线段级别买卖点
         self.bs_point_lst.cal(self.bi_list, self.seg_list)  # 笔级别买卖点
 
+        # 长时间运行时淘汰窗口之外的历史
+        if self.config.max_history:
+            self.retire_history()
+
+    def retire_history(self):
+        """
+        只保留最近 max_history 个确定线段：删除更早的K线、笔、线段、中枢、买卖点，剩余部分从 0 开始重新编号
+        截断点取在线段的线段起点，且被淘汰的中枢不延伸到保留区域，保留区域内的计算结果与不淘汰时一致
+        """
+        cut = self.cal_retire_cut()
+        if cut is None:
+            return
+        segseg_cnt, seg_cnt, bi_cnt, zs_cnt, segzs_cnt = cut
+        # 多保留起始笔之前的一根合并K线，从起始笔往前回看时仍有前驱
+        klc_cnt = self.bi_list[bi_cnt].begin_klc.idx - 1
+        klu_cnt = self.lst[klc_cnt][0].idx
+
+        # 买卖点按旧编号筛选，需在重新编号之前处理
+        self.bs_point_lst.retire_head(bi_cnt, seg_cnt, klu_cnt)
+        self.seg_bs_point_lst.retire_head(seg_cnt, segseg_cnt, klu_cnt)
+        self.zs_list.retire_head(zs_cnt, bi_cnt, seg_cnt, klu_cnt)
+        self.segzs_list.retire_head(segzs_cnt, seg_cnt, segseg_cnt, klu_cnt)
+
+        for klc in self.lst[:klc_cnt]:
+            # 被淘汰部分内部也断开前后链接，仍被引用的零散对象（如 relate_bsp1）不会拖住整条历史链
+            klc.set_pre(None)
+            klc.set_next(None)
+            for klu in klc.lst:
+                unlink_retired_klu(klu)
+        del self.lst[:klc_cnt]
+        for klc_idx, klc in enumerate(self.lst):
+            klc.idx = klc_idx
+            for klu in klc.lst:
+                klu.set_idx(klu.idx - klu_cnt)
+        self.klu_index.retire_head(klu_cnt)
+        # 断开与被淘汰部分的链接，否则整条历史链仍然无法释放
+        self.lst[0].set_pre(None)
+        self.lst[0][0].pre = None
+
+        self.bi_list.retire_head(bi_cnt)
+        self.seg_list.retire_head(seg_cnt)
+        self.segseg_list.retire_head(segseg_cnt)
+        for bi in self.bi_list:
+            if bi.seg_idx is not None:
+                bi.set_seg_idx(bi.seg_idx - seg_cnt)
+        for seg in self.seg_list:
+            if seg.seg_idx is not None:
+                seg.set_seg_idx(seg.seg_idx - segseg_cnt)
+        if self.last_sure_seg_start_bi_idx >= 0:
+            self.last_sure_seg_start_bi_idx -= bi_cnt
+        if self.last_sure_segseg_start_bi_idx >= 0:
+            self.last_sure_segseg_start_bi_idx -= seg_cnt
+
+        # 递推类指标只依赖最近的状态
+        for metric_model in self.metric_model_lst:
+            if isinstance(metric_model, (CMACD, RSI, CDemarkEngine)):
+                metric_model.trim()
+        self.retired_klu_cnt += klu_cnt
+
+    def cal_retire_cut(self) -> Optional[Tuple[int, int, int, int, int]]:
+        """计算截断点，返回需要淘汰的 (线段的线段数, 线段数, 笔数, 笔中枢数, 线段中枢数)，不需要淘汰时返回 None"""
+        max_history = self.config.max_history
+        last_sure_seg_idx = get_last_sure_seg_idx(self.seg_list)
+        # 可淘汰的线段不少于窗口大小时才截断，重新编号的代价均摊到每个线段上
+        if last_sure_seg_idx - max_history + 1 < max_history:
+            return None
+        # 截断点取在线段的线段起点（线段中枢、线段买卖点按线段的线段计算），且至少保留最后三个确定的线段的线段
+        segseg_idx = bisect_right(self.segseg_list.lst, last_sure_seg_idx - max_history + 1, key=lambda seg: seg.start_bi.idx) - 1
+        segseg_idx = min(segseg_idx, get_last_sure_seg_idx(self.segseg_list) - 2)
+        while segseg_idx > 0:
+            seg_cnt = self.segseg_list[segseg_idx].start_bi.idx
+            if seg_cnt < max_history:
+                return None
+            bi_cnt = self.seg_list[seg_cnt].start_bi.idx
+            zs_cnt = self.zs_list.retire_cnt(bi_cnt)
+            segzs_cnt = self.segzs_list.retire_cnt(seg_cnt)
+            if zs_cnt is not None and segzs_cnt is not None:
+                return segseg_idx, seg_cnt, bi_cnt, zs_cnt, segzs_cnt
+            segseg_idx -= 1
+        return None
+
+    def set_event_listener(self, listener: Optional[Callable[[CChanEvent], None]]):
+        """设置买卖点/笔/线段事件的回调，None 表示不产生事件"""
+        if listener is None:
+            self.bs_point_lst.event_listener = None
+            self.seg_bs_point_lst.event_listener = None
+            return
+        self.bs_point_lst.event_listener = lambda event_type, obj: listener(CChanEvent(event_type, self.kl_type, obj, is_seg=False))
+        self.seg_bs_point_lst.event_listener = lambda event_type, obj: listener(CChanEvent(event_type, self.kl_type, obj, is_seg=True))
+
     def need_cal_step_by_step(self):
         """判断是否需要逐步计算模式"""
         return self.config.trigger_step  # 从配置获取计算模式
@@ -168,8 +279,15 @@ class CKLine_List:
         """
         # 设置技术指标
         klu.set_metric(self.metric_model_lst)
+        self.klu_index.add_klu(klu.time.ts)
         # print(klu)
+        if self.pending_klu is not None:
+            self.pending_klu.append(klu)
+            return
+        self.combine_klu(klu)
 
+    def combine_klu(self, klu: CKLine_Unit):
+        """K线单元合并到最后一根合并K线或新建合并K线，并更新分型、笔"""
         if len(self.lst) == 0:  # 首个K线
             self.lst.append(CKLine(klu, idx=0))
         else:
@@ -190,11 +308,92 @@ class CKLine_List:
                 # 处理虚拟笔的特殊情况（参见issue#175）
                 self.cal_seg_and_zs()
 
+    def begin_klu_batch(self):
+        """
+        非逐步计算时，之后 add_single_klu 只设置指标和索引，合并K线、分型、笔留到 flush_klu_batch 一次处理
+        期间 self.lst 不变，K线单元的父子关系、跨级别索引照常设置
+        """
+        if not self.step_calculation:
+            self.pending_klu = []
+
+    def flush_klu_batch(self):
+        pending_klu, self.pending_klu = self.pending_klu, None
+        combine_preset, self.combine_preset = self.combine_preset, None
+        if not pending_klu:
+            return
+        if len(self.lst) > 0:
+            # 接着已有的合并K线继续合并（如多次 trigger_load），逐根处理
+            for klu in pending_klu:
+                self.combine_klu(klu)
+            return
+        # 加入的K线单元都来自预置时的列表，个数相同即是同一组（次级别末尾用不上的K线单元不加入，此时重新合并）
+        if combine_preset is not None and len(combine_preset[0]) == len(pending_klu) and combine_preset[0][-1] is pending_klu[-1]:
+            self.combine_klu_lst(pending_klu, combine_preset[1])
+        else:
+            self.combine_klu_lst(pending_klu)
+
+    def combine_klu_lst(self, klu_lst: List[CKLine_Unit], res: Optional[CKLineCombineResult] = None):
+        """
+        从头合并一组K线单元：cal_combine 一次算出合并K线的区间、高低点、方向、分型，再生成合并K线并更新笔，结果与逐根 combine_klu 一致
+        每根合并K线先以第一根K线单元的状态参与前一根的分型和笔的计算（逐根合并时正是这个时序），之后再补上其余K线单元和合并结果
+        res 为已算好的合并结果（见 combine_preset）
+        """
+        try:
+            if res is None:
+                res = cal_combine([klu.high for klu in klu_lst], [klu.low for klu in klu_lst])
+        except CChanException:
+            # 数据异常时逐根合并，在同一根K线上报同样的错
+            for klu in klu_lst:
+                self.combine_klu(klu)
+            return
+        for klc_idx, (begin, end) in enumerate(res.klu_range()):
+            klc = CKLine(klu_lst[begin], idx=klc_idx, _dir=res.dir[klc_idx])
+            self.lst.append(klc)
+            if klc_idx >= 2:
+                self.lst[-2].link_fx(self.lst[-3], klc, res.fx[klc_idx-1])
+            if klc_idx >= 1:
+                self.bi_list.update_bi(self.lst[-2], klc, False)
+            klc.add_combined(klu_lst[begin+1:end], res.high[klc_idx], res.low[klc_idx])
+
     def klu_iter(self, klc_begin_idx=0):
         """迭代器：遍历原始K线单元"""
         for klc in self.lst[klc_begin_idx:]:
             yield from klc.lst
 
+    def detach_links(self):
+        """
+        断开相邻K线、合并K线、笔、线段之间的前后链接，跨进程 pickle 时不会沿着链表逐个递归，收到后用 restore_links 恢复
+        首尾对外的链接保持不变；笔、线段的 parent_seg 也一并断开（线段的特征序列会引用下一线段的笔，否则仍会逐段递归）
+        """
+        # 第一根合并K线的 next 要等 update_fx 才会设置，保持原样
+        for klc in self.lst[1:]:
+            klc.set_pre(None)
+            klc.set_next(None)
+        unlink_adjacent(list(self.klu_iter()))
+        unlink_adjacent(self.bi_list.bi_list)
+        unlink_adjacent(self.seg_list.lst)
+        unlink_adjacent(self.segseg_list.lst)
+        for line in chain(self.bi_list.bi_list, self.seg_list.lst):
+            line.parent_seg = None
+
+    def restore_links(self):
+        """恢复 detach_links 断开的链接"""
+        # 合并K线的前后链接在 update_fx 时建立，至少有三根时除第一根的 next 外都已设置
+        if len(self.lst) >= 3:
+            for pre_klc, klc in zip(self.lst, self.lst[1:]):
+                klc.set_pre(pre_klc)
+            for klc, next_klc in zip(self.lst[1:], self.lst[2:]):
+                klc.set_next(next_klc)
+        link_adjacent(list(self.klu_iter()))
+        link_adjacent(self.bi_list.bi_list)
+        link_adjacent(self.seg_list.lst)
+        link_adjacent(self.segseg_list.lst)
+        # parent_seg 与父线段的 bi_list 一一对应
+        for seg_list in (self.seg_list, self.segseg_list):
+            for seg in seg_list.lst:
+                for line in seg.bi_list:
+                    line.parent_seg = seg
+
 
 def cal_seg(bi_list, seg_list: CSegListComm, last_sure_seg_start_bi_idx):
     """更新线段结构并返回最后确认线段的起始笔索引"""
@@ -237,41 +436,90 @@ def cal_seg(bi_list, seg_list: CSegListComm, last_sure_seg_start_bi_idx):
     return last_sure_seg_start_bi_idx
 
 
-def update_zs_in_seg(bi_list, seg_list, zs_list):
-    """将中枢关联到对应的线段"""
-    sure_seg_cnt = 0  # 已确认线段计数器
+def get_last_sure_seg_idx(seg_list: CSegListComm) -> int:
+    """最后一个确定线段的索引，没有时返回 -1"""
     seg_idx = len(seg_list) - 1
+    while seg_idx >= 0 and not seg_list[seg_idx].is_sure:
+        seg_idx -= 1
+    return seg_idx
+
+
+def unlink_retired_klu(klu: CKLine_Unit):
+    """被淘汰的K线单元断开前后链接，并从父级别K线的子K线列表中移除，子级别K线也不再指向它"""
+    klu.pre = None
+    klu.next = None
+    if klu.sup_kl is not None and klu.sup_kl.sub_kl_list and klu.sup_kl.sub_kl_list[0] is klu:
+        del klu.sup_kl.sub_kl_list[0]
+    for sub_klu in klu.sub_kl_list:
+        sub_klu.sup_kl = None
+
+
+def unlink_adjacent(lst):
+    """断开列表中相邻元素之间的 pre/next"""
+    for pre_item, item in zip(lst, lst[1:]):
+        if pre_item.next is item and item.pre is pre_item:
+            pre_item.next = None
+            item.pre = None
+
 
+def link_adjacent(lst):
+    """按列表顺序恢复相邻元素之间的 pre/next"""
+    for pre_item, item in zip(lst, lst[1:]):
+        pre_item.next = item
+        item.pre = pre_item
+
+
+def update_zs_in_seg(bi_list, seg_list, zs_list: CZSList):
+    """将中枢关联到对应的线段"""
     # 逆向遍历线段列表
+    seg_idx = len(seg_list) - 1
     while seg_idx >= 0:
         seg = seg_list[seg_idx]
-        if seg.ele_inside_is_sure:  # 跳过已确认内部元素的线段
+        # 中枢按起始笔有序，二分得到起始笔落在线段内的中枢区间；与原有列表相同时不重建
+        zs_begin, zs_end = zs_list.zs_range_in(seg.start_bi.idx, seg.end_bi.idx)
+        if not is_same_zs_range(seg.zs_lst, zs_list, zs_begin, zs_end):
+            seg.set_zs_lst(zs_list[zs_begin:zs_end])
+        elif seg.zs_lst:
+            # 线段和中枢都只在尾部增删改：这个线段上次关联的中枢仍在原位，说明它和更早的线段、中枢都没有变化
             break
-
-        # 清空线段中的旧中枢
-        seg.clear_zs_lst()
-
-        # 逆向遍历中枢列表进行关联
-        _zs_idx = len(zs_list) - 1
-        while _zs_idx >= 0:
-            zs = zs_list[_zs_idx]
-            # 中枢结束位置早于线段开始位置时终止
-            if zs.end.idx < seg.start_bi.get_begin_klu().idx:
-                break
-            # 中枢在线段范围内则添加
-            if zs.is_inside(seg):
-                seg.add_zs(zs)
-            # 设置中枢的进出笔
-            assert zs.begin_bi.idx > 0
-            zs.set_bi_in(bi_list[zs.begin_bi.idx - 1])
-            if zs.end_bi.idx + 1 < len(bi_list):
-                zs.set_bi_out(bi_list[zs.end_bi.idx + 1])
-            # 关联中枢包含的笔列表
+        seg_idx -= 1
+
+    # 设置中枢的进出笔及包含的笔：只处理第一个线段开始之后的中枢
+    if len(seg_list) > 0:
+        update_zs_bi(bi_list, zs_list, seg_list[0].start_bi.get_begin_klu().idx)
+
+
+def is_same_zs_range(seg_zs_lst, zs_list: CZSList, zs_begin: int, zs_end: int) -> bool:
+    # 中枢只在尾部增删改，首尾是同一对象时中间也都相同
+    if len(seg_zs_lst) != zs_end - zs_begin:
+        return False
+    return zs_begin == zs_end or (seg_zs_lst[0] is zs_list[zs_begin] and seg_zs_lst[-1] is zs_list[zs_end - 1])
+
+
+def update_zs_bi(bi_list, zs_list: CZSList, begin_klu_idx: int):
+    """从后往前设置中枢的进出笔和包含的笔，遇到完全未变化的中枢即停止"""
+    # 处理范围比上次更靠前时，更早的中枢此前没有设置过，不能提前停止
+    can_stop = begin_klu_idx >= zs_list.attach_begin_klu_idx
+    zs_list.attach_begin_klu_idx = begin_klu_idx
+    _zs_idx = len(zs_list) - 1
+    while _zs_idx >= 0:
+        zs = zs_list[_zs_idx]
+        # 中枢结束位置早于线段开始位置时终止
+        if zs.end.idx < begin_klu_idx:
+            break
+        assert zs.begin_bi.idx > 0
+        bi_in = bi_list[zs.begin_bi.idx - 1]
+        bi_out = bi_list[zs.end_bi.idx + 1] if zs.end_bi.idx + 1 < len(bi_list) else None
+        bi_lst_same = len(zs.bi_lst) == zs.end_bi.idx - zs.begin_bi.idx + 1 and \
+            zs.bi_lst[0] is bi_list[zs.begin_bi.idx] and zs.bi_lst[-1] is bi_list[zs.end_bi.idx]
+        # 出笔仍是同一对象，说明出笔及之前的笔都没有被替换；更早的中枢只可能在当时位于尾部时被修改，此时也已处理过
+        if can_stop and bi_out is not None and zs.bi_out is bi_out and zs.bi_in is bi_in and bi_lst_same:
+            break
+        if zs.bi_in is not bi_in:
+            zs.set_bi_in(bi_in)
+        if bi_out is not None and zs.bi_out is not bi_out:
+            zs.set_bi_out(bi_out)
+        # 包含的笔有变化时才重新生成列表
+        if not bi_lst_same:
             zs.set_bi_lst(list(bi_list[zs.begin_bi.idx:zs.end_bi.idx + 1]))
-            _zs_idx -= 1
-
-        # 更新线段内部元素确认状态
-        if sure_seg_cnt > 2:
-            if not seg.ele_inside_is_sure:
-                seg.ele_inside_is_sure = True
-        seg_idx -= 1
\ No newline at end of file
+        _zs_idx -= 1
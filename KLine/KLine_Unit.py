@@ -173,20 +173,6 @@ class CKLine_Unit:
         assert self.sup_kl is not None
         return self.sup_kl.klc
 
-    def include_sub_lv_time(self, sub_lv_t: str) -> bool:
-        """检查是否包含指定时间的子级别K线（递归查询）
-        Args:
-            sub_lv_t: 目标时间字符串
-        """
-        if self.time.to_str() == sub_lv_t:
-            return True
-        for sub_klu in self.sub_kl_list:
-            if sub_klu.time.to_str() == sub_lv_t:
-                return True
-            if sub_klu.include_sub_lv_time(sub_lv_t):
-                return True
-        return False
-
     def set_pre_klu(self, pre_klu: Optional['CKLine_Unit']):
         """设置前驱K线并建立双向链接"""
         if pre_klu is None:
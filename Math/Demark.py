@@ -195,6 +195,10 @@ class CDemarkEngine:
         for s in invalid_series:
             self.series.remove(s)
 
+    def trim(self):
+        # 新序列只取最后 SETUP_BIAS+2 根，淘汰历史K线时丢弃更早的
+        del self.kl_lst[:-CDemarkEngine.SETUP_BIAS-2]
+
     def clean_series_from_setup_finish(self):
         finished_setup: Optional[int] = None
         for series in self.series:
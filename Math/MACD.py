@@ -27,3 +27,7 @@ class CMACD:
             _dea = (2 * _dif + (self.signalperiod - 1) * self.macd_info[-1].DEA) / (self.signalperiod + 1)
             self.macd_info.append(CMACD_item(fast_ema=_fast_ema, slow_ema=_slow_ema, DIF=_dif, DEA=_dea))
         return self.macd_info[-1]
+
+    def trim(self):
+        # 只有最后一项参与递推，淘汰历史K线时丢弃其余
+        del self.macd_info[:-1]
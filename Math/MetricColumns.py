@@ -0,0 +1,289 @@
+import math
+import sys
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+from Common.CEnum import TREND_TYPE
+
+from .BOLL import BOLL_Metric, BollModel
+from .MACD import CMACD, CMACD_item
+from .TrendModel import CTrendModel
+
+try:
+    import numba  # 可选依赖，安装了才按列计算布林线
+except ImportError:
+    numba = None
+
+# 内置 sum 对浮点数的累加方式：3.12 起为 Neumaier 补偿求和，之前为顺序累加；按列计算均值时照此累加，结果与逐根计算一致
+PY_SUM_COMPENSATED = sys.version_info >= (3, 12)
+
+
+def is_float_column(close_lst: Sequence) -> bool:
+    """收盘价都是有限的 float 时才能按列计算（int 参与运算的结果类型不同，NaN 下 max/min 与 numpy 不一致）"""
+    return all(type(close) is float for close in close_lst) and all(math.isfinite(close) for close in close_lst)
+
+
+def add_like_sum(total: np.ndarray, comp: np.ndarray, item: np.ndarray):
+    """total（及补偿项 comp）原地累加一项，与内置 sum 的一步相同；total、comp 可以是视图，item 可广播"""
+    if not PY_SUM_COMPENSATED:
+        total += item
+        return
+    t = total + item
+    comp += np.where(np.abs(total) >= np.abs(item), (total - t) + item, (item - t) + total)
+    total[...] = t
+
+
+def finish_like_sum(total: np.ndarray, comp: np.ndarray):
+    if PY_SUM_COMPENSATED:
+        mask = (comp != 0) & np.isfinite(comp)
+        total[mask] += comp[mask]
+
+
+def window_sum(x: np.ndarray, N: int) -> np.ndarray:
+    """x 为 (股票, K线) 二维数组，返回每个位置向前 N 个（不足 N 个时从头开始）元素之和，累加顺序与 sum(arr[-N:]) 相同"""
+    T = x.shape[1]
+    total, comp = np.zeros(x.shape), np.zeros(x.shape)
+    head = min(N - 1, T)
+    for k in range(head):  # 前 N-1 个位置窗口从头开始，第 k 项只加到位置 k 及之后
+        add_like_sum(total[:, k:head], comp[:, k:head], x[:, k:k+1])
+    if T > head:
+        for k in range(N):
+            add_like_sum(total[:, head:], comp[:, head:], x[:, k:k+T-head])
+    finish_like_sum(total, comp)
+    return total
+
+
+def window_extreme(x: np.ndarray, N: int, func) -> np.ndarray:
+    """向前 N 个元素的最大（func=np.maximum）或最小值"""
+    T = x.shape[1]
+    head = min(N - 1, T)
+    res = np.empty(x.shape)
+    res[:, :head] = func.accumulate(x[:, :head], axis=1)
+    if T > head:
+        body = x[:, :T-head].copy()
+        for k in range(1, N):
+            func(body, x[:, k:k+T-head], out=body)
+        res[:, head:] = body
+    return res
+
+
+def window_cnt(T: int, N: int) -> np.ndarray:
+    return np.minimum(np.arange(1, T + 1), N)
+
+
+def boll_kernel(close, klu_cnt, N, power, compensated, ma, theta):
+    """
+    布林线内核，与 BollModel.add 逐根计算一致：均值、方差都按内置 sum 的方式累加
+    平方用 pow（power 由调用方传入 2.0，避免被编译成乘法），与 Python 的 ** 相同
+    """
+    for row in range(close.shape[0]):
+        for t in range(klu_cnt[row]):
+            begin = max(0, t - N + 1)
+            n = t - begin + 1
+            total, comp = 0.0, 0.0
+            for idx in range(begin, t + 1):
+                x = close[row, idx]
+                s = total + x
+                if compensated:
+                    if abs(total) >= abs(x):
+                        comp += (total - s) + x
+                    else:
+                        comp += (x - s) + total
+                total = s
+            if compensated and comp != 0.0 and math.isfinite(comp):
+                total += comp
+            _ma = total / n
+            total, comp = 0.0, 0.0
+            for idx in range(begin, t + 1):
+                x = abs(close[row, idx] - _ma) ** power
+                s = total + x
+                if compensated:
+                    if abs(total) >= abs(x):
+                        comp += (total - s) + x
+                    else:
+                        comp += (x - s) + total
+                total = s
+            if compensated and comp != 0.0 and math.isfinite(comp):
+                total += comp
+            ma[row, t] = _ma
+            theta[row, t] = math.sqrt(total / n)
+
+
+# 平方只有调用 libm pow 才与 Python 一致，numpy 的 power 用的是自己的实现，所以布林线只在有 numba 时按列计算
+boll_kernel_jit = numba.njit(cache=True, nogil=True)(boll_kernel) if numba is not None else None
+
+
+class CMetricColumns:
+    """
+    同一级别多只股票的收盘价按 (股票, K线) 排成二维数组，MACD、均线、极值、布林线在所有股票上一起计算
+    结果与逐根调用各指标模型完全一致，由 preset_models 预置到各股票的指标模型中，加载K线时按序取用
+    """
+
+    def __init__(self, close_lst_lst: List[List[float]]):
+        self.close_lst_lst = close_lst_lst
+        self.klu_cnt = np.array([len(close_lst) for close_lst in close_lst_lst], dtype=np.int64)
+        self.close = np.zeros((len(close_lst_lst), int(self.klu_cnt.max(initial=0))))
+        for row, close_lst in enumerate(close_lst_lst):
+            self.close[row, :len(close_lst)] = close_lst
+
+    def cal(self, model) -> Optional[list]:
+        """按模型参数计算各股票的指标序列，不支持的模型返回 None"""
+        if type(model) is CMACD:
+            return self.macd(model.fastperiod, model.slowperiod, model.signalperiod)
+        if type(model) is CTrendModel:
+            return self.trend(model.type, model.T)
+        if type(model) is BollModel and boll_kernel_jit is not None:
+            return self.boll(model.N)
+        return None
+
+    def macd(self, fastperiod, slowperiod, signalperiod) -> List[List[CMACD_item]]:
+        close = np.ascontiguousarray(self.close.T)  # 按K线推进，每步取一行
+        fast_ema, slow_ema, dea = np.empty(close.shape), np.empty(close.shape), np.zeros(close.shape)
+        fast_ema[0] = slow_ema[0] = close[0]
+        for idx in range(1, close.shape[0]):
+            fast_ema[idx] = (2 * close[idx] + (fastperiod - 1) * fast_ema[idx-1]) / (fastperiod + 1)
+            slow_ema[idx] = (2 * close[idx] + (slowperiod - 1) * slow_ema[idx-1]) / (slowperiod + 1)
+            # 第一项的 DEA 是整数 0，2*dif + 0.0 与 2*dif + 0 相同
+            dea[idx] = (2 * (fast_ema[idx] - slow_ema[idx]) + (signalperiod - 1) * dea[idx-1]) / (signalperiod + 1)
+        res = []
+        for row, close_lst in enumerate(self.close_lst_lst):
+            if not close_lst:
+                res.append([])
+                continue
+            cnt = len(close_lst)
+            item_lst = [CMACD_item(fast_ema=close_lst[0], slow_ema=close_lst[0], DIF=0, DEA=0)]
+            item_lst.extend(
+                CMACD_item(fast_ema=_fast, slow_ema=_slow, DIF=_fast - _slow, DEA=_dea)
+                for _fast, _slow, _dea in zip(fast_ema[1:cnt, row].tolist(), slow_ema[1:cnt, row].tolist(), dea[1:cnt, row].tolist())
+            )
+            res.append(item_lst)
+        return res
+
+    def trend(self, trend_type: TREND_TYPE, T: int) -> Optional[List[List[float]]]:
+        if trend_type == TREND_TYPE.MEAN:
+            value = window_sum(self.close, T) / window_cnt(self.close.shape[1], T)
+        elif trend_type == TREND_TYPE.MAX:
+            value = window_extreme(self.close, T, np.maximum)
+        elif trend_type == TREND_TYPE.MIN:
+            value = window_extreme(self.close, T, np.minimum)
+        else:
+            return None  # 交给 CTrendModel 报错
+        return [value[row, :cnt].tolist() for row, cnt in enumerate(self.klu_cnt.tolist())]
+
+    def boll(self, N) -> List[List[BOLL_Metric]]:
+        ma, theta = np.zeros(self.close.shape), np.zeros(self.close.shape)
+        boll_kernel_jit(self.close, self.klu_cnt, N, 2.0, PY_SUM_COMPENSATED, ma, theta)
+        return [
+            [BOLL_Metric(_ma, _theta) for _ma, _theta in zip(ma[row, :cnt].tolist(), theta[row, :cnt].tolist())]
+            for row, cnt in enumerate(self.klu_cnt.tolist())
+        ]
+
+    def preset_models(self, model_lst_lst: List[list]) -> List[list]:
+        """
+        各股票（与 close_lst_lst 一一对应）的指标模型列表换成预置了结果的模型，结构相同的模型只算一次
+        模型已有状态（加载过K线）时保持不变
+        """
+        res = [list(model_lst) for model_lst in model_lst_lst]
+        if not res:
+            return res
+        for model_idx, model in enumerate(model_lst_lst[0]):
+            value_lst_lst = self.cal(model)
+            if value_lst_lst is None:
+                continue
+            for row, model_lst in enumerate(res):
+                model_lst[model_idx] = preset_model(model_lst[model_idx], self.close_lst_lst[row], value_lst_lst[row])
+        return res
+
+
+class CMetricPreset:
+    """预置的指标序列：加载的收盘价与批量计算时逐个相同（同一对象）时按序返回，否则不再使用"""
+
+    def __init__(self, close_lst: List[float], value_lst: list):
+        self.close_lst = close_lst
+        self.value_lst = value_lst
+        self.cnt = 0  # 已取用的个数
+        self.active = True
+
+    def next(self, close):
+        if self.active and self.cnt < len(self.value_lst) and close is self.close_lst[self.cnt]:
+            self.cnt += 1
+            return self.value_lst[self.cnt-1]
+        self.active = False
+        return None
+
+    def window(self, N) -> List[float]:
+        """已取用的最后 N 个收盘价，即逐根计算时模型的 arr"""
+        return self.close_lst[max(0, self.cnt - N):self.cnt]
+
+
+class CPresetMACD(CMACD):
+    def __init__(self, model: CMACD, preset: CMetricPreset):
+        super().__init__(model.fastperiod, model.slowperiod, model.signalperiod)
+        self.preset = preset
+
+    def add(self, value) -> CMACD_item:
+        item = self.preset.next(value)
+        if item is None:
+            return super().add(value)
+        self.macd_info.append(item)
+        return item
+
+    def to_model(self) -> CMACD:
+        model = CMACD(self.fastperiod, self.slowperiod, self.signalperiod)
+        model.macd_info = self.macd_info
+        return model
+
+
+class CPresetTrend(CTrendModel):
+    def __init__(self, model: CTrendModel, preset: CMetricPreset):
+        super().__init__(model.type, model.T)
+        self.preset: Optional[CMetricPreset] = preset
+
+    def add(self, value) -> float:
+        if self.preset is not None:
+            res = self.preset.next(value)
+            if res is not None:
+                return res
+            self.arr, self.preset = self.preset.window(self.T), None
+        return super().add(value)
+
+    def to_model(self) -> CTrendModel:
+        model = CTrendModel(self.type, self.T)
+        model.arr = self.arr if self.preset is None else self.preset.window(self.T)
+        return model
+
+
+class CPresetBoll(BollModel):
+    def __init__(self, model: BollModel, preset: CMetricPreset):
+        super().__init__(model.N)
+        self.preset: Optional[CMetricPreset] = preset
+
+    def add(self, value) -> BOLL_Metric:
+        if self.preset is not None:
+            res = self.preset.next(value)
+            if res is not None:
+                return res
+            self.arr, self.preset = self.preset.window(self.N), None
+        return super().add(value)
+
+    def to_model(self) -> BollModel:
+        model = BollModel(self.N)
+        model.arr = self.arr if self.preset is None else self.preset.window(self.N)
+        return model
+
+
+def preset_model(model, close_lst: List[float], value_lst: list):
+    preset = CMetricPreset(close_lst, value_lst)
+    if type(model) is CMACD and not model.macd_info:
+        return CPresetMACD(model, preset)
+    if type(model) is CTrendModel and not model.arr:
+        return CPresetTrend(model, preset)
+    if type(model) is BollModel and not model.arr:
+        return CPresetBoll(model, preset)
+    return model
+
+
+def restore_models(model_lst: list) -> list:
+    """加载完后换回普通的指标模型，状态与逐根计算相同，不再引用预置的序列"""
+    return [model.to_model() if isinstance(model, (CPresetMACD, CPresetTrend, CPresetBoll)) else model for model in model_lst]
@@ -27,3 +27,12 @@ class RSI:
         rs = self.up[-1] / self.down[-1] if self.down[-1] != 0 else 0
         rsi = 100.0 - 100.0 / (1.0 + rs)
         return rsi
+
+    def trim(self):
+        # 预热期之后只用到最后一个收盘价和平滑值，diff 保留 period 个以维持预热判断
+        if len(self.diff) < self.period:
+            return
+        del self.close_arr[:-1]
+        del self.diff[:-self.period]
+        del self.up[:-1]
+        del self.down[:-1]
@@ -1,19 +1,209 @@
+from typing import Dict, Optional, Tuple
+
 import matplotlib.pyplot as plt
-from IPython.display import clear_output, display
+from matplotlib.animation import FFMpegWriter, PillowWriter
+from matplotlib.axes import Axes
+from matplotlib.collections import Collection, LineCollection
 
 from Chan import CChan
 
-from .PlotDriver import CPlotDriver
+from .PlotDriver import CPlotDriver, GetPlotMeta, add_line_collection, add_rect_collection, create_figure, parse_plot_config, rect_verts
+from .PlotMeta import CChanPlotMeta
 
 
-class CAnimateDriver:
-    def __init__(self, chan: CChan, plot_config=None, plot_para=None):
+class CAnimateDriver(CPlotDriver):
+    """
+    逐步回放 step_load 的每一步：整个回放只创建一个 Figure，之后每帧在原有 artist 上更新
+        - K线、合并K线、笔、线段、中枢：按名字复用上一帧的 Collection，只替换顶点（新K线追加在末尾，最后一笔/线段的端点移动）
+        - 买卖点：只为新出现的创建文字和箭头，已有的只调整位置，消失的移除
+        - MACD：DIF/DEA 线和柱子原地更新
+        - 其余元素（序号、价格文字、均线、布林线等）每帧移除后重画
+    save_path 为空时在 IPython 中逐帧显示；否则离线导出，.gif 用 Pillow，其他后缀（如 .mp4）用 ffmpeg
+    frame_step: 每隔多少步出一帧，最后一步总会出帧
+    """
+    def __init__(
+        self,
+        chan: CChan,
+        plot_config=None,
+        plot_para=None,
+        save_path: Optional[str] = None,
+        fps=5,
+        dpi=None,
+        frame_step=1,
+    ):
         if plot_config is None:
             plot_config = {}
         if plot_para is None:
             plot_para = {}
-        for _ in chan.step_load():
-            g = CPlotDriver(chan, plot_config, plot_para)
+        self.chan = chan
+        self.plot_config = parse_plot_config(plot_config, chan.lv_list)
+        self.plot_para = plot_para
+        self.figure = None
+        self.axes = None
+        self.frame_idx = 0
+        self.collections: Dict[Tuple[Axes, str], Collection] = {}  # (Axes, 元素名) -> 跨帧复用的 Collection
+        self.put_keys = set()  # 本帧更新过的 Collection
+        self.bsp_artists: Dict[Axes, dict] = {}  # Axes -> {买卖点 key: [文字, 箭头, 最后出现的帧号]}
+        self.macd_lines: Dict[Axes, list] = {}  # MACD Axes -> [DIF 线, DEA 线]
+        self.frame_artists = []  # 本帧重画的 artist（含 twinx 新建的 Axes），下一帧开始时移除
+
+        writer = None
+        if save_path is not None:
+            writer = PillowWriter(fps=fps) if save_path.lower().endswith('.gif') else FFMpegWriter(fps=fps)
+        self.is_writing = False
+        try:
+            step_idx = -1
+            drawn_idx = -1
+            for step_idx, _ in enumerate(chan.step_load()):
+                if step_idx % frame_step != 0:
+                    continue
+                self.output_frame(writer, save_path, dpi)
+                drawn_idx = step_idx
+            if drawn_idx != step_idx:
+                self.output_frame(writer, save_path, dpi)
+        finally:
+            if self.is_writing:
+                writer.finish()
+            if self.figure is not None:
+                plt.close(self.figure)
+
+    def output_frame(self, writer, save_path, dpi):
+        is_first = self.figure is None
+        self.draw_frame()
+        if writer is None:
+            from IPython.display import clear_output, display  # 只有在 notebook 中显示时才需要 IPython
             clear_output(wait=True)
-            display(g.figure)
-            plt.close(g.figure)
+            display(self.figure)
+            return
+        if is_first:
+            writer.setup(self.figure, save_path, dpi=dpi)
+            self.is_writing = True
+        writer.grab_frame()
+
+    def draw_frame(self):
+        """按 chan 当前状态画一帧"""
+        figure_config: dict = self.plot_para.get('figure', {})
+        plot_metas = GetPlotMeta(self.chan, figure_config)
+        if self.figure is None:
+            self.lv_lst = self.chan.lv_list[:len(plot_metas)]
+            plot_macd = {kl_type: conf.get("plot_macd", False) for kl_type, conf in self.plot_config.items()}
+            self.figure, self.axes = create_figure(plot_macd, figure_config, self.lv_lst)
+        for artist in self.frame_artists:
+            artist.remove()
+        self.frame_artists = []
+        self.put_keys.clear()
+        self.frame_idx += 1
+
+        x_range = self.GetRealXrange(figure_config, plot_metas[0])
+        self.DrawLevels(self.chan, self.plot_config, plot_metas, self.axes, self.plot_para, x_range)
+
+        # 本帧没有画到的元素（如虚线中枢都已确定）清空，Collection 留着下一帧用
+        for key, collection in self.collections.items():
+            if key not in self.put_keys:
+                if isinstance(collection, LineCollection):
+                    collection.set_segments([])
+                else:
+                    collection.set_verts([])
+        # 本帧没有再出现的买卖点
+        for artist_dict in self.bsp_artists.values():
+            for key in [key for key, item in artist_dict.items() if item[2] != self.frame_idx]:
+                text, arrow, _ = artist_dict.pop(key)
+                text.remove()
+                arrow.remove()
+
+    def DrawElement(self, plot_config: Dict[str, bool], meta: CChanPlotMeta, ax: Axes, lv, plot_para, ax_macd: Optional[Axes], x_limits):
+        # 绘制前后对比 Axes 的子元素，新增的且不是跨帧复用的，就是本帧重画的
+        ax_lst = [ax] if ax_macd is None else [ax, ax_macd]
+        before_axes = set(self.figure.axes)
+        before = {id(artist) for _ax in ax_lst for artist in _ax.get_children()}
+        super().DrawElement(plot_config, meta, ax, lv, plot_para, ax_macd, x_limits)
+        reused = {id(artist) for artist in self.reused_artists()}
+        for _ax in ax_lst:
+            for artist in _ax.get_children():
+                if id(artist) not in before and id(artist) not in reused:
+                    self.frame_artists.append(artist)
+        self.frame_artists.extend(_ax for _ax in self.figure.axes if _ax not in before_axes)  # rsi/kdj 的 twinx
+
+    def reused_artists(self):
+        yield from self.collections.values()
+        for artist_dict in self.bsp_artists.values():
+            for text, arrow, _ in artist_dict.values():
+                yield text
+                yield arrow
+        for line_lst in self.macd_lines.values():
+            yield from line_lst
+
+    def put_line_collection(self, ax: Axes, name, segment_lst, color, linewidth=None, linestyle='solid'):
+        self.put_keys.add((ax, name))
+        collection = self.collections.get((ax, name))
+        if collection is None:
+            collection = add_line_collection(ax, segment_lst, color, linewidth=linewidth, linestyle=linestyle)
+            if collection is not None:
+                self.collections[(ax, name)] = collection
+            return
+        collection.set_segments(segment_lst)
+        collection.set_color(color)
+
+    def put_rect_collection(self, ax: Axes, name, rect_lst, edgecolor, facecolor='none', linewidth=None, linestyle='solid'):
+        self.put_keys.add((ax, name))
+        collection = self.collections.get((ax, name))
+        if collection is None:
+            collection = add_rect_collection(ax, rect_lst, edgecolor, facecolor=facecolor, linewidth=linewidth, linestyle=linestyle)
+            if collection is not None:
+                self.collections[(ax, name)] = collection
+            return
+        collection.set_verts(rect_verts(rect_lst))
+        collection.set_edgecolor(edgecolor)
+        collection.set_facecolor(facecolor)
+
+    def draw_macd(self, meta: CChanPlotMeta, ax: Axes, x_limits, width=0.4):
+        x_begin = x_limits[0]
+        macd_lst = [klu.macd for klu in meta.klu_iter(x_begin)]
+        assert macd_lst[0] is not None, "you can't draw macd until you delete macd_metric=False"
+
+        x_idx = range(x_begin, x_begin+len(macd_lst))
+        dif_line = [macd.DIF for macd in macd_lst]
+        dea_line = [macd.DEA for macd in macd_lst]
+        macd_bar = [macd.macd for macd in macd_lst]
+        if ax not in self.macd_lines:
+            self.macd_lines[ax] = [ax.plot(x_idx, dif_line, "#FFA500")[0], ax.plot(x_idx, dea_line, "#0000ff")[0]]
+        else:
+            self.macd_lines[ax][0].set_data(x_idx, dif_line)
+            self.macd_lines[ax][1].set_data(x_idx, dea_line)
+        # 柱子画成一个 PolyCollection，大于等于0红色，小于0深绿色
+        self.put_rect_collection(
+            ax,
+            'macd_bar',
+            [(x - width / 2, 0, width, macd) for x, macd in zip(x_idx, macd_bar)],
+            edgecolor='none',
+            facecolor=["#006400" if macd < 0 else "r" for macd in macd_bar],
+            linewidth=0,
+        )
+        ax.set_ylim(min(min(dif_line), min(dea_line), min(macd_bar)), max(max(dif_line), max(dea_line), max(macd_bar)))
+
+    def bsp_common_draw(self, bsp_list, ax: Axes, buy_color, sell_color, fontsize, arrow_l, arrow_h, arrow_w):
+        x_begin = ax.get_xlim()[0]
+        y_range = self.y_max-self.y_min
+        artist_dict = self.bsp_artists.setdefault(ax, {})
+        for bsp in bsp_list:
+            if bsp.x < x_begin:
+                continue
+            color = buy_color if bsp.is_buy else sell_color
+            arrow_dir = 1 if bsp.is_buy else -1
+            arrow_len = arrow_l*y_range
+            arrow_head = arrow_len*arrow_h
+            text_y = bsp.y-arrow_len*arrow_dir
+            # 箭头长度随 Y 轴范围变化，已有的买卖点只移动文字、调整箭头
+            key = (bsp.x, bsp.y, bsp.desc(), color, fontsize, arrow_w)
+            if key in artist_dict:
+                text, arrow, _ = artist_dict[key]
+                text.set_y(text_y)
+                arrow.set_data(y=text_y, dy=(arrow_len-arrow_head)*arrow_dir, head_length=arrow_head)
+            else:
+                text = ax.text(bsp.x, text_y, f'{bsp.desc()}', fontsize=fontsize, color=color, verticalalignment='top' if bsp.is_buy else 'bottom', horizontalalignment='center')
+                arrow = ax.arrow(bsp.x, text_y, 0, (arrow_len-arrow_head)*arrow_dir, head_width=arrow_w, head_length=arrow_head, color=color)
+            artist_dict[key] = [text, arrow, self.frame_idx]
+            if text_y < self.y_min:
+                self.y_min = text_y
+            if text_y > self.y_max:
+                self.y_max = text_y
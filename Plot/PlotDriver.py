@@ -1,4 +1,5 @@
 import inspect
+from itertools import islice
 from typing import Dict, List, Literal, Optional, Tuple, Union
 
 # 导入 matplotlib 绘图库
@@ -7,6 +8,8 @@ import matplotlib.pyplot as plt
 plt.rcParams['font.sans-serif'] = ['Songti SC']  # 苹果系统自带宋体
 plt.rcParams['axes.unicode_minus'] = False  # 解决负号显示问题
 from matplotlib.axes import Axes
+# 同类元素合并成一个 Collection 绘制，避免每根 K 线、每笔都创建一个 artist
+from matplotlib.collections import LineCollection, PolyCollection
 from matplotlib.figure import Figure
 # 导入用于绘制矩形的 Patch 对象
 from matplotlib.patches import Rectangle
@@ -22,8 +25,8 @@ from Common.CTime import CTime
 # 导入 Demark 指标引擎和索引类型
 from Math.Demark import T_DEMARK_INDEX, CDemarkEngine
 
-# 导入绘图元数据类：笔元数据、缠论绘图元数据、中枢元数据
-from .PlotMeta import CBi_meta, CChanPlotMeta, CZS_meta
+# 导入绘图元数据类：笔元数据、缠论绘图元数据、线段元数据、中枢元数据
+from .PlotMeta import CBi_meta, CChanPlotMeta, CSeg_meta, CZS_meta
 
 
 # 辅助函数：格式化绘图配置，兼容不带 `plot_` 前缀的情况
@@ -259,7 +262,12 @@ class CPlotDriver:
         plot_macd: Dict[KL_TYPE, bool] = {kl_type: conf.get("plot_macd", False) for kl_type, conf in plot_config.items()}
         # 创建 Figure 和 Axes 对象
         self.figure, axes = create_figure(plot_macd, figure_config, self.lv_lst)
+        # 逐个级别绘制
+        self.DrawLevels(chan, plot_config, plot_metas, axes, plot_para, x_range)
 
+    # 在已创建的 Axes 上逐个级别设置坐标轴并绘制各元素 (动画驱动每帧复用同一组 Axes 调用)
+    def DrawLevels(self, chan: CChan, plot_config: Dict[KL_TYPE, Dict[str, bool]], plot_metas: List[CChanPlotMeta], axes: Dict[KL_TYPE, List[Axes]], plot_para, x_range):
+        figure_config: dict = plot_para.get('figure', {})
         # 子级别绘图起始索引的控制变量
         sseg_begin = 0 # 子级别线段起始索引
         # 从 plot_para 获取线段子级别绘制数量配置
@@ -290,6 +298,8 @@ class CPlotDriver:
                     x_limits[0] = max(sseg_begin, sbi_begin)
                 elif srange_begin != 0:
                     x_limits[0] = srange_begin
+            # 只为可见窗口构造绘图元素
+            meta.set_x_begin(x_limits[0])
             # 设置 X 轴刻度
             set_x_tick(ax, x_limits, meta.datetick, figure_config.get('x_tick_num', 10))
             # 如果存在 MACD Axes，也设置其 X 轴刻度
@@ -331,26 +341,26 @@ class CPlotDriver:
             assert x_range == 0 and seg_cnt == 0 and x_begin_date == 0, "x_range/x_bi_cnt/x_seg_cnt/x_begin_date can not be set at the same time"
             X_LEN = meta.klu_len
             # 如果笔数量小于指定的 bi_cnt，返回 0 (表示显示所有)
-            if len(meta.bi_list) < bi_cnt:
+            if len(meta.data.bi_list) < bi_cnt:
                 return 0
             # 计算 X 轴范围：总 K 线数量 - 倒数 bi_cnt 个笔的起始 K 线索引
-            x_range = X_LEN-meta.bi_list[-bi_cnt].begin_x
+            x_range = X_LEN-CBi_meta(meta.data.bi_list[-bi_cnt]).begin_x
             return x_range
         if seg_cnt != 0:
             assert x_range == 0 and bi_cnt == 0 and x_begin_date == 0, "x_range/x_bi_cnt/x_seg_cnt/x_begin_date can not be set at the same time"
             X_LEN = meta.klu_len
             # 如果线段数量小于指定的 seg_cnt，返回 0
-            if len(meta.seg_list) < seg_cnt:
+            if len(meta.data.seg_list) < seg_cnt:
                 return 0
             # 计算 X 轴范围：总 K 线数量 - 倒数 seg_cnt 个线段的起始 K 线索引
-            x_range = X_LEN-meta.seg_list[-seg_cnt].begin_x
+            x_range = X_LEN-CSeg_meta(meta.data.seg_list[-seg_cnt]).begin_x
             return x_range
         if x_begin_date != 0:
             assert x_range == 0 and bi_cnt == 0 and seg_cnt == 0, "x_range/x_bi_cnt/x_seg_cnt/x_begin_date can not be set at the same time"
             x_range = 0
-            # 从日期刻度列表中倒序查找起始日期，计算需要显示的 K 线数量
-            for date_tick in meta.datetick[::-1]:
-                if date_tick >= x_begin_date:
+            # 从最后一根 K 线倒序查找起始日期，计算需要显示的 K 线数量
+            for klu in meta.klu_iter_reversed():
+                if klu.time.to_str() >= x_begin_date:
                     x_range += 1
                 else:
                     break
@@ -420,6 +430,14 @@ class CPlotDriver:
         # 保存 Figure 到指定路径，bbox_inches='tight' 确保保存时不留白边
         plt.savefig(path, bbox_inches='tight')
 
+    # 画一组线段，name 标识是哪类元素 (同一 Axes 内唯一)，动画驱动据此复用上一帧的 Collection
+    def put_line_collection(self, ax: Axes, name, segment_lst, color, linewidth=None, linestyle='solid'):
+        add_line_collection(ax, segment_lst, color, linewidth=linewidth, linestyle=linestyle)
+
+    # 画一组 (x, y, w, h) 矩形，name 含义同上
+    def put_rect_collection(self, ax: Axes, name, rect_lst, edgecolor, facecolor='none', linewidth=None, linestyle='solid'):
+        add_rect_collection(ax, rect_lst, edgecolor, facecolor=facecolor, linewidth=linewidth, linestyle=linestyle)
+
     # 绘制 K 线单位 (KLU)
     def draw_klu(self, meta: CChanPlotMeta, ax: Axes, width=0.4, rugd=True, plot_mode="kl"):
         # rugd: red up green down (上涨红色，下跌绿色)
@@ -429,6 +447,8 @@ class CPlotDriver:
         # 获取当前 X 轴的起始位置
         x_begin = ax.get_xlim()[0]
         _x, _y = [], [] # 存储绘制点模式的坐标
+        # 蜡烛图模式：阳线/阴线的实体矩形和影线，最后各合并成一个 Collection 绘制
+        up_rect, up_wick, down_rect, down_wick = [], [], [], []
 
         # 遍历 K 线单位
         for kl in meta.klu_iter():
@@ -440,18 +460,17 @@ class CPlotDriver:
             if plot_mode == "kl": # 绘制蜡烛图
                 # 如果收盘价大于开盘价 (阳线)
                 if kl.close > kl.open:
-                    # 绘制矩形 (实体)
-                    ax.add_patch(
-                        Rectangle((i - width / 2, kl.open), width, kl.close - kl.open, fill=False, color=up_color))
-                    # 绘制下影线
-                    ax.plot([i, i], [kl.low, kl.open], up_color)
-                    # 绘制上影线
-                    ax.plot([i, i], [kl.close, kl.high], up_color)
-                else:  # 绘制阴线
-                    # 绘制矩形 (实体)
-                    ax.add_patch(Rectangle((i - width / 2, kl.open), width, kl.close - kl.open, color=down_color))
-                    # 绘制影线 (阴线影线颜色与实体颜色一致)
-                    ax.plot([i, i], [kl.low, kl.high], color=down_color)
+                    # 矩形 (实体)
+                    up_rect.append((i - width / 2, kl.open, width, kl.close - kl.open))
+                    # 下影线
+                    up_wick.append([(i, kl.low), (i, kl.open)])
+                    # 上影线
+                    up_wick.append([(i, kl.close), (i, kl.high)])
+                else:  # 阴线
+                    # 矩形 (实体)
+                    down_rect.append((i - width / 2, kl.open, width, kl.close - kl.open))
+                    # 影线 (阴线影线颜色与实体颜色一致)
+                    down_wick.append([(i, kl.low), (i, kl.high)])
             # 绘制收盘价线
             elif plot_mode in "close":
                 _y.append(kl.close)
@@ -471,6 +490,11 @@ class CPlotDriver:
             # 不支持的 plot_mode 抛出异常
             else:
                 raise CChanException(f"unknow plot mode={plot_mode}, must be one of kl/close/open/high/low", ErrCode.PLOT_ERR)
+        # 阳线实体空心，阴线实体实心
+        self.put_rect_collection(ax, 'klu_up_rect', up_rect, up_color)
+        self.put_rect_collection(ax, 'klu_down_rect', down_rect, down_color, facecolor=down_color)
+        self.put_line_collection(ax, 'klu_up_wick', up_wick, up_color)
+        self.put_line_collection(ax, 'klu_down_wick', down_wick, down_color)
         # 如果以点模式绘制了数据，则连接这些点形成线
         if _x:
             ax.plot(_x, _y)
@@ -482,6 +506,7 @@ class CPlotDriver:
         # 获取当前 X 轴的起始位置
         x_begin = ax.get_xlim()[0]
 
+        rect_lst, color_lst = [], []
         # 遍历 K 线组合元数据
         for klc_meta in meta.klc_list:
             # 如果 K 线组合的结束位置 (最后一个 K 线索引 + 宽度) 小于 X 轴起始位置，跳过
@@ -490,14 +515,16 @@ class CPlotDriver:
             # 如果是单根 K 线组成的 K 线组合，且配置不绘制单根 K 线，跳过
             if klc_meta.end_idx == klc_meta.begin_idx and not plot_single_kl:
                 continue
-            # 绘制代表 K 线组合的矩形
-            ax.add_patch(
-                Rectangle(
-                    (klc_meta.begin_idx - width, klc_meta.low), # 矩形左下角坐标
-                    klc_meta.end_idx - klc_meta.begin_idx + width*2, # 矩形宽度 (包括左右各 width 的边距)
-                    klc_meta.high - klc_meta.low, # 矩形高度
-                    fill=False, # 不填充
-                    color=color_type[klc_meta.type])) # 颜色根据 K 线组合类型确定
+            # 代表 K 线组合的矩形
+            rect_lst.append((
+                klc_meta.begin_idx - width, # 矩形左下角 X 坐标
+                klc_meta.low, # 矩形左下角 Y 坐标
+                klc_meta.end_idx - klc_meta.begin_idx + width*2, # 矩形宽度 (包括左右各 width 的边距)
+                klc_meta.high - klc_meta.low, # 矩形高度
+            ))
+            color_lst.append(color_type[klc_meta.type]) # 颜色根据 K 线组合类型确定
+        # 不填充的矩形边框
+        self.put_rect_collection(ax, 'klc', rect_lst, color_lst)
 
     # 绘制笔
     def draw_bi(
@@ -518,13 +545,14 @@ class CPlotDriver:
     ):
         # 获取当前 X 轴的起始位置
         x_begin = ax.get_xlim()[0]
+        bi_line_lst = []
         # 遍历笔列表
         for bi_idx, bi in enumerate(meta.bi_list):
             # 如果笔的结束位置小于 X 轴起始位置，跳过
             if bi.end_x < x_begin:
                 continue
-            # 绘制笔的线条
-            plot_bi_element(bi, ax, color)
+            # 笔的线条
+            bi_line_lst.append(line_segment(bi))
             # 如果需要显示笔的序号且笔的起始位置在 X 轴范围内
             if show_num and bi.begin_x >= x_begin:
                 # 在笔的中心位置绘制序号
@@ -534,14 +562,16 @@ class CPlotDriver:
             if disp_end:
                 # 调用 bi_text 辅助函数绘制结束价格文本
                 bi_text(bi_idx, ax, bi, end_fontsize, end_color)
+        # 绘制所有笔的线条
+        self.put_line_collection(ax, 'bi', bi_line_lst, color)
         # 如果设置了子级别绘制笔的数量，且当前级别不是最低级别
         if sub_lv_cnt is not None and len(self.lv_lst) > 1 and lv != self.lv_lst[-1]:
             # 如果子级别数量大于等于总笔数量，则不限制
-            if sub_lv_cnt >= len(meta.bi_list):
+            if sub_lv_cnt >= len(meta.data.bi_list):
                 return
             else:
                 # 计算子级别区域的起始 K 线索引
-                begin_idx = meta.bi_list[-sub_lv_cnt].begin_x
+                begin_idx = CBi_meta(meta.data.bi_list[-sub_lv_cnt]).begin_x
             # 获取 Y 轴范围和 X 轴结束位置
             y_begin, y_end = ax.get_ylim()
             x_end = int(ax.get_xlim()[1])
@@ -572,16 +602,14 @@ class CPlotDriver:
         # 获取当前 X 轴的起始位置
         x_begin = ax.get_xlim()[0]
 
+        sure_line_lst, unsure_line_lst = [], []
         # 遍历线段元数据列表
         for seg_idx, seg_meta in enumerate(meta.seg_list):
             # 如果线段的结束位置小于 X 轴起始位置，跳过
             if seg_meta.end_x < x_begin:
                 continue
             # 根据线段是否确定选择实线或虚线绘制
-            if seg_meta.is_sure:
-                ax.plot([seg_meta.begin_x, seg_meta.end_x], [seg_meta.begin_y, seg_meta.end_y], color=color, linewidth=width)
-            else:
-                ax.plot([seg_meta.begin_x, seg_meta.end_x], [seg_meta.begin_y, seg_meta.end_y], color=color, linewidth=width, linestyle='dashed')
+            (sure_line_lst if seg_meta.is_sure else unsure_line_lst).append(line_segment(seg_meta))
             # 如果需要显示线段结束价格
             if disp_end:
                 # 调用 bi_text 辅助函数绘制结束价格文本
@@ -600,14 +628,16 @@ class CPlotDriver:
             if show_num and seg_meta.begin_x >= x_begin:
                 # 在线段中心位置绘制序号
                 ax.text((seg_meta.begin_x+seg_meta.end_x)/2, (seg_meta.begin_y+seg_meta.end_y)/2, f'{seg_meta.idx}', fontsize=num_fontsize, color=num_color)
+        self.put_line_collection(ax, 'seg_sure', sure_line_lst, color, linewidth=width)
+        self.put_line_collection(ax, 'seg_unsure', unsure_line_lst, color, linewidth=width, linestyle='dashed')
         # 如果设置了子级别绘制线段数量，且当前级别不是最低级别
         if sub_lv_cnt is not None and len(self.lv_lst) > 1 and lv != self.lv_lst[-1]:
             # 如果子级别数量大于等于总线段数量，不限制
-            if sub_lv_cnt >= len(meta.seg_list):
+            if sub_lv_cnt >= len(meta.data.seg_list):
                 return
             else:
                 # 计算子级别区域的起始 K 线索引
-                begin_idx = meta.seg_list[-sub_lv_cnt].begin_x
+                begin_idx = CSeg_meta(meta.data.seg_list[-sub_lv_cnt]).begin_x
             # 获取 Y 轴范围和 X 轴结束位置
             y_begin, y_end = ax.get_ylim()
             x_end = int(ax.get_xlim()[1])
@@ -632,19 +662,17 @@ class CPlotDriver:
         x_begin = ax.get_xlim()[0]
 
         # 遍历线段中枢列表 (实际上是更高一级别的线段列表，这里命名有点误导)
-        for seg_idx, seg_meta in enumerate(meta.segseg_list):
+        sure_line_lst, unsure_line_lst = [], []
+        for seg_meta in meta.segseg_list:
             # 如果线段中枢结束位置小于 X 轴起始位置，跳过
             if seg_meta.end_x < x_begin:
                 continue
             # 根据线段中枢是否确定选择实线或虚线绘制
-            if seg_meta.is_sure:
-                ax.plot([seg_meta.begin_x, seg_meta.end_x], [seg_meta.begin_y, seg_meta.end_y], color=color, linewidth=width)
-            else:
-                ax.plot([seg_meta.begin_x, seg_meta.end_x], [seg_meta.begin_y, seg_meta.end_y], color=color, linewidth=width, linestyle='dashed')
+            (sure_line_lst if seg_meta.is_sure else unsure_line_lst).append(line_segment(seg_meta))
             # 如果需要显示结束价格
             if disp_end:
-                # 如果是第一个线段中枢，显示起始价格
-                if seg_idx == 0:
+                # 如果是第一个线段中枢，显示起始价格 (segseg_list 只含可见窗口内的，按序号判断)
+                if seg_meta.idx == meta.data.segseg_list[0].idx:
                     ax.text(
                         seg_meta.begin_x,
                         seg_meta.begin_y,
@@ -666,6 +694,8 @@ class CPlotDriver:
             if show_num and seg_meta.begin_x >= x_begin:
                 # 在线段中枢中心位置绘制序号
                 ax.text((seg_meta.begin_x+seg_meta.end_x)/2, (seg_meta.begin_y+seg_meta.end_y)/2, f'{seg_meta.idx}', fontsize=num_fontsize, color=num_color)
+        self.put_line_collection(ax, 'segseg_sure', sure_line_lst, color, linewidth=width)
+        self.put_line_collection(ax, 'segseg_unsure', unsure_line_lst, color, linewidth=width, linestyle='dashed')
 
     # 辅助函数：绘制单个特征序列分型
     def plot_single_eigen(self, eigenfx_meta, ax, color_top, color_bottom, aplha, only_peak):
@@ -724,6 +754,7 @@ class CPlotDriver:
         linewidth = max(linewidth, 2)
         # 获取当前 X 轴起始位置
         x_begin = ax.get_xlim()[0]
+        rect_dict = ZsRectDict()
         # 遍历中枢元数据列表
         for zs_meta in meta.zs_lst:
             # 如果不绘制单笔中枢且当前是单笔中枢，跳过
@@ -732,13 +763,8 @@ class CPlotDriver:
             # 如果中枢结束位置小于 X 轴起始位置，跳过
             if zs_meta.begin+zs_meta.w < x_begin:
                 continue
-            # 根据中枢是否确定选择实线或虚线绘制边框
-            line_style = '-' if zs_meta.is_sure else '--'
-            # 绘制中枢矩形边框
-            ax.add_patch(Rectangle((zs_meta.begin, zs_meta.low), zs_meta.w, zs_meta.h, fill=False, color=color, linewidth=linewidth, linestyle=line_style))
-            # 遍历子中枢并绘制边框
-            for sub_zs_meta in zs_meta.sub_zs_lst:
-                ax.add_patch(Rectangle((sub_zs_meta.begin, sub_zs_meta.low), sub_zs_meta.w, sub_zs_meta.h, fill=False, color=color, linewidth=sub_linewidth, linestyle=line_style))
+            # 中枢及子中枢矩形边框，根据中枢是否确定选择实线或虚线
+            rect_dict.add(zs_meta, linewidth, sub_linewidth)
             # 如果需要显示中枢文本信息
             if show_text:
                 # 调用 add_zs_text 辅助函数绘制中枢文本
@@ -746,6 +772,7 @@ class CPlotDriver:
                 # 绘制子中枢文本
                 for sub_zs_meta in zs_meta.sub_zs_lst:
                     add_zs_text(ax, sub_zs_meta, fontsize, text_color)
+        rect_dict.draw(self, ax, 'zs', color)
 
     # 绘制线段中枢 (segzs) - 注意这里的 segzs 应该是指更高一级别的中枢，通常是线段构成的新中枢
     def draw_segzs(self, meta: CChanPlotMeta, ax: Axes, color='red', linewidth=10, sub_linewidth=4):
@@ -753,36 +780,33 @@ class CPlotDriver:
         linewidth = max(linewidth, 2)
         # 获取当前 X 轴起始位置
         x_begin = ax.get_xlim()[0]
+        rect_dict = ZsRectDict()
         # 遍历线段中枢列表
         for zs_meta in meta.segzs_lst:
             # 如果线段中枢结束位置小于 X 轴起始位置，跳过
             if zs_meta.begin+zs_meta.w < x_begin:
                 continue
-            # 根据线段中枢是否确定选择实线或虚线绘制边框
-            line_style = '-' if zs_meta.is_sure else '--'
-            # 绘制线段中枢矩形边框
-            ax.add_patch(Rectangle((zs_meta.begin, zs_meta.low), zs_meta.w, zs_meta.h, fill=False, color=color, linewidth=linewidth, linestyle=line_style))
-            # 遍历子线段中枢并绘制边框
-            for sub_zs_meta in zs_meta.sub_zs_lst:
-                ax.add_patch(Rectangle((sub_zs_meta.begin, sub_zs_meta.low), sub_zs_meta.w, sub_zs_meta.h, fill=False, color=color, linewidth=sub_linewidth, linestyle=line_style))
+            # 线段中枢及子线段中枢矩形边框，根据线段中枢是否确定选择实线或虚线
+            rect_dict.add(zs_meta, linewidth, sub_linewidth)
+        rect_dict.draw(self, ax, 'segzs', color)
 
     # 绘制 MACD 指标
     def draw_macd(self, meta: CChanPlotMeta, ax: Axes, x_limits, width=0.4):
-        # 获取 K 线单位列表的 MACD 数据
-        macd_lst = [klu.macd for klu in meta.klu_iter()]
+        # 获取 X 轴范围的起始索引
+        x_begin = x_limits[0]
+        # 获取可见范围内 K 线单位的 MACD 数据
+        macd_lst = [klu.macd for klu in meta.klu_iter(x_begin)]
         # 断言：MACD 数据必须存在 (即 CChanConfig 中 macd_metric 不能设置为 False)
         assert macd_lst[0] is not None, "you can't draw macd until you delete macd_metric=False"
 
-        # 获取 X 轴范围的起始索引
-        x_begin = x_limits[0]
         # 需要绘制的 X 轴索引范围
-        x_idx = range(len(macd_lst))[x_begin:]
+        x_idx = range(x_begin, x_begin+len(macd_lst))
         # 获取需要绘制的 DIF 线数据
-        dif_line = [macd.DIF for macd in macd_lst[x_begin:]]
+        dif_line = [macd.DIF for macd in macd_lst]
         # 获取需要绘制的 DEA 线数据
-        dea_line = [macd.DEA for macd in macd_lst[x_begin:]]
+        dea_line = [macd.DEA for macd in macd_lst]
         # 获取需要绘制的 MACD 柱状图数据
-        macd_bar = [macd.macd for macd in macd_lst[x_begin:]]
+        macd_bar = [macd.macd for macd in macd_lst]
         # 计算 MACD 图的 Y 轴范围
         y_min = min([min(dif_line), min(dea_line), min(macd_bar)])
         y_max = max([max(dif_line), max(dea_line), max(macd_bar)])
@@ -801,7 +825,7 @@ class CPlotDriver:
 
     # 绘制均线
     def draw_mean(self, meta: CChanPlotMeta, ax: Axes):
-        # 获取 K 线单位列表的均线数据
+        # 获取可见窗口内 K 线单位的均线数据
         mean_lst = [klu.trend[TREND_TYPE.MEAN] for klu in meta.klu_iter()]
         # 获取所有均线周期 T
         Ts = list(mean_lst[0].keys())
@@ -812,13 +836,13 @@ class CPlotDriver:
             # 获取该周期的均线数值数组
             mean_arr = [mean_dict[T] for mean_dict in mean_lst]
             # 绘制均线，使用颜色映射，并添加标签
-            ax.plot(range(len(mean_arr)), mean_arr, c=cmap(cmap_idx), label=f'{T} meanline')
-        # 添加图例
+            ax.plot(range(meta.win_begin, meta.win_begin+len(mean_arr)), mean_arr, c=cmap(cmap_idx), label=f'{T} meanline')
+        # 添加图例；默认 loc='best' 只避开坐标轴内的图形，线从可见范围左侧 X_MARGIN 根开始画，跨进可见范围的线段都在，位置与画全部数据时相同
         ax.legend()
 
     # 绘制趋势通道
     def draw_channel(self, meta: CChanPlotMeta, ax: Axes, T=None, top_color="r", bottom_color="b", linewidth=3, linestyle="solid"):
-        # 获取 K 线单位列表的最大值通道和最小值通道数据
+        # 获取可见窗口内 K 线单位的最大值通道和最小值通道数据
         max_lst = [klu.trend[TREND_TYPE.MAX] for klu in meta.klu_iter()]
         min_lst = [klu.trend[TREND_TYPE.MIN] for klu in meta.klu_iter()]
         # 获取所有配置的通道周期 T
@@ -834,10 +858,10 @@ class CPlotDriver:
         # 获取该周期的底部通道数值数组
         bottom_array = [_d[T] for _d in min_lst]
         # 绘制顶部通道线
-        ax.plot(range(len(top_array)), top_array, c=top_color, linewidth=linewidth, linestyle=linestyle, label=f'{T}-TOP-channel')
+        ax.plot(range(meta.win_begin, meta.win_begin+len(top_array)), top_array, c=top_color, linewidth=linewidth, linestyle=linestyle, label=f'{T}-TOP-channel')
         # 绘制底部通道线
-        ax.plot(range(len(bottom_array)), bottom_array, c=bottom_color, linewidth=linewidth, linestyle=linestyle, label=f'{T}-BUTTOM-channel')
-        # 添加图例
+        ax.plot(range(meta.win_begin, meta.win_begin+len(bottom_array)), bottom_array, c=bottom_color, linewidth=linewidth, linestyle=linestyle, label=f'{T}-BUTTOM-channel')
+        # 添加图例，位置的确定同 draw_mean
         ax.legend()
 
     # 绘制布林带 (BOLL)
@@ -846,9 +870,9 @@ class CPlotDriver:
         x_begin = int(ax.get_xlim()[0])
         try:
             # 获取 K 线单位列表的布林带数据
-            ma = [klu.boll.MID for klu in meta.klu_iter()][x_begin:] # 中轨
-            up = [klu.boll.UP for klu in meta.klu_iter()][x_begin:] # 上轨
-            down = [klu.boll.DOWN for klu in meta.klu_iter()][x_begin:] # 下轨
+            ma = [klu.boll.MID for klu in meta.klu_iter(x_begin)] # 中轨
+            up = [klu.boll.UP for klu in meta.klu_iter(x_begin)] # 上轨
+            down = [klu.boll.DOWN for klu in meta.klu_iter(x_begin)] # 下轨
         except AttributeError as e:
             # 如果没有配置布林带参数 (boll_n)，抛出异常
             raise CChanException("you can't draw boll until you set boll_n in CChanConfig", ErrCode.PLOT_ERR) from e
@@ -973,23 +997,24 @@ class CPlotDriver:
         # 标记字典格式示例：{'2022/03/01': ('xxx', 'up', 'red'), '2022/03/02': ('yyy', 'down')}
         # 获取当前 X 轴范围
         x_begin, x_end = ax.get_xlim()
+        # 创建可见窗口内 K 线索引到 K 线单位的映射字典
+        kl_dict = {klu.idx: klu for klu in meta.klu_iter()}
         # 创建日期字符串到 K 线索引的映射字典
-        datetick_dict = {date: idx for idx, date in enumerate(meta.datetick)}
+        datetick_dict = {klu.time.to_str(): idx for idx, klu in kl_dict.items()}
 
-        # 处理包含子级别时间的标记，将其转换为顶层级别的时间
+        # 处理子级别时间的标记：按时间在各子级别中二分查找，再沿跨级别索引找到所属的当前级别 K 线
         new_marker = {}
-        for klu in meta.klu_iter():
-            for date, marker in markers.items():
-                date_str = date.to_str() if isinstance(date, CTime) else date
-                # 如果 K 线单位包含该日期且该日期不是 K 线单位自身的日期
-                if klu.include_sub_lv_time(date_str) and klu.time.to_str() != date_str:
-                    # 将标记添加到 new_marker 中，键为 K 线单位日期字符串
-                    new_marker[klu.time.to_str()] = marker
+        klu_index = meta.data.klu_index
+        for date, marker in markers.items():
+            date_str = date.to_str() if isinstance(date, CTime) else date
+            for t in marker_time_candidates(date):
+                klu_idx = klu_index.sub.find_sup(t, klu_index) if klu_index.sub else -1
+                # 该日期不是 K 线单位自身的日期时，将标记添加到 new_marker 中，键为 K 线单位日期字符串
+                if klu_idx >= 0 and meta.get_klu(klu_idx).time.to_str() != date_str:
+                    new_marker[meta.get_klu(klu_idx).time.to_str()] = marker
+                    break
         # 将原始标记合并到 new_marker 中 (覆盖相同日期)
         new_marker.update(markers)
-
-        # 创建 K 线索引到 K 线单位的映射字典
-        kl_dict = dict(enumerate(meta.klu_iter()))
         # 计算 Y 轴范围和箭头长度
         y_range = self.y_max-self.y_min
         arror_len = arrow_l*y_range
@@ -1069,12 +1094,12 @@ class CPlotDriver:
         ax,
         color='b', # RSI 颜色
     ):
-        # 获取 K 线单位列表的 RSI 数据
-        data = [klu.rsi for klu in meta.klu_iter()]
         # 获取 X 轴范围的起始和结束索引
         x_begin, x_end = int(ax.get_xlim()[0]), int(ax.get_xlim()[1])
+        # 获取可见范围内 K 线单位的 RSI 数据
+        data = [klu.rsi for klu in islice(meta.klu_iter(x_begin), x_end-x_begin)]
         # 绘制 RSI 线 (注意：此处代码被截断，未完成绘制逻辑)
-        ax.plot(range(x_begin, x_end), data[x_begin: x_end], c=color)
+        ax.plot(range(x_begin, x_end), data, c=color)
     # 绘制 KDJ 指标 (注意：此方法不完整)
     def draw_kdj(
         self,
@@ -1088,8 +1113,78 @@ class CPlotDriver:
 # -------------------- 辅助函数 (类外部) --------------------
 
 # 绘制笔的线条
-def plot_bi_element(bi: CBi_meta, ax: Axes, color='black'):
-    ax.plot([bi.begin_x, bi.end_x], [bi.begin_y, bi.end_y], color)
+def marker_time_candidates(date: Union[CTime, str]) -> List[CTime]:
+    """
+    标记日期对应的 CTime，用于在各级别中按时间查找 K 线
+    字符串格式与 CTime.to_str 一致；只有日期时，数据源的 CTime 可能设置了 auto=False，两种都试
+    """
+    if isinstance(date, CTime):
+        return [date]
+    try:
+        day_str, _, hm_str = date.replace('-', '/').partition(' ')
+        year, month, day = (int(x) for x in day_str.split('/'))
+        hour, minute = (int(x) for x in hm_str.split(':')[:2]) if hm_str else (0, 0)
+    except ValueError:
+        return []
+    res = [CTime(year, month, day, hour, minute)]
+    if hour == 0 and minute == 0:
+        res.append(CTime(year, month, day, 0, 0, auto=False))
+    return res
+
+
+def line_segment(line: Union[CBi_meta, CSeg_meta]):
+    return [(line.begin_x, line.begin_y), (line.end_x, line.end_y)]
+
+
+# 把一组线段画成一个 LineCollection，外观与逐条 ax.plot 一致 (默认线宽、线端样式取自 rcParams)
+def add_line_collection(ax: Axes, segment_lst, color, linewidth=None, linestyle='solid') -> Optional[LineCollection]:
+    if not segment_lst:
+        return None
+    is_solid = linestyle in ('solid', '-')
+    return ax.add_collection(LineCollection(
+        segment_lst,
+        colors=color,
+        linewidths=plt.rcParams['lines.linewidth'] if linewidth is None else linewidth,
+        linestyles=linestyle,
+        capstyle=plt.rcParams['lines.solid_capstyle' if is_solid else 'lines.dash_capstyle'],
+        joinstyle=plt.rcParams['lines.solid_joinstyle' if is_solid else 'lines.dash_joinstyle'],
+        zorder=2,  # 与 Line2D 相同，画在矩形之上
+    ))
+
+
+# 把一组 (x, y, w, h) 矩形画成一个 PolyCollection，外观与逐个 Rectangle 一致；edgecolor 可以是每个矩形一种颜色的列表
+def add_rect_collection(ax: Axes, rect_lst, edgecolor, facecolor='none', linewidth=None, linestyle='solid') -> Optional[PolyCollection]:
+    if not rect_lst:
+        return None
+    return ax.add_collection(PolyCollection(
+        rect_verts(rect_lst),
+        edgecolors=edgecolor,
+        facecolors=facecolor,
+        linewidths=plt.rcParams['patch.linewidth'] if linewidth is None else linewidth,
+        linestyles=linestyle,
+        joinstyle='miter',  # 与 Rectangle 相同
+        zorder=1,
+    ))
+
+
+def rect_verts(rect_lst):
+    return [[(x, y), (x+w, y), (x+w, y+h), (x, y+h)] for x, y, w, h in rect_lst]
+
+
+class ZsRectDict:
+    """中枢矩形按 (线宽, 线型) 分组，每组画成一个 PolyCollection"""
+    def __init__(self):
+        self.rect_dict: Dict[Tuple[float, str], list] = {}
+
+    def add(self, zs_meta: CZS_meta, linewidth, sub_linewidth):
+        line_style = '-' if zs_meta.is_sure else '--'
+        self.rect_dict.setdefault((linewidth, line_style), []).append((zs_meta.begin, zs_meta.low, zs_meta.w, zs_meta.h))
+        for sub_zs_meta in zs_meta.sub_zs_lst:
+            self.rect_dict.setdefault((sub_linewidth, line_style), []).append((sub_zs_meta.begin, sub_zs_meta.low, sub_zs_meta.w, sub_zs_meta.h))
+
+    def draw(self, plot_driver: 'CPlotDriver', ax: Axes, name, color):
+        for (linewidth, line_style), rect_lst in self.rect_dict.items():
+            plot_driver.put_rect_collection(ax, f'{name}_{linewidth}{line_style}', rect_lst, color, linewidth=linewidth, linestyle=line_style)
 
 # 绘制笔或线段的结束价格文本
 def bi_text(bi_idx: int, ax: Axes, bi: Union[CBi_meta, CZS_meta], fontsize=10, color='black'):
@@ -1,10 +1,14 @@
+from bisect import bisect_left
+from enum import Enum
+from functools import cached_property
 from typing import List
 
 from Bi.Bi import CBi
 from BuySellPoint.BS_Point import CBS_Point
-from Common.CEnum import FX_TYPE
+from Common.CEnum import FX_TYPE, TREND_TYPE
 from KLine.KLine import CKLine
 from KLine.KLine_List import CKLine_List
+from KLine.KLine_Unit import CKLine_Unit
 from Seg.Eigen import CEigen
 from Seg.EigenFX import CEigenFX
 from Seg.Seg import CSeg
@@ -124,62 +128,199 @@ class CBS_Point_meta:
 
 
 class CChanPlotMeta:
-    """缠论绘图元数据总容器"""
-    def __init__(self, kl_list: CKLine_List):
+    """
+    缠论绘图元数据总容器
+    只为可见窗口构造：set_x_begin 设置窗口起点后，各元素列表在第一次访问时才构造，
+    只包含结束位置不早于窗口起点（留 X_MARGIN 根K线余量）的元素，跨入窗口的笔、线段、中枢也在其中
+    笔、线段按结束K线二分查找，绘图耗时只与 x_range 有关，与历史长度无关；需要完整列表时用 self.data
+    """
+    X_MARGIN = 2  # 窗口起点向左多留的K线数，覆盖K线、合并K线矩形的宽度
+    # 按窗口构造的元素列表，set_x_begin 时作废
+    LAZY_ATTRS = ('klc_list', 'bi_list', 'seg_list', 'eigenfx_lst', 'segseg_list', 'seg_eigenfx_lst', 'zs_lst', 'segzs_lst', 'bs_point_lst', 'seg_bsp_lst')
+
+    def __init__(self, kl_list: CKLine_List, x_begin=0):
         self.data = kl_list  # 原始K线列表对象
+        self.klu_len = len(kl_list.klu_index)  # 总K线单元数
+        self.datetick = CDateTick(self)  # 时间轴标签，按K线序号取
+        self.set_x_begin(x_begin)
+
+    def set_x_begin(self, x_begin):
+        """设置可见窗口起点（K线序号），已构造的元素列表作废"""
+        self.win_begin = max(int(x_begin) - self.X_MARGIN, 0)
+        for attr in self.LAZY_ATTRS:
+            self.__dict__.pop(attr, None)
+
+    @cached_property
+    def klc_list(self) -> List[Cklc_meta]:
+        """合并K线列表"""
+        lst = self.data.lst
+        return [Cklc_meta(lst[idx]) for idx in range(self.klc_begin_idx(self.win_begin), len(lst))]
+
+    @cached_property
+    def bi_list(self) -> List[CBi_meta]:
+        """笔列表"""
+        bi_list = self.data.bi_list
+        begin = bisect_left(bi_list, self.win_begin, key=lambda bi: bi.get_end_klu().idx)
+        return [CBi_meta(bi_list[idx]) for idx in range(begin, len(bi_list))]
+
+    @cached_property
+    def seg_list(self) -> List[CSeg_meta]:
+        """线段列表"""
+        return [CSeg_meta(seg) for seg in self.seg_in_window(self.data.seg_list)]
+
+    @cached_property
+    def eigenfx_lst(self) -> List[CEigenFX_meta]:
+        """线段分型特征"""
+        return [CEigenFX_meta(seg.eigen_fx) for seg in self.data.seg_list if seg.eigen_fx]
+
+    @cached_property
+    def segseg_list(self) -> List[CSeg_meta]:
+        """递归线段列表"""
+        return [CSeg_meta(segseg) for segseg in self.seg_in_window(self.data.segseg_list)]
+
+    @cached_property
+    def seg_eigenfx_lst(self) -> List[CEigenFX_meta]:
+        """递归线段分型"""
+        return [CEigenFX_meta(segseg.eigen_fx) for segseg in self.data.segseg_list if segseg.eigen_fx]
+
+    @cached_property
+    def zs_lst(self) -> List[CZS_meta]:
+        """笔中枢"""
+        return [CZS_meta(zs) for zs in self.data.zs_list if zs.end.idx >= self.win_begin]
+
+    @cached_property
+    def segzs_lst(self) -> List[CZS_meta]:
+        """线段中枢"""
+        return [CZS_meta(segzs) for segzs in self.data.segzs_list if segzs.end.idx >= self.win_begin]
+
+    @cached_property
+    def bs_point_lst(self) -> List[CBS_Point_meta]:
+        """笔买卖点"""
+        return [CBS_Point_meta(bs_point, is_seg=False) for bs_point in self.data.bs_point_lst.bsp_iter() if bs_point.klu.idx >= self.win_begin]
+
+    @cached_property
+    def seg_bsp_lst(self) -> List[CBS_Point_meta]:
+        """线段买卖点"""
+        return [CBS_Point_meta(seg_bsp, is_seg=True) for seg_bsp in self.data.seg_bs_point_lst.bsp_iter() if seg_bsp.klu.idx >= self.win_begin]
+
+    def to_columnar(self):
+        """
+        导出可见窗口的绘图数据，供前端图表库绘制；每类元素是一个列式 dict（字段名 -> 值列表），可直接 json 序列化
+        横坐标均为K线序号，kline.time 给出对应的时间；枚举输出名字，未计算的指标不输出
+        """
+        klu_lst = list(self.klu_iter())
+        data = {
+            'klu_len': self.klu_len,
+            'x_begin': self.win_begin,
+            'kline': {
+                'x': [klu.idx for klu in klu_lst],
+                'time': [klu.time.to_str() for klu in klu_lst],
+                'open': [klu.open for klu in klu_lst],
+                'high': [klu.high for klu in klu_lst],
+                'low': [klu.low for klu in klu_lst],
+                'close': [klu.close for klu in klu_lst],
+            },
+            'klc': to_columns(self.klc_list, ['begin_idx', 'end_idx', 'high', 'low', 'type']),
+            'bi': to_columns(self.bi_list, ['idx', 'begin_x', 'begin_y', 'end_x', 'end_y', 'dir', 'type', 'is_sure']),
+            'seg': to_columns(self.seg_list, ['idx', 'begin_x', 'begin_y', 'end_x', 'end_y', 'dir', 'is_sure']),
+            'segseg': to_columns(self.segseg_list, ['idx', 'begin_x', 'begin_y', 'end_x', 'end_y', 'dir', 'is_sure']),
+            'zs': to_columns(self.zs_lst, ['begin', 'end', 'low', 'high', 'is_sure', 'is_onebi_zs']),
+            'segzs': to_columns(self.segzs_lst, ['begin', 'end', 'low', 'high', 'is_sure', 'is_onebi_zs']),
+            'bsp': to_columns(self.bs_point_lst + self.seg_bsp_lst, ['x', 'y', 'is_buy', 'type', 'is_seg']),
+        }
+        if not klu_lst:
+            return data
+        last_klu = klu_lst[-1]
+        if hasattr(last_klu, 'macd'):
+            data['macd'] = {
+                'dif': [klu.macd.DIF for klu in klu_lst],
+                'dea': [klu.macd.DEA for klu in klu_lst],
+                'macd': [klu.macd.macd for klu in klu_lst],
+            }
+        if hasattr(last_klu, 'boll'):
+            data['boll'] = {
+                'mid': [klu.boll.MID for klu in klu_lst],
+                'up': [klu.boll.UP for klu in klu_lst],
+                'down': [klu.boll.DOWN for klu in klu_lst],
+            }
+        if hasattr(last_klu, 'rsi'):
+            data['rsi'] = [klu.rsi for klu in klu_lst]
+        if hasattr(last_klu, 'kdj'):
+            data['kdj'] = {
+                'k': [klu.kdj.k for klu in klu_lst],
+                'd': [klu.kdj.d for klu in klu_lst],
+                'j': [klu.kdj.j for klu in klu_lst],
+            }
+        # 均线、通道：{"mean": {"5": [...], "20": [...]}, "max": {...}, "min": {...}}
+        for trend_type in TREND_TYPE:
+            if trend_type in last_klu.trend:
+                data[trend_type.value] = {str(T): [klu.trend[trend_type][T] for klu in klu_lst] for T in last_klu.trend[trend_type]}
+        return data
 
-        # K线相关数据
-        self.klc_list: List[Cklc_meta] = [Cklc_meta(klc) for klc in kl_list.lst]  # 合并K线列表
-        self.datetick = [klu.time.to_str() for klu in self.klu_iter()]  # 时间轴标签
-        self.klu_len = sum(len(klc.klu_list) for klc in self.klc_list)  # 总K线单元数
-
-        # 笔和线段数据
-        self.bi_list = [CBi_meta(bi) for bi in kl_list.bi_list]  # 笔列表
-        self.seg_list: List[CSeg_meta] = []      # 线段列表
-        self.eigenfx_lst: List[CEigenFX_meta] = []  # 线段分型特征
-        for seg in kl_list.seg_list:
-            self.seg_list.append(CSeg_meta(seg))
-            if seg.eigen_fx:
-                self.eigenfx_lst.append(CEigenFX_meta(seg.eigen_fx))
-
-        # 递归线段数据
-        self.seg_eigenfx_lst: List[CEigenFX_meta] = []  # 递归线段分型
-        self.segseg_list: List[CSeg_meta] = []   # 递归线段列表
-        for segseg in kl_list.segseg_list:
-            self.segseg_list.append(CSeg_meta(segseg))
-            if segseg.eigen_fx:
-                self.seg_eigenfx_lst.append(CEigenFX_meta(segseg.eigen_fx))
-
-        # 中枢数据
-        self.zs_lst: List[CZS_meta] = [CZS_meta(zs) for zs in kl_list.zs_list]  # 笔中枢
-        self.segzs_lst: List[CZS_meta] = [CZS_meta(segzs) for segzs in kl_list.segzs_list]  # 线段中枢
-
-        # 买卖点数据
-        self.bs_point_lst: List[CBS_Point_meta] = [CBS_Point_meta(bs_point, is_seg=False) for bs_point in kl_list.bs_point_lst.bsp_iter()]  # 笔买卖点
-        self.seg_bsp_lst: List[CBS_Point_meta] = [CBS_Point_meta(seg_bsp, is_seg=True) for seg_bsp in kl_list.seg_bs_point_lst.bsp_iter()]  # 线段买卖点
-
-    def klu_iter(self):
-        """迭代生成所有原始K线单元"""
-        for klc in self.klc_list:
-            yield from klc.klu_list
+    def seg_in_window(self, seg_list):
+        begin = bisect_left(seg_list, self.win_begin, key=lambda seg: seg.get_end_klu().idx)
+        return (seg_list[idx] for idx in range(begin, len(seg_list)))
+
+    def klc_begin_idx(self, klu_idx):
+        """包含第 klu_idx 根K线的合并K线序号"""
+        return bisect_left(self.data.lst, klu_idx, key=lambda klc: klc.lst[-1].idx)
+
+    def klu_iter(self, begin_idx=None):
+        """从第 begin_idx 根（默认窗口起点）开始迭代原始K线单元"""
+        if begin_idx is None:
+            begin_idx = self.win_begin
+        for klu in self.data.klu_iter(self.klc_begin_idx(begin_idx)):
+            if klu.idx >= begin_idx:
+                yield klu
+
+    def klu_iter_reversed(self):
+        """从最后一根开始倒序迭代原始K线单元"""
+        for klc in reversed(self.data.lst):
+            yield from reversed(klc.lst)
+
+    def get_klu(self, klu_idx) -> CKLine_Unit:
+        klc = self.data.lst[self.klc_begin_idx(klu_idx)]
+        return klc.lst[klu_idx - klc.lst[0].idx]
 
     def sub_last_kseg_start_idx(self, seg_cnt):
         """获取最近N线段的次级别起始索引"""
         if seg_cnt is None or len(self.data.seg_list) <= seg_cnt:
             return 0
-        return self.data.seg_list[-seg_cnt].get_begin_klu().sub_kl_list[0].idx
+        return self.sub_start_idx(self.data.seg_list[-seg_cnt].get_begin_klu().idx)
 
     def sub_last_kbi_start_idx(self, bi_cnt):
         """获取最近N笔的次级别起始索引"""
         if bi_cnt is None or len(self.data.bi_list) <= bi_cnt:
             return 0
-        return self.data.bi_list[-bi_cnt].begin_klc.lst[0].sub_kl_list[0].idx
+        return self.sub_start_idx(self.data.bi_list[-bi_cnt].begin_klc.lst[0].idx)
 
     def sub_range_start_idx(self, x_range):
         """根据显示范围计算次级别起始索引"""
-        for klc in self.data[::-1]:
-            for klu in klc[::-1]:
-                x_range -= 1
-                if x_range == 0:
-                    return klu.sub_kl_list[0].idx
-        return 0
\ No newline at end of file
+        klu_cnt = len(self.data.klu_index)
+        if x_range <= 0 or x_range > klu_cnt:
+            return 0
+        return self.sub_start_idx(klu_cnt - x_range)
+
+    def sub_start_idx(self, klu_idx):
+        """第 klu_idx 根K线的第一根子K线在次级别中的索引，没有子K线时返回 0"""
+        return max(self.data.klu_index.get_sub_range(klu_idx)[0], 0)
+
+def to_columns(meta_lst, attr_lst):
+    """元数据对象列表转为列式 dict，枚举值转成名字"""
+    return {attr: [to_json_value(getattr(meta, attr)) for meta in meta_lst] for attr in attr_lst}
+
+
+def to_json_value(value):
+    return value.name if isinstance(value, Enum) else value
+
+
+class CDateTick:
+    """时间轴标签，按K线序号取时才生成字符串"""
+    def __init__(self, meta: CChanPlotMeta):
+        self.meta = meta
+
+    def __len__(self):
+        return self.meta.klu_len
+
+    def __getitem__(self, klu_idx):
+        return self.meta.get_klu(int(klu_idx)).time.to_str()
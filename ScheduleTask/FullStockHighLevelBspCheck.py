@@ -1,12 +1,13 @@
 import json
-import time
 import traceback
-from datetime import datetime
 
-from Chan import CChan
+from app.service.batch_render import checkpoint_item, new_report_dir, render_report
+from app.service.bsp_records import BspRecordWriter, bsp_info
+from BuySellPoint.BSPointSignal import last_formed_bsp, latest_signal
+from ChanBatch import CChanBatch
 from ChanConfig import CChanConfig
 from Common import constants
-from Common.CEnum import AUTYPE, BSP_TYPE, DATA_SRC, FX_TYPE, KL_TYPE
+from Common.CEnum import AUTYPE, BSP_TYPE, DATA_SRC, KL_TYPE
 from Common.message import build_bsp_message, send_bark_notification
 from Common.redis_util import RedisClient
 
@@ -54,110 +55,79 @@ config = CChanConfig({
 
 code_to_lv_to_time_dict = {}
 
+SCAN_BATCH_SIZE = 100  # 每批一起读取的股票数
+READ_INTERVAL = 3  # 每只股票取数据后等待的秒数，避免数据源限频
 
-def build_chan_object(code):
-    return CChan(
-        code=code,
+
+def build_chan_batch(code_list):
+    return CChanBatch(
+        code_list,
         begin_time=begin_time,
         end_time=end_time,
         data_src=data_src,
         lv_list=lv_list,
         config=config,
         autype=AUTYPE.QFQ,
+        batch_size=SCAN_BATCH_SIZE,
+        read_interval=READ_INTERVAL,
+        autoload=False,  # 由 latest_state 加载
     )
 
 
-def full_stock_high_level_bsp_check_main():
-    full_bsp_data = {
-        "update_time": datetime.now().isoformat(),
-        "level": {}
-    }
-    for stock_code in stock_list:
+def high_level_bsp_check(code_list, redis_key, source):
+    """
+    按批扫描各股票最新的买卖点：每批用 CChanBatch 一起读取数据，再逐只用 latest_state 只算尾部窗口，不从 begin_time 开始逐步回放
+    每只算完即写入 Redis，不等整个扫描结束；最新K线上出现买卖点的，扫描结束后批量出图
+    """
+    bsp_writer = BspRecordWriter(redis_key, [lv.name for lv in lv_list])
+    report_dir = new_report_dir(source)
+    render_item_lst = []
+    code_list = list(code_list)
+    for batch_begin in range(0, len(code_list), SCAN_BATCH_SIZE):
+        batch_code_list = code_list[batch_begin:batch_begin+SCAN_BATCH_SIZE]
+        done_code_set = set()  # 本批算完并写入的股票
         try:
-            chan = build_chan_object(stock_code)
-            last_recorded_bsp_list = [None for _ in range(0, len(lv_list))]
-            for chan_snapshot in chan.step_load():
-                for lv_index in range(0, len(lv_list)):
-                    bsp_list = chan_snapshot.get_bsp(lv_index)  # 获取买卖点列表
-                    if not bsp_list:  # 为空
-                        continue
-                    last_bsp = bsp_list[-1]  # 最后一个买卖点
-                    cur_lv_chan = chan_snapshot[lv_index]
-                    if last_bsp.klu.klc.idx != cur_lv_chan[-2].idx:
-                        continue
-                    if (cur_lv_chan[-2].fx == FX_TYPE.BOTTOM and last_bsp.is_buy) or (cur_lv_chan[-2].fx == FX_TYPE.TOP and not last_bsp.is_buy):
-                        last_recorded_bsp_list[lv_index] = last_bsp
-                        print(f'bsp: {cur_lv_chan[lv_index][-1].time}, is buy: {last_bsp.is_buy}, lv: {lv_index}')
-            for lv_index in range(0, len(lv_list)):
-                lv_key = lv_list[lv_index].name
-                last_bsp = last_recorded_bsp_list[lv_index]
-                if last_bsp:
-                    print(f"stock: {stock_code}, "
-                          f"last_recorded_bsp: {last_bsp.klu.time}, "
-                          f"is buy: {last_bsp.is_buy}, "
-                          f"type: {last_bsp.type}, lv: {lv_index}")
-                if lv_key not in full_bsp_data["level"]:
-                    full_bsp_data["level"][lv_key] = {}
-                ctime_obj = last_bsp.klu.time
-                bsp_time = datetime(ctime_obj.year, ctime_obj.month, ctime_obj.day, ctime_obj.hour,
-                                    ctime_obj.minute) if last_bsp else None
-                format_bsp_time = bsp_time.strftime("%Y-%m-%d %H:%M:%S") if last_bsp else None
-                format_bsp_type = [each_type.value for each_type in last_bsp.type]
-                bsp_info_dict = {"is_buy": last_bsp.is_buy, "type": format_bsp_type, "time": format_bsp_time}
-                print(f"bsp_info_dict: {bsp_info_dict}")
-                full_bsp_data["level"][lv_key][stock_code] = bsp_info_dict
-        except Exception as e:
-            print(f"full_stock_high_level_bsp_check_main error: {traceback.format_exc()}")
-        time.sleep(3)
-    # 写入最终文件
-    redis_client.set(constants.REDIS_KEY_STOCK_BSP_RECORDS, json.dumps(full_bsp_data))
+            chan_batch = build_chan_batch(batch_code_list)
+            for code, chan in chan_batch.latest_state():
+                try:
+                    fresh_bsp_lst = latest_signal(chan)
+                    for lv_index, last_bsp in fresh_bsp_lst:
+                        print(f'{code} bsp: {chan[lv_index][-1][-1].time}, is buy: {last_bsp.is_buy}, lv: {lv_index}')
+                    if fresh_bsp_lst:
+                        render_item_lst.append(checkpoint_item(chan, report_dir))  # 出图时直接用算好的 CChan，不再重新取数据、计算
+                    last_recorded_bsp_list = [last_formed_bsp(chan, lv_index) for lv_index in range(0, len(lv_list))]
+                    for lv_index in range(0, len(lv_list)):
+                        last_bsp = last_recorded_bsp_list[lv_index]
+                        if last_bsp:
+                            print(f"{source}: {code}, "
+                                  f"last_recorded_bsp: {last_bsp.klu.time}, "
+                                  f"is buy: {last_bsp.is_buy}, "
+                                  f"type: {last_bsp.type}, lv: {lv_index}")
+                    bsp_writer.write(code, [bsp_info(last_bsp) for last_bsp in last_recorded_bsp_list])
+                    done_code_set.add(code)
+                except Exception:
+                    print(f"{source}: {code} error: {traceback.format_exc()}")
+            for code, e in chan_batch.err_dict.items():
+                print(f"{source}: {code} error: {type(e).__name__}: {e}")
+        except Exception:
+            print(f"high_level_bsp_check error: {traceback.format_exc()}")
+        # 读取、计算或写入出错的股票（包括整批出错时本批余下的）保留上一轮的记录
+        bsp_writer.keep([code for code in batch_code_list if code not in done_code_set])
+    bsp_writer.finish()  # 删除已不在扫描列表中的旧记录
+    try:
+        render_report(render_item_lst, report_dir)
+    except Exception:
+        print(f"render_report error: {traceback.format_exc()}")
+
+
+def full_stock_high_level_bsp_check_main():
+    high_level_bsp_check(stock_list, constants.REDIS_KEY_STOCK_BSP_RECORDS, 'stock')
     # with open("./Temp/stock_bsp_records.json", "w") as f:
     #     json.dump(full_bsp_data, f, indent=2, ensure_ascii=False)
-    
+
 
 def full_etf_high_level_bsp_check_main():
-    full_bsp_data = {
-        "update_time": datetime.now().isoformat(),
-        "level": {}
-    }
-    for etf_code in etf_list:
-        try:
-            chan = build_chan_object(etf_code)
-            last_recorded_bsp_list = [None for _ in range(0, len(lv_list))]
-            for chan_snapshot in chan.step_load():
-                for lv_index in range(0, len(lv_list)):
-                    bsp_list = chan_snapshot.get_bsp(lv_index)  # 获取买卖点列表
-                    if not bsp_list:  # 为空
-                        continue
-                    last_bsp = bsp_list[-1]  # 最后一个买卖点
-                    cur_lv_chan = chan_snapshot[lv_index]
-                    if last_bsp.klu.klc.idx != cur_lv_chan[-2].idx:
-                        continue
-                    if (cur_lv_chan[-2].fx == FX_TYPE.BOTTOM and last_bsp.is_buy) or (cur_lv_chan[-2].fx == FX_TYPE.TOP and not last_bsp.is_buy):
-                        last_recorded_bsp_list[lv_index] = last_bsp
-                        print(f'bsp: {cur_lv_chan[lv_index][-1].time}, is buy: {last_bsp.is_buy}, lv: {lv_index}')
-            for lv_index in range(0, len(lv_list)):
-                lv_key = lv_list[lv_index].name
-                last_bsp = last_recorded_bsp_list[lv_index]
-                if last_bsp:
-                    print(f"etf: {etf_code}, "
-                          f"last_recorded_bsp: {last_bsp.klu.time}, "
-                          f"is buy: {last_bsp.is_buy}, "
-                          f"type: {last_bsp.type}, lv: {lv_index}")
-                if lv_key not in full_bsp_data["level"]:
-                    full_bsp_data["level"][lv_key] = {}
-                ctime_obj = last_bsp.klu.time
-                bsp_time = datetime(ctime_obj.year, ctime_obj.month, ctime_obj.day, ctime_obj.hour, ctime_obj.minute) if last_bsp else None
-                format_bsp_time = bsp_time.strftime("%Y-%m-%d %H:%M:%S") if last_bsp else None
-                format_bsp_type = [each_type.value for each_type in last_bsp.type]
-                bsp_info_dict = {"is_buy": last_bsp.is_buy, "type": format_bsp_type, "time": format_bsp_time}
-                print(f"bsp_info_dict: {bsp_info_dict}")
-                full_bsp_data["level"][lv_key][etf_code] = bsp_info_dict
-        except Exception as e:
-            print(f"full_stock_high_level_bsp_check_main error: {traceback.format_exc()}")
-        time.sleep(3)
-        # 写入最终文件
-    redis_client.set(constants.REDIS_KEY_ETF_BSP_RECORDS, json.dumps(full_bsp_data))
+    high_level_bsp_check(etf_list, constants.REDIS_KEY_ETF_BSP_RECORDS, 'etf')
     # with open("./Temp/etf_bsp_records.json", "w") as f:
     #     json.dump(full_bsp_data, f, indent=2, ensure_ascii=False)
 
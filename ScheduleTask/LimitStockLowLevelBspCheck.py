@@ -2,10 +2,11 @@ import json
 import time
 from datetime import datetime
 
+from BuySellPoint.BSPointSignal import CBSPointSignal
 from Chan import CChan
 from ChanConfig import CChanConfig
 from Common import constants
-from Common.CEnum import AUTYPE, BSP_TYPE, DATA_SRC, FX_TYPE, KL_TYPE
+from Common.CEnum import AUTYPE, BSP_TYPE, DATA_SRC, KL_TYPE
 from Common.message import build_bsp_message, send_bark_notification
 from Common.redis_util import RedisClient
 
@@ -99,19 +100,11 @@ def try_send_message(stock_code, lv_index, bsp):
 def limit_stock_low_level_bsp_check_main():
     for stock_code in stock_list:
         chan = build_chan_object(stock_code)
-        last_recorded_bsp_list = [None for _ in range(0, len(lv_list))]
+        bsp_signal = CBSPointSignal(chan)  # 通过买卖点事件检测信号，不用每步排序整个买卖点列表
         for chan_snapshot in chan.step_load():
-            for lv_index in range(0, len(lv_list)):
-                bsp_list = chan_snapshot.get_bsp(lv_index)  # 获取买卖点列表
-                if not bsp_list:  # 为空
-                    continue
-                last_bsp = bsp_list[-1]  # 最后一个买卖点
-                cur_lv_chan = chan_snapshot[lv_index]
-                if last_bsp.klu.klc.idx != cur_lv_chan[-2].idx:
-                    continue
-                if (cur_lv_chan[-2].fx == FX_TYPE.BOTTOM and last_bsp.is_buy) or (cur_lv_chan[-2].fx == FX_TYPE.TOP and not last_bsp.is_buy):
-                    last_recorded_bsp_list[lv_index] = last_bsp
-                    print(f'bsp: {cur_lv_chan[lv_index][-1].time}, is buy: {last_bsp.is_buy}, lv: {lv_index}')
+            for lv_index, last_bsp in bsp_signal.check():
+                print(f'bsp: {chan_snapshot[lv_index][-1][-1].time}, is buy: {last_bsp.is_buy}, lv: {lv_index}')
+        last_recorded_bsp_list = [bsp_signal.last_signal(lv_index) for lv_index in range(0, len(lv_list))]
         for lv_index in range(0, len(lv_list)):
             last_bsp = last_recorded_bsp_list[lv_index]
             if last_bsp:
@@ -1,3 +1,4 @@
+import copy
 from typing import List, Optional
 
 from Bi.Bi import CBi
@@ -125,6 +126,13 @@ class CEigenFX:
         assert self.last_evidence_bi is not None
         return next((False for bi in self.lst if not bi.is_sure), self.last_evidence_bi.is_sure)
 
+    def clone(self) -> 'CEigenFX':
+        """复制特征序列状态，用于保存可恢复的扫描中间状态"""
+        obj = copy.copy(self)
+        obj.ele = [None if ele is None else ele.clone() for ele in self.ele]
+        obj.lst = list(self.lst)
+        return obj
+
     def clear(self):
         """清空处理状态"""
         self.ele = [None, None, None]
@@ -61,8 +61,6 @@ class CSeg(Generic[LINE_TYPE]):
             self.is_sure = False
         self.check()
 
-        self.ele_inside_is_sure = False  # 内部元素是否全部确认
-
     def set_seg_idx(self, idx):
         """设置递归线段索引"""
         self.seg_idx = idx
@@ -108,6 +106,10 @@ class CSeg(Generic[LINE_TYPE]):
         """清空中枢列表"""
         self.zs_lst = []
 
+    def set_zs_lst(self, zs_lst):
+        """设置中枢列表（按时序排列）"""
+        self.zs_lst = zs_lst
+
     def _low(self):
         """获取有效最低价（兼容方向）"""
         return self.end_bi.get_end_klu().low if self.is_down() else self.start_bi.get_begin_klu().low
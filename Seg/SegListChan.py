@@ -1,3 +1,5 @@
+from typing import Dict, Optional, Tuple
+
 from Bi.BiList import CBiList
 from Common.CEnum import BI_DIR, SEG_TYPE
 
@@ -12,6 +14,9 @@ class CSegListChan(CSegListComm):
     def __init__(self, seg_config=CSegConfig(), lv=SEG_TYPE.BI):
         """初始化线段列表"""
         super(CSegListChan, self).__init__(seg_config=seg_config, lv=lv)
+        # cal_seg_sure 的扫描状态，key 为 (起始笔索引, 最后线段方向)，value 为 (特征序列检查点, 已找到的分型)
+        self.scan_state_dict: Dict[tuple, Tuple[Optional[CSegScanState], Optional[CSegScanState]]] = {}
+        self.new_scan_state_dict: Dict[tuple, Tuple[Optional[CSegScanState], Optional[CSegScanState]]] = {}
 
     def do_init(self):
         """初始化处理：清除未确认线段和无效分型"""
@@ -32,25 +37,58 @@ class CSegListChan(CSegListComm):
                 # 当分型第三元素包含未确认笔时，移除该线段
                 self.lst.pop()
 
+    def retire_head(self, cnt: int):
+        """淘汰历史线段；扫描状态里记录的是笔索引，重新编号后全部作废"""
+        super(CSegListChan, self).retire_head(cnt)
+        self.scan_state_dict = {}
+        self.new_scan_state_dict = {}
+
     def update(self, bi_lst: CBiList):
         """更新线段列表主入口"""
         self.do_init()  # 执行初始化清理
+        self.new_scan_state_dict = {}
         # 根据当前线段状态选择起始分析位置
         if len(self) == 0:
             self.cal_seg_sure(bi_lst, begin_idx=0)
         else:
             self.cal_seg_sure(bi_lst, begin_idx=self[-1].end_bi.idx+1)
+        # 只保留本次用到的扫描状态
+        self.scan_state_dict = self.new_scan_state_dict
         self.collect_left_seg(bi_lst)  # 收集剩余未处理线段
 
     def cal_seg_sure(self, bi_lst: CBiList, begin_idx: int):
         """核心方法：计算确认线段"""
-        # 初始化特征序列分析器
-        up_eigen = CEigenFX(BI_DIR.UP, lv=self.lv)  # 上升线段需要处理下降笔序列
-        down_eigen = CEigenFX(BI_DIR.DOWN, lv=self.lv)  # 下降线段需要处理上升笔序列
         last_seg_dir = None if len(self) == 0 else self[-1].dir  # 最后确认线段方向
-        
+        # 扫描结果只取决于起始位置、最后线段方向和之后的笔
+        scan_key = (begin_idx, last_seg_dir)
+        ckpt, fx_state = self.scan_state_dict.get(scan_key, (None, None))
+        if fx_state is not None and fx_state.can_resume(bi_lst):
+            # 找到分型时依赖的笔都没变，直接复用上次的分型（分型找到后不再被修改）
+            self.new_scan_state_dict[scan_key] = (ckpt, fx_state)
+            self.treat_fx_eigen(fx_state.fx_eigen, bi_lst)
+            return
+        if ckpt is not None and ckpt.can_resume(bi_lst):
+            # 从检查点继续，只处理之后新增或修改过的笔
+            up_eigen, down_eigen = ckpt.up_eigen.clone(), ckpt.down_eigen.clone()
+            last_seg_dir = ckpt.last_seg_dir
+            next_idx = ckpt.next_idx
+        else:
+            ckpt = None
+            # 初始化特征序列分析器
+            up_eigen = CEigenFX(BI_DIR.UP, lv=self.lv)  # 上升线段需要处理下降笔序列
+            down_eigen = CEigenFX(BI_DIR.DOWN, lv=self.lv)  # 下降线段需要处理上升笔序列
+            next_idx = begin_idx
+        new_ckpt: Optional[CSegScanState] = None
+
         # 遍历指定起始位置后的所有笔
-        for bi in bi_lst[begin_idx:]:
+        for bi in bi_lst.iter_range(next_idx):
+            # 特征序列会向后看两笔，进入最后几笔（可能被修改）之前保存检查点
+            if new_ckpt is None and bi.idx + 4 >= len(bi_lst):
+                if ckpt is not None and ckpt.next_idx == bi.idx:
+                    new_ckpt = ckpt
+                else:
+                    new_ckpt = CSegScanState(bi_lst, bi.idx + 1, next_idx=bi.idx, up_eigen=up_eigen.clone(),
+                                             down_eigen=down_eigen.clone(), last_seg_dir=last_seg_dir)
             fx_eigen = None  # 当前检测到的有效分型
             # 根据笔方向和线段方向过滤处理
             if bi.is_down() and last_seg_dir != BI_DIR.UP:
@@ -76,8 +114,11 @@ class CSegListChan(CSegListComm):
             
             # 发现有效分型后处理
             if fx_eigen:
+                self.new_scan_state_dict[scan_key] = (new_ckpt, CSegScanState(bi_lst, bi.idx + 2, fx_eigen=fx_eigen))
                 self.treat_fx_eigen(fx_eigen, bi_lst)
                 break
+        else:
+            self.new_scan_state_dict[scan_key] = (new_ckpt, None)
 
     def treat_fx_eigen(self, fx_eigen, bi_lst: CBiList):
         """处理检测到的分型特征"""
@@ -95,4 +136,30 @@ class CSegListChan(CSegListComm):
             if is_true:
                 self.cal_seg_sure(bi_lst, end_bi_idx + 1)
         else:  # 无效分型，重新从第二元素开始分析
-            self.cal_seg_sure(bi_lst, fx_eigen.lst[1].idx)
\ No newline at end of file
+            self.cal_seg_sure(bi_lst, fx_eigen.lst[1].idx)
+
+
+class CSegScanState:
+    """
+    cal_seg_sure 的可恢复状态：喂入 next_idx 之前的特征序列，或已经找到的分型
+    状态最多依赖到 check_idx 这一笔；笔只在尾部被修改或删除，只要这一笔仍是同一个对象且终点没变，之前的笔都没变
+    """
+
+    def __init__(self, bi_lst, check_idx: int, next_idx: Optional[int] = None, up_eigen: Optional[CEigenFX] = None,
+                 down_eigen: Optional[CEigenFX] = None, last_seg_dir: Optional[BI_DIR] = None, fx_eigen: Optional[CEigenFX] = None):
+        self.next_idx = next_idx  # 下一根待处理的笔
+        self.up_eigen = up_eigen
+        self.down_eigen = down_eigen
+        self.last_seg_dir = last_seg_dir
+        self.fx_eigen = fx_eigen  # 已找到的分型
+        self.check_idx = check_idx
+        self.check_exist = check_idx < len(bi_lst)  # 依赖的笔当时是否存在（不存在时结果依赖于“没有后续笔”）
+        self.line_idx = min(check_idx, len(bi_lst) - 1)
+        self.line = bi_lst[self.line_idx]
+        self.line_end_klu = self.line.get_end_klu()
+
+    def can_resume(self, bi_lst) -> bool:
+        if (self.check_idx < len(bi_lst)) != self.check_exist or self.line_idx >= len(bi_lst):
+            return False
+        line = bi_lst[self.line_idx]
+        return line is self.line and line.get_end_klu() is self.line_end_klu
@@ -1,5 +1,5 @@
 import abc
-from typing import Generic, List, TypeVar, Union, overload
+from typing import Generic, Iterator, List, Optional, TypeVar, Union, overload
 
 from Bi.Bi import CBi
 from Bi.BiList import CBiList
@@ -45,6 +45,25 @@ class CSegListComm(Generic[SUB_LINE_TYPE]):
         """获取线段数量"""
         return len(self.lst)
 
+    def iter_range(self, begin: int, end: Optional[int] = None) -> Iterator[CSeg[SUB_LINE_TYPE]]:
+        """按下标区间 [begin, end) 遍历线段，不复制列表"""
+        lst = self.lst
+        for idx in range(begin, len(lst) if end is None else min(end, len(lst))):
+            yield lst[idx]
+
+    def retire_head(self, cnt: int):
+        """淘汰最前面 cnt 个线段，剩余线段从 0 开始重新编号"""
+        if cnt <= 0:
+            return
+        for seg in self.lst[:cnt]:
+            seg.pre = None
+            seg.next = None
+        del self.lst[:cnt]
+        for idx, seg in enumerate(self.lst):
+            seg.idx = idx
+        if self.lst:
+            self.lst[0].pre = None
+
     def left_bi_break(self, bi_lst: CBiList):
         """
         检测剩余笔是否突破最后确认线段
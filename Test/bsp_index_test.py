@@ -0,0 +1,42 @@
+import random
+
+from chan_test_util import make_chan
+from Common.CEnum import BSP_TYPE, KL_TYPE
+
+TYPES_LST = [None, [BSP_TYPE.T1], [BSP_TYPE.T2, BSP_TYPE.T2S], [BSP_TYPE.T1P, BSP_TYPE.T3A, BSP_TYPE.T3B]]
+
+
+def brute_force_bsp_lst(bsp_list):
+    """直接遍历底层存储，按所在K线排序"""
+    return sorted(bsp_list.bsp_store_flat_dict.values(), key=lambda bsp: bsp.klu.idx)
+
+
+def check_bsp_list(bsp_list, rnd: random.Random):
+    bsp_lst = brute_force_bsp_lst(bsp_list)
+    assert bsp_list.getSortedBspList() == bsp_lst
+    for types in TYPES_LST:
+        for is_buy in [None, True, False]:
+            expect = [bsp for bsp in bsp_lst if (types is None or any(t in bsp.type for t in types)) and (is_buy is None or bsp.is_buy == is_buy)]
+            assert bsp_list.last_bsp(types, is_buy) is (expect[-1] if expect else None)
+    if not bsp_lst:
+        return
+    max_klu_idx = bsp_lst[-1].klu.idx + 2
+    for _ in range(5):
+        begin, end = sorted(rnd.randint(0, max_klu_idx) for _ in range(2))
+        assert bsp_list.bsps_in_range(begin, end) == [bsp for bsp in bsp_lst if begin <= bsp.klu.idx <= end]
+        time = rnd.choice(bsp_lst).klu.time
+        assert bsp_list.bsps_since(time) == [bsp for bsp in bsp_lst if bsp.klu.time.ts >= time.ts]
+
+
+def test_bsp_index_matches_brute_force():
+    """回放的每一步，笔、线段买卖点的排序索引查询都与遍历全部买卖点的结果一致"""
+    rnd = random.Random(0)
+    lv_list = [KL_TYPE.K_60M, KL_TYPE.K_30M]
+    chan = make_chan(5, 120, lv_list, trigger_step=True)
+    bsp_cnt = 0
+    for snapshot in chan.step_load():
+        for lv in lv_list:
+            check_bsp_list(snapshot[lv].bs_point_lst, rnd)
+            check_bsp_list(snapshot[lv].seg_bs_point_lst, rnd)
+            bsp_cnt += len(snapshot[lv].bs_point_lst)
+    assert bsp_cnt > 0
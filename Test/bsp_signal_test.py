@@ -0,0 +1,74 @@
+import pytest
+
+from chan_test_util import make_chan
+from BuySellPoint.BSPointList import bsp_event_key
+from BuySellPoint.BSPointSignal import CBSPointSignal
+from Common.CEnum import CHAN_EVENT, FX_TYPE, KL_TYPE
+
+
+def brute_force_signal(chan, lv_idx):
+    """原先每步排序整个买卖点列表的做法：最后一个买卖点所在合并K线是倒数第二根且形成对应分型"""
+    bsp_list = chan.get_bsp(lv_idx)
+    if not bsp_list or len(chan[lv_idx]) < 2:
+        return None
+    last_bsp = bsp_list[-1]
+    klc = chan[lv_idx][-2]
+    if last_bsp.klu.klc.idx != klc.idx:
+        return None
+    if (klc.fx == FX_TYPE.BOTTOM and last_bsp.is_buy) or (klc.fx == FX_TYPE.TOP and not last_bsp.is_buy):
+        return last_bsp
+    return None
+
+
+@pytest.mark.parametrize("seed, day_cnt, lv_list, max_history", [
+    (1, 120, [KL_TYPE.K_30M], 0),
+    (2, 120, [KL_TYPE.K_60M, KL_TYPE.K_30M], 0),
+    (3, 440, [KL_TYPE.K_30M], 3),  # 后期会淘汰历史，持有的买卖点需要重新编号
+])
+def test_signal_matches_sorted_bsp_list(seed, day_cnt, lv_list, max_history):
+    chan = make_chan(seed, day_cnt, lv_list, trigger_step=True, max_history=max_history)
+    bsp_signal = CBSPointSignal(chan)
+    signal_cnt = 0
+    for snapshot in chan.step_load():
+        signal_dict = dict(bsp_signal.check())
+        for lv_idx in range(len(lv_list)):
+            expect = brute_force_signal(snapshot, lv_idx)
+            # 持有的是当前的买卖点对象，不是重算前的旧对象
+            assert signal_dict[lv_idx] is expect if expect else lv_idx not in signal_dict
+            last_bsp = snapshot.get_bsp(lv_idx)[-1] if snapshot.get_bsp(lv_idx) else None
+            assert bsp_signal.last_bsp(lv_idx) is last_bsp
+        signal_cnt += len(signal_dict)
+    assert signal_cnt > 0
+    assert max_history == 0 or chan[0].retired_klu_cnt > 0
+
+
+def test_bsp_events_track_bsp_list():
+    """按 BSP_CREATED/BSP_UPDATED/BSP_INVALIDATED 事件增量维护的买卖点，每步都与当前的笔、线段买卖点列表一致（同一对象）"""
+    lv_list = [KL_TYPE.K_60M, KL_TYPE.K_30M]
+    chan = make_chan(4, 120, lv_list, trigger_step=True)
+    event_bsp_dict = {}
+    event_cnt = {event_type: 0 for event_type in CHAN_EVENT}
+
+    def on_event(event):
+        event_cnt[event.type] += 1
+        if event.bsp is None:
+            return
+        key = (event.kl_type, event.is_seg, bsp_event_key(event.bsp))
+        if event.type == CHAN_EVENT.BSP_CREATED:
+            assert key not in event_bsp_dict
+            event_bsp_dict[key] = event.bsp
+        elif event.type == CHAN_EVENT.BSP_UPDATED:
+            assert event_bsp_dict[key] is not event.bsp
+            event_bsp_dict[key] = event.bsp
+        elif event.type == CHAN_EVENT.BSP_INVALIDATED:
+            del event_bsp_dict[key]
+
+    chan.add_event_listener(on_event)
+    for snapshot in chan.step_load():
+        expect = {}
+        for lv in lv_list:
+            for is_seg, bsp_list in [(False, snapshot[lv].bs_point_lst), (True, snapshot[lv].seg_bs_point_lst)]:
+                expect.update(((lv, is_seg, bsp_event_key(bsp)), bsp) for bsp in bsp_list.bsp_iter())
+        assert set(event_bsp_dict) == set(expect)
+        assert all(event_bsp_dict[key] is bsp for key, bsp in expect.items())
+    assert all(event_cnt[event_type] > 0 for event_type in [CHAN_EVENT.BSP_CREATED, CHAN_EVENT.BSP_UPDATED, CHAN_EVENT.BSP_INVALIDATED, CHAN_EVENT.BI_SURE, CHAN_EVENT.SEG_SURE])
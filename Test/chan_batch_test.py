@@ -0,0 +1,138 @@
+import random
+
+import pytest
+
+import KLine.KLine_Combine as KLine_Combine
+import KLine.KLine_List as KLine_List
+from Chan import CChan
+from ChanBatch import CChanBatch
+from chan_test_util import CTestStockApi, TEST_CONFIG, chan_state, gen_30m_bar, make_chan
+from ChanConfig import CChanConfig
+from Common.CEnum import KL_TYPE
+from Math.BOLL import BollModel
+from Math.MACD import CMACD
+from Math.MetricColumns import CMetricColumns, restore_models
+from Math.TrendModel import CTrendModel
+
+METRIC_CONFIG = {"mean_metrics": [5, 20], "trend_metrics": [10], "boll_n": 20}
+
+
+def metric_state(chan):
+    """各K线单元的指标和各级别指标模型的状态"""
+    res = []
+    for lv_idx in range(len(chan.lv_list)):
+        kl_list = chan[lv_idx]
+        res.append([
+            (klu.macd.fast_ema, klu.macd.slow_ema, klu.macd.DIF, klu.macd.DEA, klu.macd.macd, klu.boll.MID, klu.boll.theta, klu.boll.UP,
+             sorted((trend_type.name, sorted(value.items())) for trend_type, value in klu.trend.items()))
+            for klc in kl_list for klu in klc.lst
+        ])
+        res.append([
+            (type(model).__name__, [(item.fast_ema, item.DEA) for item in model.macd_info] if isinstance(model, CMACD) else list(getattr(model, "arr", [])))
+            for model in kl_list.metric_model_lst
+        ])
+    return res
+
+
+@pytest.fixture
+def test_api(monkeypatch):
+    monkeypatch.setattr(CChan, "GetStockAPI", lambda self: CTestStockApi)
+
+
+def make_batch(codes, lv_list, **conf):
+    config = dict(TEST_CONFIG, **METRIC_CONFIG)
+    config.update(conf)
+    return CChanBatch([f"test.{seed}.{day_cnt}" for seed, day_cnt in codes], lv_list=lv_list, config=CChanConfig(config), batch_size=2)
+
+
+@pytest.mark.parametrize("lv_list", [[KL_TYPE.K_30M], [KL_TYPE.K_DAY, KL_TYPE.K_60M, KL_TYPE.K_30M]])
+def test_batch_load_matches_chan(test_api, lv_list):
+    codes = [(1, 120), (2, 60), (3, 90)]  # 长度不同，最后一批只有一只
+    batch = make_batch(codes, lv_list)
+    assert len(batch) == len(codes)
+    for seed, day_cnt in codes:
+        chan = make_chan(seed, day_cnt, lv_list, **METRIC_CONFIG)
+        assert chan_state(batch[f"test.{seed}.{day_cnt}"]) == chan_state(chan)
+        assert metric_state(batch[f"test.{seed}.{day_cnt}"]) == metric_state(chan)
+
+
+def test_batch_uses_columns(test_api, monkeypatch):
+    """单级别时指标、K线合并全部来自按列计算的结果，不再逐根递推、逐只合并"""
+    call_cnt = {"macd": 0, "combine": 0}
+
+    def count(name, func):
+        def wrapper(*args, **kwargs):
+            call_cnt[name] += 1
+            return func(*args, **kwargs)
+        return wrapper
+    monkeypatch.setattr(CMACD, "add", count("macd", CMACD.add))
+    monkeypatch.setattr(KLine_List, "cal_combine", count("combine", KLine_List.cal_combine))
+    batch = make_batch([(4, 60), (5, 60)], [KL_TYPE.K_30M])
+    assert call_cnt == {"macd": 0, "combine": 0}
+    for _, chan in batch:
+        assert all(type(model) in (CMACD, CTrendModel, BollModel) for model in chan[0].metric_model_lst)
+
+
+def test_batch_step_load_matches_chan(test_api):
+    lv_list = [KL_TYPE.K_60M, KL_TYPE.K_30M]
+    codes = [(6, 40), (7, 30), (8, 40)]
+    batch = make_batch(codes, lv_list, trigger_step=True)
+    step_cnt = {}
+    for code, _ in batch.step_load():
+        step_cnt[code] = step_cnt.get(code, 0) + 1
+    for seed, day_cnt in codes:
+        code = f"test.{seed}.{day_cnt}"
+        chan = make_chan(seed, day_cnt, lv_list, trigger_step=True, **METRIC_CONFIG)
+        assert step_cnt[code] == sum(1 for _ in chan.step_load())
+        assert chan_state(batch[code]) == chan_state(chan)
+        assert metric_state(batch[code]) == metric_state(chan)
+
+
+def test_batch_latest_state_matches_chan(test_api):
+    """逐只只算尾部窗口，与单只 CChan.latest_state 一致；读取出错的股票记在 err_dict 中"""
+    lv_list = [KL_TYPE.K_60M, KL_TYPE.K_30M]
+    codes = [(1, 300), (2, 300), (3, 200)]
+    code_lst = [f"test.{seed}.{day_cnt}" for seed, day_cnt in codes]
+    batch = CChanBatch(code_lst[:2] + ["test.bad.10"] + code_lst[2:], lv_list=lv_list, config=CChanConfig(dict(TEST_CONFIG)), batch_size=2, autoload=False)
+    res = dict(batch.latest_state(window=300))
+    assert list(res) == code_lst
+    assert list(batch.err_dict) == ["test.bad.10"]
+    for seed, day_cnt in codes:
+        chan = make_chan(seed, day_cnt, lv_list, autoload=False).latest_state(window=300)
+        assert chan_state(res[f"test.{seed}.{day_cnt}"]) == chan_state(chan)
+
+
+@pytest.mark.parametrize("use_jit", [True, False])
+def test_combine_columns_matches_combine(monkeypatch, use_jit):
+    if not use_jit:
+        monkeypatch.setattr(KLine_Combine, "combine_rows_jit", None)
+    high_lst_lst, low_lst_lst = [], []
+    for seed in range(6):
+        bar_lst = gen_30m_bar(seed, 10 * seed)
+        high_lst_lst.append([bar[2] for bar in bar_lst])
+        low_lst_lst.append([bar[3] for bar in bar_lst])
+    high_lst_lst[3][20] = float("nan")  # 数据异常的一组对应 None
+    res_lst = KLine_Combine.cal_combine_columns(high_lst_lst, low_lst_lst)
+    assert res_lst[3] is None
+    for high_lst, low_lst, res in zip(high_lst_lst, low_lst_lst, res_lst):
+        if res is None:
+            continue
+        expect = KLine_Combine.cal_combine(high_lst, low_lst)
+        assert (res.begin, res.high, res.low, res.dir, res.fx) == (expect.begin, expect.high, expect.low, expect.dir, expect.fx)
+
+
+def test_metric_preset_fallback():
+    """加入的收盘价与预置时不同，或预置用完后，接着逐根计算"""
+    rnd = random.Random(9)
+    close_lst = [100 + rnd.random() for _ in range(50)]
+    config = CChanConfig(dict(METRIC_CONFIG))
+    model_lst = CMetricColumns([close_lst]).preset_models([config.GetMetricModel()])[0]
+    expect_lst = config.GetMetricModel()
+    feed_lst = close_lst[:30] + [close_lst[30] + 1] + close_lst[31:] + [101.0, 102.0]
+    for close in feed_lst:
+        for model, expect in zip(model_lst, expect_lst):
+            value, expect_value = model.add(close), expect.add(close)
+            assert vars(value) == vars(expect_value) if hasattr(value, "__dict__") else value == expect_value
+    for model, expect in zip(restore_models(model_lst), expect_lst):
+        assert type(model) is type(expect)
+        assert getattr(model, "arr", None) == getattr(expect, "arr", None)
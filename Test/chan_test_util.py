@@ -0,0 +1,131 @@
+import datetime
+import random
+
+from Chan import CChan
+from ChanConfig import CChanConfig
+from Common.CEnum import DATA_FIELD, KL_TYPE
+from Common.CTime import CTime
+from DataAPI.CommonStockAPI import CCommonStockApi
+from KLine.KLine_Unit import CKLine_Unit
+
+# 每天 8 根30分钟K线，60分钟、日线由30分钟K线合成，保证各级别严格对齐
+SLOT_LST = [(10, 0), (10, 30), (11, 0), (11, 30), (13, 30), (14, 0), (14, 30), (15, 0)]
+
+
+def gen_30m_bar(seed, day_cnt):
+    """随机游走的30分钟K线 [(CTime, open, high, low, close)]，偶尔出现一字板"""
+    rnd = random.Random(seed)
+    price = 100.0
+    day = datetime.date(2015, 1, 5)
+    res = []
+    while len(res) < day_cnt * len(SLOT_LST):
+        if day.weekday() < 5:
+            for hour, minute in SLOT_LST:
+                _open = price
+                _close = max(1.0, _open * (1 + rnd.gauss(0, 0.012)))
+                _high = max(_open, _close) * (1 + abs(rnd.gauss(0, 0.004)))
+                _low = min(_open, _close) * (1 - abs(rnd.gauss(0, 0.004)))
+                if rnd.random() < 0.01:
+                    _high = _low = _open = _close
+                res.append((CTime(day.year, day.month, day.day, hour, minute), _open, _high, _low, _close))
+                price = _close
+        day += datetime.timedelta(days=1)
+    return res
+
+
+def merge_bar(bar_lst, cnt, day_level=False):
+    res = []
+    for idx in range(0, len(bar_lst) - cnt + 1, cnt):
+        grp = bar_lst[idx:idx+cnt]
+        t = grp[-1][0]
+        if day_level:
+            t = CTime(t.year, t.month, t.day, 0, 0)
+        res.append((t, grp[0][1], max(bar[2] for bar in grp), min(bar[3] for bar in grp), grp[-1][4]))
+    return res
+
+
+class CTestStockApi(CCommonStockApi):
+    """测试用数据源，code 形如 test.<seed>.<天数>；bar_filter 可按级别增删K线，用于构造异常数据"""
+    bar_filter = {}
+
+    def get_kl_data(self):
+        _, seed, day_cnt = self.code.split(".")
+        bar_30m = gen_30m_bar(int(seed), int(day_cnt))
+        bar_dict = {
+            KL_TYPE.K_30M: bar_30m,
+            KL_TYPE.K_60M: merge_bar(bar_30m, 2),
+            KL_TYPE.K_DAY: merge_bar(bar_30m, len(SLOT_LST), day_level=True),
+        }
+        bar_lst = bar_dict[self.k_type]
+        if self.k_type in self.bar_filter:
+            bar_lst = self.bar_filter[self.k_type](bar_lst)
+        for t, _open, _high, _low, _close in bar_lst:
+            yield CKLine_Unit({
+                DATA_FIELD.FIELD_TIME: t,
+                DATA_FIELD.FIELD_OPEN: _open,
+                DATA_FIELD.FIELD_HIGH: _high,
+                DATA_FIELD.FIELD_LOW: _low,
+                DATA_FIELD.FIELD_CLOSE: _close,
+            })
+
+    def SetBasciInfo(self):
+        self.name = self.code
+        self.is_stock = True
+
+    @classmethod
+    def do_init(cls):
+        ...
+
+    @classmethod
+    def do_close(cls):
+        ...
+
+
+class CTestChan(CChan):
+    def GetStockAPI(self):
+        return CTestStockApi
+
+
+TEST_CONFIG = {
+    "bi_strict": True,
+    "bs_type": "1,2,3a,1p,2s,3b",
+    "print_warning": False,
+}
+
+
+def make_chan(seed=1, day_cnt=120, lv_list=None, autoload=True, **conf) -> CChan:
+    config = dict(TEST_CONFIG)
+    config.update(conf)
+    return CTestChan(
+        code=f"test.{seed}.{day_cnt}",
+        lv_list=lv_list or [KL_TYPE.K_30M],
+        config=CChanConfig(config),
+        autoload=autoload,
+    )
+
+
+def chan_state(chan):
+    """各级别的合并K线、笔、线段、中枢、买卖点，按端点所在K线单元展开，用于比较两次计算的结果"""
+    res = []
+    for lv_idx in range(len(chan.lv_list)):
+        kl_list = chan[lv_idx]
+        res.append([(klc.idx, klc.high, klc.low, klc.fx, tuple(klu.idx for klu in klc.lst)) for klc in kl_list])
+        res.append([(bi.idx, bi.get_begin_klu().idx, bi.get_end_klu().idx, bi.dir, bi.is_sure, bi.seg_idx) for bi in kl_list.bi_list])
+        for seg_list in [kl_list.seg_list, kl_list.segseg_list]:
+            res.append([
+                (seg.idx, seg.start_bi.idx, seg.end_bi.idx, seg.get_begin_klu().idx, seg.get_end_klu().idx, seg.is_sure, len(seg.bi_list),
+                 [(zs.begin_bi.idx, zs.end_bi.idx, zs.low, zs.high) for zs in seg.zs_lst])
+                for seg in seg_list
+            ])
+        for zs_list in [kl_list.zs_list, kl_list.segzs_list]:
+            res.append([
+                (zs.begin.idx, zs.end.idx, zs.begin_bi.idx, zs.end_bi.idx, zs.low, zs.high, zs.is_sure,
+                 zs.bi_in.get_end_klu().idx if zs.bi_in else None, zs.bi_out.get_end_klu().idx if zs.bi_out else None)
+                for zs in zs_list
+            ])
+        for bsp_list in [kl_list.bs_point_lst, kl_list.seg_bs_point_lst]:
+            res.append([
+                (bsp.klu.idx, bsp.bi.idx, bsp.bi.get_end_klu().idx, bsp.is_buy, bsp.type2str(), sorted(bsp.features.items()))
+                for bsp in bsp_list.getSortedBspList()
+            ])
+    return res
@@ -0,0 +1,39 @@
+from chan_test_util import CTestChan, chan_state, make_chan
+from Common.CEnum import KL_TYPE
+
+LV_LIST = [KL_TYPE.K_60M, KL_TYPE.K_30M]
+
+
+def link_state(chan):
+    """跨级别父子关系，按K线时间展开"""
+    return [
+        [(klu.time.ts, klu.sup_kl.time.ts if klu.sup_kl else None, [sub_klu.time.ts for sub_klu in klu.sub_kl_list]) for klc in chan[lv_idx] for klu in klc.lst]
+        for lv_idx in range(len(chan.lv_list))
+    ]
+
+
+def test_checkpoint_round_trip():
+    chan = make_chan(6, 120, LV_LIST)
+    event_lst = []
+    chan.add_event_listener(event_lst.append)
+    expect_state, expect_link = chan_state(chan), link_state(chan)
+    restored = CTestChan.from_checkpoint(chan.dump_checkpoint())
+    assert chan_state(restored) == expect_state
+    assert link_state(restored) == expect_link
+    assert all(sub_klu.sup_kl is klu for klc in restored[0] for klu in klc.lst for sub_klu in klu.sub_kl_list)
+    assert [restored[lv_idx].klu_index.ts for lv_idx in range(len(LV_LIST))] == [chan[lv_idx].klu_index.ts for lv_idx in range(len(LV_LIST))]
+    # 序列化后原对象不受影响
+    assert chan_state(chan) == expect_state
+    assert link_state(chan) == expect_link
+    assert chan.event_listeners == [event_lst.append]
+
+
+def test_checkpoint_continue_load():
+    """从检查点还原后继续加入新K线，与一次算完的结果一致"""
+    chan = make_chan(7, 120, LV_LIST, autoload=False)
+    lv_klu_lst = chan.load_lv_klu_lst()
+    for _ in chan.load_lv_klu_iter([klu_lst[:len(klu_lst) * 2 // 3] for klu_lst in lv_klu_lst]):
+        ...
+    restored = CTestChan.from_checkpoint(chan.dump_checkpoint())
+    restored.trigger_load({lv: klu_lst[len(klu_lst) * 2 // 3:] for lv, klu_lst in zip(LV_LIST, lv_klu_lst)})
+    assert chan_state(restored) == chan_state(make_chan(7, 120, LV_LIST))
@@ -0,0 +1,57 @@
+import pytest
+
+from chan_test_util import CTestStockApi, SLOT_LST, gen_30m_bar, make_chan, merge_bar
+from Common.CEnum import KL_TYPE
+from Common.ChanException import CChanException
+from Common.CTime import CTime
+
+LV_LIST = [KL_TYPE.K_DAY, KL_TYPE.K_30M]
+DAY_CNT = 60
+
+
+def drop_day(bar_lst, day_idx):
+    """去掉第 day_idx 个交易日的K线"""
+    day_lst = sorted({(t.year, t.month, t.day) for t, *_ in bar_lst})
+    return [bar for bar in bar_lst if (bar[0].year, bar[0].month, bar[0].day) != day_lst[day_idx]]
+
+
+def day_of(day_idx) -> CTime:
+    """第 day_idx 个交易日的日线时间"""
+    return merge_bar(gen_30m_bar(1, DAY_CNT), len(SLOT_LST), day_level=True)[day_idx][0]
+
+
+@pytest.mark.parametrize("conf", [{}, {"trigger_step": True}, {"parallel_lv": True}])
+def test_misalign_report(monkeypatch, conf):
+    """次级别缺了一天的K线：父级别这一天找不到次级别K线，按 (父级别, 次级别) 记录父级别时间"""
+    monkeypatch.setitem(CTestStockApi.bar_filter, KL_TYPE.K_30M, lambda bar_lst: drop_day(bar_lst, 10))
+    chan = make_chan(1, DAY_CNT, LV_LIST, max_kl_misalgin_cnt=10, **conf)
+    if conf.get("trigger_step"):
+        for _ in chan.step_load():
+            ...
+    day_time = day_of(10)
+    report = chan.align_report
+    assert report.misalign_cnt == chan.kl_misalign_cnt == 1
+    assert {key: [t.ts for t in t_lst] for key, t_lst in report.misalign_detail.items()} == {(KL_TYPE.K_DAY, KL_TYPE.K_30M): [day_time.ts]}
+    assert dict(report.inconsistent_detail) == {}
+    assert [klu.time.ts for klc in chan[0] for klu in klc.lst if not klu.sub_kl_list] == [day_time.ts]
+
+
+def test_inconsistent_report(monkeypatch):
+    """父级别缺了一天的K线：这一天的次级别K线归到下一天，记录为日期不一致，其余部分照常计算"""
+    monkeypatch.setitem(CTestStockApi.bar_filter, KL_TYPE.K_DAY, lambda bar_lst: drop_day(bar_lst, 10))
+    chan = make_chan(1, DAY_CNT, LV_LIST)
+    missing_day, next_day = day_of(10), day_of(11)
+    sub_time_lst = [klu.time for klc in chan[1] for klu in klc.lst]
+    expect_sub_lst = [t for t in sub_time_lst if (t.year, t.month, t.day) == (missing_day.year, missing_day.month, missing_day.day)]
+    assert len(expect_sub_lst) == len(SLOT_LST)
+    report = chan.align_report
+    assert report.misalign_cnt == 0
+    assert {key: [t.ts for t in t_lst] for key, t_lst in report.inconsistent_detail.items()} == {str(next_day): [t.ts for t in expect_sub_lst]}
+    assert chan.kl_inconsistent_detail is report.inconsistent_detail
+
+
+def test_misalign_limit(monkeypatch):
+    """找不到次级别K线的条数达到 max_kl_misalgin_cnt 时报错"""
+    monkeypatch.setitem(CTestStockApi.bar_filter, KL_TYPE.K_30M, lambda bar_lst: drop_day(drop_day(bar_lst, 10), 20))
+    with pytest.raises(CChanException, match="在次级别找不到K线条数超过2"):
+        make_chan(1, DAY_CNT, LV_LIST)
@@ -0,0 +1,46 @@
+import pytest
+
+from chan_test_util import make_chan
+from BuySellPoint.BSPointSignal import CBSPointSignal, last_formed_bsp, latest_signal
+from Common.CEnum import KL_TYPE
+
+def bsp_state(bsp):
+    return (bsp.klu.time.ts, bsp.is_buy, bsp.type2str()) if bsp else None
+
+
+# 数千根30分钟K线，window=300 时翻倍几轮后即稳定，不会退回完整计算
+@pytest.mark.parametrize("seed, day_cnt, lv_list, trigger_step", [
+    (1, 1000, [KL_TYPE.K_30M], False),
+    (2, 1000, [KL_TYPE.K_60M, KL_TYPE.K_30M], False),
+    (2, 600, [KL_TYPE.K_30M], True),
+])
+def test_latest_state_matches_full_load(seed, day_cnt, lv_list, trigger_step):
+    chan = make_chan(seed, day_cnt, lv_list, autoload=False, trigger_step=trigger_step)
+    assert len(chan[0]) == 0  # 构造时不加载
+    chan.latest_state(window=300)
+    full_chan = make_chan(seed, day_cnt, lv_list, trigger_step=trigger_step)
+    if trigger_step:
+        for _ in full_chan.step_load():
+            ...
+    assert 0 < len(chan[0].bi_list) < len(full_chan[0].bi_list)  # 只算了尾部
+    for lv_idx in range(len(lv_list)):
+        assert bsp_state(chan.get_bsp(lv_idx)[-1]) == bsp_state(full_chan.get_bsp(lv_idx)[-1])
+        assert bsp_state(last_formed_bsp(chan, lv_idx)) == bsp_state(last_formed_bsp(full_chan, lv_idx))
+
+
+@pytest.mark.parametrize("seed", [4, 5])
+def test_latest_signal_matches_last_check(seed):
+    """最新状态上的信号与回放最后一步 check() 的一致；last_formed_bsp 不早于回放记录的最后一个信号"""
+    lv_list = [KL_TYPE.K_60M, KL_TYPE.K_30M]
+    chan = make_chan(seed, 120, lv_list, trigger_step=True)
+    bsp_signal = CBSPointSignal(chan)
+    signal_lst = []
+    for _ in chan.step_load():
+        signal_lst = bsp_signal.check()
+    assert [(lv_idx, bsp_state(bsp)) for lv_idx, bsp in latest_signal(chan)] == [(lv_idx, bsp_state(bsp)) for lv_idx, bsp in signal_lst]
+    for lv_idx in range(len(lv_list)):
+        formed, signal = last_formed_bsp(chan, lv_idx), bsp_signal.last_signal(lv_idx)
+        assert formed is not None and signal is not None
+        assert formed.klu.klc.idx < len(chan[lv_idx]) - 1
+        if signal in chan.get_bsp(lv_idx):
+            assert formed.klu.idx >= signal.klu.idx
@@ -0,0 +1,64 @@
+import pytest
+
+from chan_test_util import make_chan
+
+SEED, DAY_CNT = 3, 440  # 约 3500 根30分钟K线，最后两百多步处于淘汰历史之后
+
+
+def line_state(line):
+    return line.get_begin_klu().time.ts, line.get_end_klu().time.ts, line.dir, line.is_sure
+
+
+def time_state(kl_list):
+    """按时间展开的计算结果，与编号无关，用于与不淘汰时的结果比较"""
+    return [
+        [(klc[0].time.ts, klc[-1].time.ts, klc.high, klc.low, klc.fx) for klc in kl_list],
+        [line_state(bi) for bi in kl_list.bi_list],
+        [line_state(seg) for seg in kl_list.seg_list],
+        [line_state(seg) for seg in kl_list.segseg_list],
+        [(zs.begin.time.ts, zs.end.time.ts, zs.low, zs.high, zs.is_sure) for zs in kl_list.zs_list],
+        [(zs.begin.time.ts, zs.end.time.ts, zs.low, zs.high, zs.is_sure) for zs in kl_list.segzs_list],
+        [(bsp.klu.time.ts, bsp.is_buy, bsp.type2str()) for bsp in kl_list.bs_point_lst.getSortedBspList()],
+        [(bsp.klu.time.ts, bsp.is_buy, bsp.type2str()) for bsp in kl_list.seg_bs_point_lst.getSortedBspList()],
+    ]
+
+
+@pytest.fixture(scope="module")
+def retired_chan():
+    chan = make_chan(SEED, DAY_CNT, trigger_step=True, max_history=3)
+    for _ in chan.step_load():
+        ...
+    return chan
+
+
+def test_max_history_compacts_idx(retired_chan):
+    kl_list = retired_chan[0]
+    assert kl_list.retired_klu_cnt > 0
+    klu_lst = [klu for klc in kl_list for klu in klc.lst]
+    assert [klc.idx for klc in kl_list] == list(range(len(kl_list)))
+    assert [klu.idx for klu in klu_lst] == list(range(len(klu_lst)))
+    assert len(kl_list.klu_index) == len(klu_lst)
+    assert klu_lst[0].pre is None
+    for line_list, parent_list in [(kl_list.bi_list, kl_list.seg_list), (kl_list.seg_list, kl_list.segseg_list)]:
+        assert [line.idx for line in line_list] == list(range(len(line_list)))
+        # 最后一个线段之后的笔 seg_idx 为线段数
+        assert all(line.seg_idx is None or line.seg_idx == len(parent_list) or parent_list[line.seg_idx].start_bi.idx <= line.idx <= parent_list[line.seg_idx].end_bi.idx for line in line_list)
+        assert all(line_list[seg.start_bi.idx] is seg.start_bi and line_list[seg.end_bi.idx] is seg.end_bi for seg in parent_list)
+    for zs_list, line_list in [(kl_list.zs_list, kl_list.bi_list), (kl_list.segzs_list, kl_list.seg_list)]:
+        assert all(line_list[zs.begin_bi.idx] is zs.begin_bi and line_list[zs.end_bi.idx] is zs.end_bi for zs in zs_list)
+    for bsp_list, line_list in [(kl_list.bs_point_lst, kl_list.bi_list), (kl_list.seg_bs_point_lst, kl_list.seg_list)]:
+        bsp_lst = sorted(bsp_list.bsp_store_flat_dict.values(), key=lambda bsp: bsp.klu.idx)
+        assert bsp_list.getSortedBspList() == bsp_lst
+        assert bsp_list.bsps_in_range(0, len(klu_lst)) == bsp_lst
+        for bsp in bsp_lst:
+            assert line_list[bsp.bi.idx] is bsp.bi
+            assert klu_lst[bsp.klu.idx] is bsp.klu
+
+
+def test_max_history_keeps_recent_result(retired_chan):
+    """淘汰历史后保留的部分与不淘汰时对应的尾部一致"""
+    chan = retired_chan
+    full_chan = make_chan(SEED, DAY_CNT)
+    assert len(chan[0].bi_list) < len(full_chan[0].bi_list)
+    for retained, full in zip(time_state(chan[0]), time_state(full_chan[0])):
+        assert retained == full[len(full)-len(retained):]
@@ -0,0 +1,38 @@
+import pytest
+
+from chan_test_util import chan_state, make_chan
+from Common.CEnum import KL_TYPE
+
+
+@pytest.mark.parametrize("seed, lv_list", [
+    (1, [KL_TYPE.K_30M]),
+    (2, [KL_TYPE.K_30M]),
+    (3, [KL_TYPE.K_60M, KL_TYPE.K_30M]),
+])
+def test_view_snapshot_is_frozen(seed, lv_list):
+    """保留每一步的快照，回放结束后逐个与同一步逐K线计算的结果比较，快照不能随后续计算变化"""
+    snapshot_lst = list(make_chan(seed, 75, lv_list, trigger_step=True).step_load(view=True))
+    expect_lst = [chan_state(chan) for chan in make_chan(seed, 75, lv_list, trigger_step=True).step_load()]
+    assert len(snapshot_lst) == len(expect_lst)
+    drift_step_lst = [step for step, (snapshot, expect) in enumerate(zip(snapshot_lst, expect_lst)) if chan_state(snapshot) != expect]
+    assert drift_step_lst == []
+
+
+def test_view_snapshot_matches_full_load():
+    *_, snapshot = make_chan(4, 75, trigger_step=True).step_load(view=True)
+    assert chan_state(snapshot) == chan_state(make_chan(4, 75))
+
+
+def test_reused_virtual_bi_keeps_snapshot():
+    """虚笔删除后被原地复用刷新终点时，之前快照中的笔不能跟着变"""
+    chan = make_chan(1, 75, trigger_step=True)
+    held_lst = []
+    reuse_cnt = 0
+    for snapshot in chan.step_load(view=True):
+        bi_list = chan[0].bi_list
+        if len(bi_list) and bi_list[-1].version > 1:
+            reuse_cnt += 1
+        held_lst.append((snapshot, [(bi.idx, bi.get_end_klu().idx, bi.version, bi.is_sure) for bi in snapshot[0].bi_list]))
+    assert reuse_cnt > 0
+    for snapshot, bi_state in held_lst:
+        assert [(bi.idx, bi.get_end_klu().idx, bi.version, bi.is_sure) for bi in snapshot[0].bi_list] == bi_state
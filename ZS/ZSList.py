@@ -1,4 +1,5 @@
-from typing import List, Union, overload
+from bisect import bisect_left, bisect_right
+from typing import Iterable, List, Optional, Tuple, Union, overload
 
 from Bi.Bi import CBi
 from Bi.BiList import CBiList
@@ -19,6 +20,7 @@ class CZSList:
         self.free_item_lst = []      # 临时存储待处理笔的缓存列表
         self.last_sure_pos = -1      # 最后确认线段的起始笔索引
         self.last_seg_idx = 0        # 最后处理线段的索引位置
+        self.attach_begin_klu_idx = float("inf")  # 上次设置进出笔时处理到的最早K线索引，见 update_zs_in_seg
 
     def update_last_pos(self, seg_list: CSegListComm):
         """更新最后确认线段的位置信息"""
@@ -34,6 +36,33 @@ class CZSList:
                 return
             _seg_idx -= 1
 
+    def zs_range_in(self, begin_bi_idx: int, end_bi_idx: int) -> Tuple[int, int]:
+        """起始笔 idx 在 [begin_bi_idx, end_bi_idx] 内的中枢下标区间 [begin, end)，中枢按起始笔递增"""
+        begin = bisect_left(self.zs_lst, begin_bi_idx, key=lambda zs: zs.begin_bi.idx)
+        end = bisect_right(self.zs_lst, end_bi_idx, lo=begin, key=lambda zs: zs.begin_bi.idx)
+        return begin, end
+
+    def retire_cnt(self, cut_idx: int) -> Optional[int]:
+        """
+        在笔 cut_idx 处截断时需要淘汰的中枢个数，保留的中枢进笔也必须保留，所以起始笔不大于 cut_idx 的都淘汰
+        被淘汰的中枢延伸到 cut_idx 及之后时返回 None，表示不能在这里截断
+        """
+        cnt = bisect_right(self.zs_lst, cut_idx, key=lambda zs: zs.begin_bi.idx)
+        if cnt > 0 and self.zs_lst[cnt - 1].end_bi.idx >= cut_idx:
+            return None
+        # over_seg 模式从最后一个中枢之后继续计算，一个中枢都不剩会从头重算
+        if self.config.zs_algo == "over_seg" and cnt >= len(self.zs_lst):
+            return None
+        return cnt
+
+    def retire_head(self, zs_cnt: int, line_cnt: int, seg_cnt: int, klu_cnt: int):
+        """淘汰最前面 zs_cnt 个中枢，记录的笔、线段、K线位置随重新编号平移"""
+        del self.zs_lst[:zs_cnt]
+        if self.last_sure_pos >= 0:
+            self.last_sure_pos -= line_cnt
+        self.last_seg_idx = max(self.last_seg_idx - seg_cnt, 0)
+        self.attach_begin_klu_idx -= klu_cnt
+
     def seg_need_cal(self, seg: CSeg):
         """判断是否需要处理当前线段"""
         return seg.start_bi.idx >= self.last_sure_pos
@@ -42,7 +71,7 @@ class CZSList:
         """将笔添加到临时列表并尝试构造中枢"""
         # 防止重复添加同一笔
         if len(self.free_item_lst) != 0 and item.idx == self.free_item_lst[-1].idx:
-            self.free_item_lst = self.free_item_lst[:-1]
+            self.free_item_lst.pop()
         self.free_item_lst.append(item)
         # 尝试构造中枢
         res = self.try_construct_zs(self.free_item_lst, is_sure, zs_algo)
@@ -68,7 +97,7 @@ class CZSList:
         """尝试将笔添加到最后一个中枢"""
         return False if len(self.zs_lst) == 0 else self[-1].try_add_to_end(bi)
 
-    def add_zs_from_bi_range(self, seg_bi_lst: list, seg_dir, seg_is_sure):
+    def add_zs_from_bi_range(self, seg_bi_lst: Iterable, seg_dir, seg_is_sure):
         """从指定笔范围生成中枢"""
         deal_bi_cnt = 0
         for bi in seg_bi_lst:
@@ -112,41 +141,42 @@ class CZSList:
         # 不同算法分支处理
         if self.config.zs_algo == "normal":
             # 标准模式：按线段划分处理
-            for seg in seg_lst[self.last_seg_idx:]:
+            # 按下标区间遍历笔/线段，不复制列表
+            for seg in seg_lst.iter_range(self.last_seg_idx):
                 if not self.seg_need_cal(seg):
                     continue
                 self.clear_free_lst()
-                seg_bi_lst = bi_lst[seg.start_bi.idx:seg.end_bi.idx+1]
+                seg_bi_lst = bi_lst.iter_range(seg.start_bi.idx, seg.end_bi.idx+1)
                 self.add_zs_from_bi_range(seg_bi_lst, seg.dir, seg.is_sure)
             
             # 处理未形成线段的剩余笔
             if len(seg_lst):
                 self.clear_free_lst()
-                self.add_zs_from_bi_range(bi_lst[seg_lst[-1].end_bi.idx+1:], revert_bi_dir(seg_lst[-1].dir), False)
+                self.add_zs_from_bi_range(bi_lst.iter_range(seg_lst[-1].end_bi.idx+1), revert_bi_dir(seg_lst[-1].dir), False)
         
         elif self.config.zs_algo == "over_seg":
             # 线段穿透模式：直接处理笔序列
             assert self.config.one_bi_zs is False
             self.clear_free_lst()
             begin_bi_idx = self.zs_lst[-1].end_bi.idx+1 if self.zs_lst else 0
-            for bi in bi_lst[begin_bi_idx:]:
+            for bi in bi_lst.iter_range(begin_bi_idx):
                 self.update_overseg_zs(bi)
         
         elif self.config.zs_algo == "auto":
             # 自动模式：混合处理逻辑
             sure_seg_appear = False
             exist_sure_seg = seg_lst.exist_sure_seg()
-            for seg in seg_lst[self.last_seg_idx:]:
+            for seg in seg_lst.iter_range(self.last_seg_idx):
                 if seg.is_sure:
                     sure_seg_appear = True
                 if not self.seg_need_cal(seg):
                     continue
                 if seg.is_sure or (not sure_seg_appear and exist_sure_seg):
                     self.clear_free_lst()
-                    self.add_zs_from_bi_range(bi_lst[seg.start_bi.idx:seg.end_bi.idx+1], seg.dir, seg.is_sure)
+                    self.add_zs_from_bi_range(bi_lst.iter_range(seg.start_bi.idx, seg.end_bi.idx+1), seg.dir, seg.is_sure)
                 else:
                     self.clear_free_lst()
-                    for bi in bi_lst[seg.start_bi.idx:]:
+                    for bi in bi_lst.iter_range(seg.start_bi.idx):
                         self.update_overseg_zs(bi)
                     break
         
@@ -195,4 +225,4 @@ class CZSList:
             return
         # 循环合并直到无法合并
         while len(self.zs_lst) >= 2 and self.zs_lst[-2].combine(self.zs_lst[-1], combine_mode=self.config.zs_combine_mode):
-            self.zs_lst = self.zs_lst[:-1]
\ No newline at end of file
+            self.zs_lst.pop()
\ No newline at end of file
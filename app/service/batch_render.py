@@ -0,0 +1,121 @@
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+# 批量出图在独立进程中进行，每个进程用 Agg 后端，结果只写文件
+BATCH_RENDER_WORKERS = int(os.environ.get('CHAN_BATCH_RENDER_WORKERS', os.cpu_count() or 1))
+BATCH_RENDER_DIR = os.environ.get('CHAN_BATCH_RENDER_DIR', os.path.join(tempfile.gettempdir(), 'chan_batch_render'))
+MANIFEST_NAME = 'manifest.json'
+
+
+def new_report_dir(name):
+    """每次扫描一个目录：<BATCH_RENDER_DIR>/<日期时间>-<name>"""
+    return os.path.join(BATCH_RENDER_DIR, f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{name}")
+
+
+def checkpoint_item(chan, report_dir):
+    """扫描时保存算好的 CChan 到 report_dir/checkpoint 下，返回 render_batch 的一项"""
+    checkpoint_dir = os.path.join(report_dir, 'checkpoint')
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    path = os.path.join(checkpoint_dir, f"{safe_name(chan.code)}.ckpt")
+    with open(path, 'wb') as f:
+        f.write(chan.dump_checkpoint())
+    return {
+        'code': chan.code,
+        'lv_list': [lv.name for lv in chan.lv_list],
+        'begin_time': chan.begin_time,
+        'end_time': chan.end_time,
+        'checkpoint': path,
+    }
+
+
+def render_report(item_lst, report_dir):
+    """扫描结束后出图，出完删除检查点；没有需要出图的股票时什么也不做"""
+    if not item_lst:
+        return None
+    manifest = render_batch(item_lst, report_dir)
+    shutil.rmtree(os.path.join(report_dir, 'checkpoint'), ignore_errors=True)
+    print(f"batch render: {manifest['success_cnt']}/{len(item_lst)} images in {report_dir}, {manifest['elapsed']:.1f}s")
+    return manifest
+
+
+def render_batch(item_lst, out_dir, worker_cnt=BATCH_RENDER_WORKERS):
+    """
+    用进程池批量出图，图片写到 out_dir，并写 out_dir/manifest.json，返回 manifest
+    item_lst 每项是 dict：code, lv_list（级别名列表，如 ['K_DAY', 'K_30M']）, begin_time, end_time，
+    可选 checkpoint：CChan.dump_checkpoint 保存的文件路径（见 checkpoint_item），有则直接还原绘图，不再取数据、计算
+    单只出错不影响其他，manifest 中记录 error
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    begin = time.time()
+    with ProcessPoolExecutor(max_workers=max(min(worker_cnt, len(item_lst)), 1), initializer=init_render_process) as executor:
+        result_lst = list(executor.map(render_item, item_lst, [out_dir] * len(item_lst)))
+    manifest = {
+        'create_time': datetime.now().isoformat(),
+        'elapsed': time.time() - begin,
+        'success_cnt': sum(result['image'] is not None for result in result_lst),
+        'items': result_lst,
+    }
+    write_manifest(manifest, out_dir)
+    return manifest
+
+
+def init_render_process():
+    import matplotlib
+    matplotlib.use('Agg')
+
+
+def render_item(item, out_dir):
+    """在子进程中出一张图，返回 manifest 中的一项"""
+    from app.service.picture_service import save_chan_image
+
+    result = {
+        'code': item['code'],
+        'lv_list': item['lv_list'],
+        'begin_time': item.get('begin_time'),
+        'end_time': item.get('end_time'),
+        'image': None,
+        'error': None,
+    }
+    begin = time.time()
+    try:
+        chan = load_item_chan(item)
+        image_name = f"{safe_name(item['code'])}_{'-'.join(lv.name for lv in chan.lv_list)}.png"
+        save_chan_image(chan, os.path.join(out_dir, image_name))
+        result['image'] = image_name
+        result['last_time'] = [str(chan[lv_idx][-1][-1].time) if len(chan[lv_idx]) else None for lv_idx in range(len(chan.lv_list))]
+    except Exception as e:
+        print(f"render {item['code']} exception: {traceback.format_exc()}")
+        result['error'] = str(e)
+    result['elapsed'] = time.time() - begin
+    return result
+
+
+def load_item_chan(item):
+    from app.service.picture_service import new_chan
+    from Chan import CChan
+
+    if item.get('checkpoint'):
+        with open(item['checkpoint'], 'rb') as f:
+            return CChan.from_checkpoint(f.read())
+    chan = new_chan(item['code'], item.get('begin_time'), item.get('end_time'), item['lv_list'])
+    for _ in chan.load_lv_klu_iter(chan.load_lv_klu_lst()):
+        ...
+    return chan
+
+
+def write_manifest(manifest, out_dir):
+    fd, tmp_path = tempfile.mkstemp(dir=out_dir, prefix='.tmp-', suffix='.json')
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, os.path.join(out_dir, MANIFEST_NAME))
+
+
+def safe_name(code):
+    return re.sub(r'[^0-9A-Za-z_.-]', '_', code)
@@ -0,0 +1,132 @@
+import json
+from datetime import datetime, timedelta
+
+from Common.redis_util import RedisClient
+
+# 全市场扫描的买卖点记录，每个来源（股票/ETF）以 REDIS_KEY_*_BSP_RECORDS 为前缀：
+#   <前缀>:meta                  hash   update_time、begin_time（本轮扫描开始时间）、level_list（json）
+#   <前缀>:<级别>                hash   code -> 最近买卖点 json（is_buy, type, time）
+#   <前缀>:<级别>:buy / :sell    zset   code -> 买卖点时间戳，按时间范围查时用
+BSP_TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+STALE_DEL_BATCH = 500  # 扫描结束清理旧记录时每批删除的数量
+
+
+def meta_key(base_key):
+    return f"{base_key}:meta"
+
+
+def level_key(base_key, lv_name):
+    return f"{base_key}:{lv_name}"
+
+
+def time_key(base_key, lv_name, is_buy):
+    return f"{base_key}:{lv_name}:{'buy' if is_buy else 'sell'}"
+
+
+def bsp_info(last_bsp):
+    """买卖点转为记录的 dict，没有买卖点时返回 None"""
+    if last_bsp is None:
+        return None
+    ctime_obj = last_bsp.klu.time
+    bsp_time = datetime(ctime_obj.year, ctime_obj.month, ctime_obj.day, ctime_obj.hour, ctime_obj.minute)
+    return {
+        "is_buy": last_bsp.is_buy,
+        "type": [each_type.value for each_type in last_bsp.type],
+        "time": bsp_time.strftime(BSP_TIME_FORMAT),
+    }
+
+
+class BspRecordWriter:
+    """
+    全市场扫描时每算完一只就用一个 pipeline 写入它各级别的买卖点，不用等整个扫描结束
+    finish 时删除本轮既没有写到、也没有 keep 的旧记录，即已不在扫描列表中的股票
+    """
+
+    def __init__(self, base_key, lv_name_lst):
+        self.base_key = base_key
+        self.lv_name_lst = lv_name_lst
+        self.redis_client = RedisClient().get_client()
+        self.written = {lv_name: set() for lv_name in lv_name_lst}  # 级别 -> 本轮写过的 code
+        self.redis_client.hset(meta_key(base_key), mapping={
+            'begin_time': datetime.now().isoformat(),
+            'level_list': json.dumps(lv_name_lst),
+        })
+
+    def write(self, code, info_lst):
+        """info_lst 与 lv_name_lst 一一对应，元素为 bsp_info 的返回值；None 表示该级别没有买卖点，删除旧记录"""
+        pipe = self.redis_client.pipeline(transaction=False)
+        for lv_name, info in zip(self.lv_name_lst, info_lst):
+            if info is None:
+                pipe.hdel(level_key(self.base_key, lv_name), code)
+                pipe.zrem(time_key(self.base_key, lv_name, True), code)
+                pipe.zrem(time_key(self.base_key, lv_name, False), code)
+                continue
+            score = datetime.strptime(info["time"], BSP_TIME_FORMAT).timestamp()
+            pipe.hset(level_key(self.base_key, lv_name), code, json.dumps(info))
+            pipe.zadd(time_key(self.base_key, lv_name, info["is_buy"]), {code: score})
+            pipe.zrem(time_key(self.base_key, lv_name, not info["is_buy"]), code)  # 上一轮可能是反方向的
+            self.written[lv_name].add(code)
+        pipe.hset(meta_key(self.base_key), 'update_time', datetime.now().isoformat())
+        pipe.execute()
+
+    def keep(self, code_lst):
+        """本轮出错没有算出结果的股票保留上一轮的记录，finish 时不删除"""
+        for lv_name in self.lv_name_lst:
+            self.written[lv_name].update(code_lst)
+
+    def finish(self):
+        for lv_name in self.lv_name_lst:
+            stale_lst = list(set(self.redis_client.hkeys(level_key(self.base_key, lv_name))) - self.written[lv_name])
+            for idx in range(0, len(stale_lst), STALE_DEL_BATCH):
+                batch = stale_lst[idx:idx+STALE_DEL_BATCH]
+                pipe = self.redis_client.pipeline(transaction=False)
+                pipe.hdel(level_key(self.base_key, lv_name), *batch)
+                pipe.zrem(time_key(self.base_key, lv_name, True), *batch)
+                pipe.zrem(time_key(self.base_key, lv_name, False), *batch)
+                pipe.execute()
+        self.redis_client.hset(meta_key(self.base_key), 'update_time', datetime.now().isoformat())
+
+
+def get_bsp_records(base_key, lv_name_lst=None, is_buy=None, days=None):
+    """
+    返回 {"update_time": ..., "level": {级别: {code: 买卖点}}}，没有记录返回 None；没有结果的级别不返回
+    lv_name_lst 为空时取扫描时的全部级别
+    is_buy、days 都不限时整个 hash 返回；否则先 ZRANGEBYSCORE 取最近 days 天内的 code，再 HMGET
+    """
+    redis_client = RedisClient().get_client()
+    meta = redis_client.hgetall(meta_key(base_key))
+    if not meta:
+        return None
+    if not lv_name_lst:
+        lv_name_lst = json.loads(meta.get('level_list', '[]'))
+    result = {
+        "update_time": meta.get('update_time'),
+        "level": {},
+    }
+
+    pipe = redis_client.pipeline(transaction=False)
+    if is_buy is None and days is None:
+        for lv_name in lv_name_lst:
+            pipe.hgetall(level_key(base_key, lv_name))
+        for lv_name, level_data in zip(lv_name_lst, pipe.execute()):
+            if level_data:
+                result["level"][lv_name] = {code: json.loads(info) for code, info in level_data.items()}
+        return result
+
+    min_score = (datetime.now() - timedelta(days=days)).timestamp() if days is not None else '-inf'
+    side_lst = [True, False] if is_buy is None else [is_buy]
+    for lv_name in lv_name_lst:
+        for side in side_lst:
+            pipe.zrangebyscore(time_key(base_key, lv_name, side), min_score, '+inf')
+    code_lst_iter = iter(pipe.execute())
+    lv_code_lst = [(lv_name, [code for _ in side_lst for code in next(code_lst_iter)]) for lv_name in lv_name_lst]
+    lv_code_lst = [(lv_name, code_lst) for lv_name, code_lst in lv_code_lst if code_lst]
+
+    pipe = redis_client.pipeline(transaction=False)
+    for lv_name, code_lst in lv_code_lst:
+        pipe.hmget(level_key(base_key, lv_name), code_lst)
+    for (lv_name, code_lst), info_lst in zip(lv_code_lst, pipe.execute()):
+        level_data = {code: json.loads(info) for code, info in zip(code_lst, info_lst) if info is not None}
+        if level_data:
+            result["level"][lv_name] = level_data
+    return result
@@ -0,0 +1,110 @@
+import threading
+from bisect import bisect_left
+from collections import OrderedDict
+from typing import List, Optional
+
+from Chan import CChan
+from KLine.KLine_Unit import CKLine_Unit
+
+
+class ChanPool:
+    """
+    每个 worker 进程内按 LRU 保留算好的 CChan，容量按各级别K线单元总数计
+    取用时把 CChan 从池中拿出（同一时刻只有一个请求在用、在补数据），用完再放回，放回时按容量淘汰最久未用的
+    """
+
+    def __init__(self, max_klu_cnt):
+        self.max_klu_cnt = max_klu_cnt
+        self._lock = threading.Lock()
+        self._pool = OrderedDict()  # key -> (CChan, K线单元数)
+        self.klu_cnt = 0
+        self.hit_cnt = 0
+        self.miss_cnt = 0
+        self.topup_klu_cnt = 0  # 命中后补算的K线单元数
+
+    def take(self, key) -> Optional[CChan]:
+        with self._lock:
+            item = self._pool.pop(key, None)
+            if item is None:
+                return None
+            self.klu_cnt -= item[1]
+            return item[0]
+
+    def put(self, key, chan: CChan):
+        klu_cnt = chan_klu_cnt(chan)
+        with self._lock:
+            old = self._pool.pop(key, None)  # 并发的另一个请求已放回同一个 key，用新的替换
+            if old is not None:
+                self.klu_cnt -= old[1]
+            self._pool[key] = (chan, klu_cnt)
+            self.klu_cnt += klu_cnt
+            # 刚放入的一个总是保留
+            while self.klu_cnt > self.max_klu_cnt and len(self._pool) > 1:
+                _, (_, evict_cnt) = self._pool.popitem(last=False)
+                self.klu_cnt -= evict_cnt
+
+    def record(self, hit, topup_klu_cnt=0):
+        """取出的 CChan 补算成功才算命中"""
+        with self._lock:
+            if hit:
+                self.hit_cnt += 1
+                self.topup_klu_cnt += topup_klu_cnt
+            else:
+                self.miss_cnt += 1
+
+    def stats(self):
+        with self._lock:
+            request_cnt = self.hit_cnt + self.miss_cnt
+            return {
+                'chan_cnt': len(self._pool),
+                'klu_cnt': self.klu_cnt,
+                'max_klu_cnt': self.max_klu_cnt,
+                'hit_cnt': self.hit_cnt,
+                'miss_cnt': self.miss_cnt,
+                'hit_rate': self.hit_cnt / request_cnt if request_cnt else 0.0,
+                'topup_klu_cnt': self.topup_klu_cnt,
+            }
+
+
+def chan_klu_cnt(chan: CChan) -> int:
+    return sum(len(chan[lv_idx].klu_index) for lv_idx in range(len(chan.lv_list)))
+
+
+def topup_chan(chan: CChan, lv_klu_lst: List[List[CKLine_Unit]]) -> Optional[int]:
+    """
+    用重新取到的各级别全部K线单元，把池中的 CChan 补算到最新，返回补算的K线单元数
+    已计算部分在新数据中对不上时无法增量，返回 None：
+    首尾两根K线找不到或数值变了（盘中未走完的K线等），或中间的根数、收盘价之和变了（前复权会改写历史K线，最后一根却可能不变）
+    """
+    if len(lv_klu_lst) != len(chan.lv_list):
+        return None
+    new_lst = []
+    for lv_idx, klu_lst in enumerate(lv_klu_lst):
+        if len(chan[lv_idx]) == 0:
+            new_lst.append(klu_lst)
+            continue
+        end_idx = match_computed_klu(chan[lv_idx], klu_lst)
+        if end_idx is None:
+            return None
+        new_lst.append(klu_lst[end_idx:])
+    if len(new_lst[0]) == 0:  # 最高级别没有新K线，次级别的新K线也用不上，下次再补
+        return 0
+    chan.drop_unused_klu()
+    chan.trigger_load({lv: klu_lst for lv, klu_lst in zip(chan.lv_list, new_lst) if klu_lst})
+    return sum(len(klu_lst) for klu_lst in new_lst)
+
+
+def same_price(klu: CKLine_Unit, other: CKLine_Unit) -> bool:
+    return klu.time.ts == other.time.ts and (klu.open, klu.high, klu.low, klu.close) == (other.open, other.high, other.low, other.close)
+
+
+def match_computed_klu(kl_list, klu_lst: List[CKLine_Unit]) -> Optional[int]:
+    """已计算的K线单元与新数据中同一时间段的K线逐根对应时，返回新数据中后续未计算部分的起始下标，否则返回 None"""
+    computed_lst = [klu for klc in kl_list for klu in klc.lst]
+    begin_idx = bisect_left(klu_lst, computed_lst[0].time.ts, key=lambda klu: klu.time.ts)
+    end_idx = begin_idx + len(computed_lst)
+    if end_idx > len(klu_lst) or not same_price(klu_lst[begin_idx], computed_lst[0]) or not same_price(klu_lst[end_idx-1], computed_lst[-1]):
+        return None
+    if sum(klu.close for klu in klu_lst[begin_idx:end_idx]) != sum(klu.close for klu in computed_lst):
+        return None
+    return end_idx
@@ -1,87 +1,238 @@
+import json
 import os
 import tempfile
 import traceback
+from typing import Tuple
 
 import matplotlib
 matplotlib.use('Agg')
+import matplotlib.pyplot as plt
 
+from app.service.chan_pool import ChanPool, topup_chan
+from app.service.render_cache import RenderCache
+from app.service.single_flight import SingleFlight
 from Chan import CChan
 from ChanConfig import CChanConfig
 from Common.CEnum import AUTYPE, DATA_SRC, KL_TYPE
-from Plot.PlotDriver import CPlotDriver
+from Plot.PlotDriver import CPlotDriver, cal_x_limit
+from Plot.PlotMeta import CChanPlotMeta
+
+# CChanConfig 会改写传入的字典，每次用副本构造；缓存 key 也用它们计算，改配置后旧图自然失效
+CHAN_CONFIG = {
+    "bi_algo": "advanced",
+    "bi_strict": False,
+    "trigger_step": False,
+    "skip_step": 0,
+    "divergence_rate": 0.8,
+    "bsp2_follow_1": False,
+    "bsp3_follow_1": False,
+    "min_zs_cnt": 0,
+    "bs1_peak": False,
+    "macd_algo": "area",
+    "bs_type": '1,2,3a,1p,2s,3b',
+    "print_warning": True,
+    "zs_algo": "normal",
+    "zs_combine": False,
+}
+PLOT_CONFIG = {
+    "plot_kline": True,
+    "plot_kline_combine": False,
+    "plot_bi": True,
+    "plot_seg": True,
+    "plot_eigen": False,
+    "plot_zs": True,
+    "plot_macd": True,
+    "plot_mean": False,
+    "plot_channel": False,
+    "plot_bsp": True,
+    "plot_extrainfo": False,
+    "plot_demark": False,
+    "plot_marker": False,
+    "plot_rsi": False,
+    "plot_kdj": False,
+}
+PLOT_PARA = {
+    "seg": {
+        # "plot_trendline": True,
+    },
+    "bi": {
+        "show_num": True,
+        "disp_end": True,
+    },
+    "figure": {
+        "x_range": 400,
+    },
+    "marker": {
+        # "markers": {  # text, position, color
+        #     '2023/06/01': ('marker here', 'up', 'red'),
+        #     '2023/06/08': ('marker here', 'down')
+        # },
+    }
+}
+
+RENDER_CACHE_DIR = os.environ.get('CHAN_RENDER_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'chan_render_cache'))
+RENDER_CACHE_MAX_BYTES = int(os.environ.get('CHAN_RENDER_CACHE_MAX_MB', 512)) * 1024 * 1024
+CHART_DATA_CACHE_MAX_BYTES = int(os.environ.get('CHAN_CHART_DATA_CACHE_MAX_MB', 64)) * 1024 * 1024
+
+render_cache = RenderCache(RENDER_CACHE_DIR, RENDER_CACHE_MAX_BYTES)
+chart_data_cache = RenderCache(RENDER_CACHE_DIR, CHART_DATA_CACHE_MAX_BYTES, suffix='.json')
+render_flight = SingleFlight(os.path.join(RENDER_CACHE_DIR, 'flight'))
+# 每个 worker 保留的 CChan 的K线单元总数上限
+chan_pool = ChanPool(int(os.environ.get('CHAN_POOL_MAX_KLU', 200000)))
 
 
 def generate_stock_image(stock_code, begin_time, end_time, lv_list):
-    config = CChanConfig({
-        "bi_algo": "advanced",
-        "bi_strict": False,
-        "trigger_step": False,
-        "skip_step": 0,
-        "divergence_rate": 0.8,
-        "bsp2_follow_1": False,
-        "bsp3_follow_1": False,
-        "min_zs_cnt": 0,
-        "bs1_peak": False,
-        "macd_algo": "area",
-        "bs_type": '1,2,3a,1p,2s,3b',
-        "print_warning": True,
-        "zs_algo": "normal",
-        "zs_combine": False,
-    })
-    plot_config = {
-        "plot_kline": True,
-        "plot_kline_combine": False,
-        "plot_bi": True,
-        "plot_seg": True,
-        "plot_eigen": False,
-        "plot_zs": True,
-        "plot_macd": True,
-        "plot_mean": False,
-        "plot_channel": False,
-        "plot_bsp": True,
-        "plot_extrainfo": False,
-        "plot_demark": False,
-        "plot_marker": False,
-        "plot_rsi": False,
-        "plot_kdj": False,
-    }
-    plot_para = {
-        "seg": {
-            # "plot_trendline": True,
-        },
-        "bi": {
-            "show_num": True,
-            "disp_end": True,
-        },
-        "figure": {
-            "x_range": 400,
-        },
-        "marker": {
-            # "markers": {  # text, position, color
-            #     '2023/06/01': ('marker here', 'up', 'red'),
-            #     '2023/06/08': ('marker here', 'down')
-            # },
-        }
-    }
+    """
+    返回 (图片路径, ETag)，出错时返回 None
+    同时到达的相同请求（包括其他 worker 上的）只取一次数据、算一次，其余的等结果
+    """
     try:
-        chan = CChan(
-            code=stock_code,
-            begin_time=begin_time,
-            end_time=end_time,
-            data_src=DATA_SRC.SINA,
-            lv_list=[KL_TYPE[kl_type] for kl_type in lv_list],
-            config=config,
-            autype=AUTYPE.QFQ,
-        )
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.png') as tmpfile:
-            plot_driver = CPlotDriver(
-                chan,
-                plot_config=plot_config,
-                plot_para=plot_para,
-            )
-            print(f"save tmpfile: {tmpfile.name}")
-            plot_driver.save2img(tmpfile.name)
-            tmpfile.close() 
-            return tmpfile.name
+        flight_key = RenderCache.make_key(stock_code, begin_time, end_time, lv_list)
+        key = render_flight.do(flight_key, lambda: render_stock_image(stock_code, begin_time, end_time, lv_list))
+        image_path = render_cache.get(key)
+        if image_path is None:  # 刚算好就被淘汰了，极少发生，自己再算一次
+            key = render_stock_image(stock_code, begin_time, end_time, lv_list)
+            image_path = render_cache.path_of(key)
+        return image_path, key
     except Exception as e:
-        print(f"generate_stock_image exception: {traceback.format_exc()}")
\ No newline at end of file
+        print(f"generate_stock_image exception: {traceback.format_exc()}")
+
+
+def render_stock_image(stock_code, begin_time, end_time, lv_list):
+    """
+    返回缓存 key
+    先取数据，缓存 key 包含各级别最后一根K线的时间，数据没有更新时直接用缓存的图，不再计算和渲染
+    """
+    chan = new_chan(stock_code, begin_time, end_time, lv_list)
+    lv_klu_lst = chan.load_lv_klu_lst()
+    key = RenderCache.make_key(
+        stock_code,
+        [lv.name for lv in chan.lv_list],  # 取数据时可能跳过了取不到的子级别
+        begin_time,
+        end_time,
+        CHAN_CONFIG,
+        PLOT_CONFIG,
+        PLOT_PARA,
+        [klu_lst[-1].time.ts if klu_lst else None for klu_lst in lv_klu_lst],
+    )
+    if render_cache.get(key) is None:
+        chan, pool_key = get_computed_chan(chan, lv_klu_lst, stock_code, begin_time)
+        try:
+            image_path = render_cache.put(key, lambda path: save_chan_image(chan, path))
+        finally:
+            chan_pool.put(pool_key, chan)
+        print(f"render image: {image_path}")
+    return key
+
+
+def generate_chart_data(stock_code, begin_time, end_time, lv_list, x_range):
+    """
+    返回 (json 文件路径, ETag)，出错时返回 None
+    与出图一样合并同时到达的相同请求，结果按数据版本缓存在磁盘上
+    """
+    try:
+        flight_key = RenderCache.make_key('chart_data', stock_code, begin_time, end_time, lv_list, x_range)
+        key = render_flight.do(flight_key, lambda: export_chart_data(stock_code, begin_time, end_time, lv_list, x_range))
+        json_path = chart_data_cache.get(key)
+        if json_path is None:
+            key = export_chart_data(stock_code, begin_time, end_time, lv_list, x_range)
+            json_path = chart_data_cache.path_of(key)
+        return json_path, key
+    except Exception:
+        print(f"generate_chart_data exception: {traceback.format_exc()}")
+
+
+def export_chart_data(stock_code, begin_time, end_time, lv_list, x_range):
+    """
+    返回缓存 key
+    各级别可见窗口的K线、合并K线、笔、线段、中枢、买卖点和指标导出为列式 json，供前端图表库绘制
+    窗口与出图一致：最高级别显示最后 x_range 根，次级别从最高级别窗口起点对应的子K线开始
+    """
+    chan = new_chan(stock_code, begin_time, end_time, lv_list)
+    lv_klu_lst = chan.load_lv_klu_lst()
+    key = RenderCache.make_key(
+        'chart_data',
+        stock_code,
+        [lv.name for lv in chan.lv_list],
+        begin_time,
+        end_time,
+        CHAN_CONFIG,
+        x_range,
+        [klu_lst[-1].time.ts if klu_lst else None for klu_lst in lv_klu_lst],
+    )
+    if chart_data_cache.get(key) is not None:
+        return key
+    chan, pool_key = get_computed_chan(chan, lv_klu_lst, stock_code, begin_time)
+    data = {
+        'code': stock_code,
+        'lv_list': [lv.name for lv in chan.lv_list],
+        'x_range': x_range,
+    }
+    try:
+        srange_begin = 0
+        for lv_idx, lv in enumerate(chan.lv_list):
+            meta = CChanPlotMeta(chan[lv_idx])
+            x_begin = srange_begin if srange_begin != 0 else cal_x_limit(meta, x_range)[0]
+            meta.set_x_begin(x_begin)
+            data[lv.name] = meta.to_columnar()
+            if x_range != 0 and lv_idx != len(chan.lv_list) - 1:
+                srange_begin = meta.sub_range_start_idx(x_range)
+    finally:
+        chan_pool.put(pool_key, chan)
+    json_path = chart_data_cache.put(key, lambda path: save_json(data, path))
+    print(f"export chart data: {json_path}")
+    return key
+
+
+def new_chan(stock_code, begin_time, end_time, lv_list) -> CChan:
+    """只构造不取数据，由调用方 load_lv_klu_lst 后决定是否计算"""
+    return CChan(
+        code=stock_code,
+        begin_time=begin_time,
+        end_time=end_time,
+        data_src=DATA_SRC.SINA,
+        lv_list=[KL_TYPE[kl_type] for kl_type in lv_list],
+        config=CChanConfig(dict(CHAN_CONFIG)),
+        autype=AUTYPE.QFQ,
+        autoload=False,
+    )
+
+
+def get_computed_chan(chan: CChan, lv_klu_lst, stock_code, begin_time) -> Tuple[CChan, str]:
+    """
+    池中有同一股票、级别、起始时间、配置的 CChan 时，只补算新增的K线；否则用 chan 从头计算
+    返回 (算完的 CChan, 池 key)；调用方绘图、导出完后再 chan_pool.put 放回，避免并发的相同请求取走正在使用的 CChan
+    """
+    pool_key = RenderCache.make_key(stock_code, [lv.name for lv in chan.lv_list], begin_time, CHAN_CONFIG)
+    pooled_chan = chan_pool.take(pool_key)
+    topup_klu_cnt = None
+    if pooled_chan is not None:
+        try:
+            topup_klu_cnt = topup_chan(pooled_chan, lv_klu_lst)
+        except Exception:  # 补算到一半出错，池中的对象已不可用，从头计算
+            print(f"topup chan exception: {traceback.format_exc()}")
+    if topup_klu_cnt is None:
+        chan_pool.record(hit=False)
+        for _ in chan.load_lv_klu_iter(lv_klu_lst):
+            ...
+    else:
+        chan_pool.record(hit=True, topup_klu_cnt=topup_klu_cnt)
+        chan = pooled_chan
+    return chan, pool_key
+
+
+def save_chan_image(chan: CChan, path):
+    plot_driver = CPlotDriver(
+        chan,
+        plot_config=PLOT_CONFIG,
+        plot_para=PLOT_PARA,
+    )
+    try:
+        plot_driver.save2img(path)
+    finally:
+        plt.close(plot_driver.figure)
+
+
+def save_json(data, path):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
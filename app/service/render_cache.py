@@ -0,0 +1,75 @@
+import hashlib
+import json
+import os
+import tempfile
+
+
+class RenderCache:
+    """
+    渲染结果的磁盘缓存，多个 gunicorn worker 共用同一目录
+    文件名即缓存 key（同时作为 ETag），写入时先写临时文件再改名，读取时更新修改时间，超过容量时按修改时间淘汰最旧的
+    """
+
+    TMP_PREFIX = '.tmp-'
+
+    def __init__(self, cache_dir, max_bytes, suffix='.png'):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(*parts):
+        """参数需可 json 序列化，顺序有意义"""
+        return hashlib.sha1(json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str).encode('utf-8')).hexdigest()
+
+    def path_of(self, key):
+        return os.path.join(self.cache_dir, key + self.suffix)
+
+    def get(self, key):
+        """命中时返回文件路径并刷新其修改时间（LRU），未命中返回 None"""
+        path = self.path_of(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def put(self, key, write_func):
+        """write_func(path) 把结果写到给定路径（以 suffix 结尾），写完后原子地放入缓存并按容量淘汰"""
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, prefix=self.TMP_PREFIX, suffix=self.suffix)
+        os.close(fd)
+        try:
+            write_func(tmp_path)
+            os.replace(tmp_path, self.path_of(key))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self.evict()
+        return self.path_of(key)
+
+    def evict(self):
+        entry_lst = []
+        total_bytes = 0
+        for entry in os.scandir(self.cache_dir):
+            if not entry.name.endswith(self.suffix) or entry.name.startswith(self.TMP_PREFIX):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:  # 被其他 worker 淘汰了
+                continue
+            entry_lst.append((stat.st_mtime, stat.st_size, entry.path))
+            total_bytes += stat.st_size
+        if total_bytes <= self.max_bytes:
+            return
+        # 最近用过的一个总是保留，即使它本身已经超过容量
+        entry_lst.sort()
+        for _, size, path in entry_lst[:-1]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total_bytes -= size
+            if total_bytes <= self.max_bytes:
+                break
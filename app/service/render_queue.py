@@ -0,0 +1,96 @@
+import json
+import os
+import time
+import traceback
+import uuid
+from multiprocessing import Process
+
+from Common import constants
+from Common.redis_util import RedisClient
+
+RENDER_QUEUE_MAX_LEN = int(os.environ.get('CHAN_RENDER_QUEUE_MAX_LEN', 100))  # 排队中的任务数上限，超过时拒绝
+RENDER_JOB_TTL = 3600  # 任务状态保留时间（秒）
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+
+
+class RenderQueueFull(Exception):
+    pass
+
+
+def job_key(job_id):
+    return constants.REDIS_KEY_RENDER_JOB_PREFIX + job_id
+
+
+def submit_render_job(params):
+    """
+    把绘图请求放入 Redis 队列，返回任务 id；队列已满时抛 RenderQueueFull
+    任务状态存在 hash render_job:<id> 中，由独立的绘图进程（render_worker.py）更新
+    """
+    redis_client = RedisClient().get_client()
+    if redis_client.llen(constants.REDIS_KEY_RENDER_QUEUE) >= RENDER_QUEUE_MAX_LEN:
+        raise RenderQueueFull()
+    job_id = uuid.uuid4().hex
+    pipe = redis_client.pipeline()
+    pipe.hset(job_key(job_id), mapping={
+        'status': JOB_QUEUED,
+        'params': json.dumps(params),
+        'create_time': time.time(),
+    })
+    pipe.expire(job_key(job_id), RENDER_JOB_TTL)
+    pipe.lpush(constants.REDIS_KEY_RENDER_QUEUE, job_id)
+    pipe.execute()
+    return job_id
+
+
+def get_render_job(job_id):
+    """返回任务状态 dict（status, image_path, etag, error 等），任务不存在或已过期返回 None"""
+    job = RedisClient().get_client().hgetall(job_key(job_id))
+    return job if job else None
+
+
+def run_render_worker(block_timeout=5):
+    """绘图进程的主循环：从队列取任务、绘图、写回结果；同一时刻每个进程只处理一个任务"""
+    from app.service.picture_service import generate_stock_image  # 只有绘图进程需要加载 matplotlib
+
+    redis_client = RedisClient().get_client()
+    while True:
+        item = redis_client.brpop(constants.REDIS_KEY_RENDER_QUEUE, timeout=block_timeout)
+        if item is None:
+            continue
+        job_id = item[1]
+        params_str = redis_client.hget(job_key(job_id), 'params')
+        if params_str is None:  # 排队太久，任务状态已过期
+            continue
+        redis_client.hset(job_key(job_id), 'status', JOB_RUNNING)
+        try:
+            params = json.loads(params_str)
+            result = generate_stock_image(
+                stock_code=params['stock_code'],
+                begin_time=params['begin_time'],
+                end_time=params['end_time'],
+                lv_list=params['lv_list']
+            )
+            if result is None:
+                update = {'status': JOB_FAILED, 'error': 'generate image failed'}
+            else:
+                image_path, etag = result
+                update = {'status': JOB_DONE, 'image_path': image_path, 'etag': etag}
+        except Exception as e:
+            print(f"render job {job_id} exception: {traceback.format_exc()}")
+            update = {'status': JOB_FAILED, 'error': str(e)}
+        pipe = redis_client.pipeline()
+        pipe.hset(job_key(job_id), mapping=update)
+        pipe.expire(job_key(job_id), RENDER_JOB_TTL)
+        pipe.execute()
+
+
+def start_render_workers(worker_cnt):
+    """启动 worker_cnt 个绘图进程，并发数即进程数"""
+    process_lst = [Process(target=run_render_worker, daemon=True) for _ in range(worker_cnt)]
+    for process in process_lst:
+        process.start()
+    return process_lst
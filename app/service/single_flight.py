@@ -0,0 +1,98 @@
+import fcntl
+import json
+import os
+import threading
+import time
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.err = None
+
+
+class SingleFlight:
+    """
+    合并同时到达的相同请求：进程内同一 key 只有一个线程在算，其他线程等它的结果
+    跨进程（gunicorn 多个 worker）用 lock_dir 下每个 key 一个锁文件做租约：拿到锁的 worker 计算并把结果写进锁文件，
+    等锁的 worker 拿到锁后，若锁文件里的结果是在自己开始等待之后算出的，直接用它，不再重复计算
+    释放锁前删除锁文件：等待的 worker 打开的是同一个文件，仍能读到结果，之后到达的请求新建锁文件，目录里不会堆积
+    结果需可 json 序列化；计算出错时不保存结果，等待的 worker 会自己再算一次
+    """
+
+    def __init__(self, lock_dir, wait_timeout=20.0, poll_interval=0.05):
+        self.lock_dir = lock_dir
+        self.wait_timeout = wait_timeout  # 等其他 worker 超过这个时间就自己算，避免超出 gunicorn 的超时
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._calls = {}
+        os.makedirs(lock_dir, exist_ok=True)
+
+    def do(self, key, func):
+        with self._lock:
+            call = self._calls.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = _Call()
+                self._calls[key] = call
+        if not is_leader:
+            call.event.wait()
+            if call.err is not None:
+                raise call.err
+            return call.result
+
+        try:
+            call.result = self._do_cross_process(key, func)
+        except BaseException as e:
+            call.err = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        return call.result
+
+    def _do_cross_process(self, key, func):
+        start_time = time.time()
+        path = os.path.join(self.lock_dir, key + '.lock')
+        with open(path, 'a+') as f:
+            if not self._acquire(f):
+                return func()
+            try:
+                f.seek(0)
+                try:
+                    flight = json.loads(f.read())
+                except ValueError:  # 新建的锁文件或上次写入不完整
+                    flight = None
+                if flight is not None and flight['finish_time'] >= start_time:
+                    return flight['result']
+                result = func()
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps({'finish_time': time.time(), 'result': result}))
+                f.flush()
+                return result
+            finally:
+                self._remove(f, path)
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _remove(f, path):
+        # 路径可能已被先拿到锁的 worker 删除、又被新到的请求重建，只删自己打开的那个文件
+        try:
+            if os.path.samestat(os.fstat(f.fileno()), os.stat(path)):
+                os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def _acquire(self, f):
+        deadline = time.time() + self.wait_timeout
+        while True:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return True
+            except BlockingIOError:
+                if time.time() >= deadline:
+                    return False
+                time.sleep(self.poll_interval)
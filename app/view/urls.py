@@ -4,6 +4,10 @@ import app.view.views as view
 urlpatterns = [
     ('/alarm/hello', view.hello, {'methods': ['GET']}),
     ('/api/generate-image', view.generate_image, {'methods': ['POST']}),
+    ('/api/chart-data', view.get_chart_data, {'methods': ['GET']}),
+    ('/api/render', view.submit_render, {'methods': ['POST']}),
+    ('/api/render/<job_id>', view.render_result, {'methods': ['GET']}),
     ('/api/get-recent-bsp', view.get_recent_bsp, {'methods': ['GET']}),
     ('/api/get-all-code-to-name-dict', view.get_all_code_to_name_dict, {'methods': ['GET']}),
+    ('/api/chan-pool-stats', view.get_chan_pool_stats, {'methods': ['GET']}),
 ]
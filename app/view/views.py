@@ -1,9 +1,11 @@
 import json
-from datetime import datetime, timedelta
+import os
 
 from flask import request, send_file
 from app.common.decorator import http_post,http_get
-from app.service.picture_service import generate_stock_image
+from app.service.bsp_records import get_bsp_records
+from app.service.picture_service import chan_pool, generate_chart_data, generate_stock_image
+from app.service.render_queue import JOB_DONE, JOB_FAILED, RenderQueueFull, get_render_job, submit_render_job
 from Common.redis_util import RedisClient
 from Common import constants
 
@@ -23,19 +25,98 @@ def generate_image():
     if not all(param in params for param in required_params):
         return {'error': 'Missing required parameters'}, 400
 
+    result = generate_stock_image(
+        stock_code=params['stock_code'],
+        begin_time=params['begin_time'],
+        end_time=params['end_time'],
+        lv_list=params['lv_list']
+    )
+    if result is None:
+        return {'error': 'generate image failed'}, 500
+    image_path, etag = result
+    return send_cached(image_path, etag)
+
+
+def send_cached(image_path, etag, mimetype='image/png'):
+    response = send_file(image_path, mimetype=mimetype)
+    # 缓存 key 即 ETag，客户端带 If-None-Match 且数据未更新时返回 304
+    response.set_etag(etag)
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
+def get_chart_data():
+    """
+    各级别可见窗口的绘图数据（列式 json），由前端图表库绘制
+    参数：stock_code, begin_time, end_time, lv_list（逗号分隔，如 K_DAY,K_30M），x_range（可选，默认 400，0 为全部）
+    """
+    params = request.args
+    required_params = ['stock_code', 'begin_time', 'end_time', 'lv_list']
+
+    if not all(params.get(param) for param in required_params):
+        return {'error': 'Missing required parameters'}, 400
+    try:
+        x_range = int(params.get('x_range', 400))
+    except ValueError:
+        return {'error': 'Invalid x_range'}, 400
+
+    result = generate_chart_data(
+        stock_code=params['stock_code'],
+        begin_time=params['begin_time'],
+        end_time=params['end_time'],
+        lv_list=params['lv_list'].split(','),
+        x_range=x_range,
+    )
+    if result is None:
+        return {'error': 'generate chart data failed'}, 500
+    json_path, etag = result
+    return send_cached(json_path, etag, mimetype='application/json')
+
+
+def submit_render():
+    """异步绘图：入队后立即返回任务 id，用 render_result 轮询"""
+    params = request.get_json()
+    required_params = ['stock_code', 'begin_time', 'end_time', 'lv_list']
+
+    if not params or not all(param in params for param in required_params):
+        return {'error': 'Missing required parameters'}, 400
+
     try:
-        image_path = generate_stock_image(
-            stock_code=params['stock_code'],
-            begin_time=params['begin_time'],
-            end_time=params['end_time'],
-            lv_list=params['lv_list']
-        )
-        return send_file(image_path, mimetype='image/png')
-    except Exception as e:
-        return {'error': str(e)}, 500
+        job_id = submit_render_job({param: params[param] for param in required_params})
+    except RenderQueueFull:
+        return {'error': 'Render queue is full'}, 503
+    return {'job_id': job_id}, 202
+
+
+def render_result(job_id):
+    """完成时返回图片，未完成时返回 202 和当前状态"""
+    job = get_render_job(job_id)
+    if job is None:
+        return {'error': 'Job not found'}, 404
+    if job['status'] == JOB_DONE:
+        try:
+            return send_cached(job['image_path'], job['etag'])
+        except FileNotFoundError:  # 图片已被缓存淘汰
+            return {'error': 'Image expired'}, 410
+    if job['status'] == JOB_FAILED:
+        return {'error': job.get('error', '')}, 500
+    return {'status': job['status']}, 202
+
+
+@http_get
+def get_chan_pool_stats():
+    """当前 worker 进程的 CChan 池命中率和占用"""
+    return dict(chan_pool.stats(), pid=os.getpid())
+
+
+RECENT_BSP_DAYS = 7
 
 
 def get_recent_bsp():
+    """
+    全市场扫描的买卖点：stock 只返回最近 RECENT_BSP_DAYS 天内的买点，etf 返回全部
+    可选参数 lv_list（逗号分隔，如 K_DAY,K_30M）只取部分级别
+    """
     source = request.args.get('source')
     if not source:
         return json.dumps({'error': 'Missing source parameter'}), 400
@@ -46,11 +127,13 @@ def get_recent_bsp():
         redis_key = constants.REDIS_KEY_ETF_BSP_RECORDS
     else:
         return json.dumps({'error': 'Invalid source value'}), 400
-    redis_client = RedisClient().get_client()
-    data = redis_client.get(redis_key)
+    lv_list = request.args.get('lv_list')
+    lv_list = lv_list.split(',') if lv_list else None
     if source == 'stock':
-        data = json.dumps(filter_dict(json.loads(data)))
-    return data if data else json.dumps({}), 200
+        data = get_bsp_records(redis_key, lv_list, is_buy=True, days=RECENT_BSP_DAYS)
+    else:
+        data = get_bsp_records(redis_key, lv_list)
+    return json.dumps(data if data else {}), 200
 
 
 def get_all_code_to_name_dict():
@@ -69,34 +152,3 @@ def get_all_code_to_name_dict():
     redis_client = RedisClient().get_client()
     data = redis_client.get(redis_key)
     return data if data else json.dumps({}), 200
-
-
-def filter_dict(data):
-    # 获取当前时间（基于香港时间 2025-05-17 10:00:00）
-    current_time = datetime(2025, 5, 17, 10, 0, 0)
-    # 计算7天前的截止时间
-    cutoff_time = current_time - timedelta(days=7)
-
-    # 创建过滤后的结果字典
-    filtered_data = {
-        "update_time": data["update_time"],
-        "level": {}
-    }
-
-    # 遍历 level 中的所有子键（K_DAY, K_60M, K_30M 等）
-    for level_key, level_data in data["level"].items():
-        filtered_level_data = {}
-        # 遍历每个 level_key 下的符号数据
-        for symbol, info in level_data.items():
-            # 检查 is_buy 是否为 True
-            if info.get("is_buy", False):
-                # 将 time 字符串转换为 datetime 对象
-                item_time = datetime.strptime(info["time"], "%Y-%m-%d %H:%M:%S")
-                # 检查 time 是否在7天以内
-                if item_time >= cutoff_time:
-                    filtered_level_data[symbol] = info
-        # 只有当 filtered_level_data 不为空时才添加到结果
-        if filtered_level_data:
-            filtered_data["level"][level_key] = filtered_level_data
-
-    return filtered_data
\ No newline at end of file
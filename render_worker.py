@@ -0,0 +1,15 @@
+import os
+
+from app.service.render_queue import start_render_workers
+
+# 绘图进程与 gunicorn 的 web worker 分开部署，web worker 只负责入队和查询，不会被耗时的绘图请求占满
+RENDER_WORKERS = int(os.environ.get('CHAN_RENDER_WORKERS', 2))
+
+if __name__ == '__main__':
+    process_lst = start_render_workers(RENDER_WORKERS)
+    print(f"绘图进程已启动({RENDER_WORKERS}个)，按 Ctrl+C 退出")
+    try:
+        for process in process_lst:
+            process.join()
+    except (KeyboardInterrupt, SystemExit):
+        pass